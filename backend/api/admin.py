@@ -2,8 +2,11 @@
 
 from django.contrib import admin
 
-from .models import Concert, EmailVerificationToken, FavoriteConcert
+from .models import (Concert, EmailVerificationToken, FavoriteConcert,
+                     SyncCheckpoint, TicketmasterEvent)
 
 admin.site.register(Concert)
 admin.site.register(FavoriteConcert)
 admin.site.register(EmailVerificationToken)
+admin.site.register(TicketmasterEvent)
+admin.site.register(SyncCheckpoint)
@@ -13,8 +13,8 @@ logger = logging.getLogger(__name__)
 
 class CookieTokenAuthentication(TokenAuthentication):
     """Authentication class that handles token authentication via cookies.
-    We want to modify the request right before Django's Token Authentication is called
-    so created this class to fill in the required fields before its authentication happens :D
+    The knox token is read from the `knox_token` cookie instead of the Authorization
+    header and checked with knox's own credential lookup :D
     """
 
     def authenticate(self, request):
@@ -22,10 +22,10 @@ class CookieTokenAuthentication(TokenAuthentication):
         if not knox_token:
             return None
 
-        request.META["HTTP_AUTHORIZATION"] = f"Token {knox_token}"
-
-        # Get user and token from parent class
-        auth_result = super().authenticate(request)
+        # Check the cookie token directly: newer DRF versions read the
+        # Authorization header from request.headers, which is cached before
+        # authentication runs and would not see a header injected into META
+        auth_result = self.authenticate_credentials(knox_token.encode())
         if not auth_result:
             return None
 
@@ -0,0 +1,116 @@
+"""
+Version-based ETags for per-user endpoints backed by the database.
+
+The ETag of a response is derived from the request path and a small tuple of
+counters read from the user's profile (see api.signals), so a conditional
+request can be answered with 304 before the view does any of its work.
+Responses without one of these ETags still get a content-hash ETag from
+django.middleware.http.ConditionalGetMiddleware. Streaming responses get
+neither.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+from .matching import request_precomputed_at
+from .models import UserProfile
+
+
+def profile_versions(user, *fields):
+    """Read the given version counters from the user's profile"""
+    versions = UserProfile.objects.filter(user_id=user.id).values_list(*fields).first()
+    return versions or (0,) * len(fields)
+
+
+def favorites_version(request):
+    """Favorite concert ids only change with the user's favorites"""
+    return profile_versions(request.user, "favorites_version")
+
+
+def favorite_events_version(request):
+    """Hydrated favorites also change as cached event payloads expire"""
+    bucket = int(time.time() // settings.TICKETMASTER_EVENT_CACHE_TTL)
+    return favorites_version(request) + (bucket,)
+
+
+def matchings_version(request):
+    """Version of the candidates offered to the user, which also change when
+    their precomputed candidates go stale and are computed live instead"""
+    computed_at = request_precomputed_at(request)
+    return profile_versions(request.user, "matchings_version") + (
+        computed_at.isoformat() if computed_at else "live",
+    )
+
+
+def matches_version(request):
+    """Version of the user's mutual matches"""
+    return profile_versions(request.user, "matches_version")
+
+
+def make_etag(request, version):
+    """Weak ETag for this user, path and query string at the given version"""
+    key = f"{request.user.id}:{request.get_full_path()}:{version}"
+    return "W/" + quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+
+
+def etag_matches(etag, header):
+    """Weak comparison of etag against an If-None-Match header"""
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    return "*" in candidates or etag.removeprefix("W/") in (
+        candidate.removeprefix("W/") for candidate in candidates
+    )
+
+
+def with_etag(response, etag):
+    """Attach etag to a 200 or 304 response, leaving errors and streams,
+    which can still end early or with an error line, untouched"""
+    if response.status_code not in (200, 304) or response.streaming:
+        return response
+    response["ETag"] = etag
+    # let browsers keep the body but revalidate it on every use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def versioned_etag(version_func):
+    """Decorate a function view, sync or async, so that If-None-Match
+    requests whose ETag is still current are answered with 304 without
+    running the view.
+
+    Apply below @permission_classes, or @async_authenticated for an async
+    view, so the request is authenticated first.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                version = await sync_to_async(version_func)(request)
+                etag = make_etag(request, version)
+                if etag_matches(etag, request.headers.get("If-None-Match")):
+                    return with_etag(HttpResponseNotModified(), etag)
+                return with_etag(await view(request, *args, **kwargs), etag)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = make_etag(request, version_func(request))
+            if etag_matches(etag, request.headers.get("If-None-Match")):
+                return with_etag(Response(status=304), etag)
+            return with_etag(view(request, *args, **kwargs), etag)
+
+        return wrapper
+
+    return decorator
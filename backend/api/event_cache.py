@@ -0,0 +1,122 @@
+"""DB-backed cache of Ticketmaster event payloads keyed by event id, with a
+negative cache of ids Ticketmaster recently returned nothing for"""
+
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import metrics
+from .models import TicketmasterEvent
+from .search import refresh_search_vectors
+from .ticketmaster import afetch_events, fetch_events, iter_event_batches
+
+
+def fresh_events(event_ids):
+    """(event_id, payload) rows for every id with a fresh cache entry"""
+    fresh_after = timezone.now() - timedelta(
+        seconds=settings.TICKETMASTER_EVENT_CACHE_TTL
+    )
+    return TicketmasterEvent.objects.filter(
+        event_id__in=event_ids, fetched_at__gte=fresh_after
+    ).values_list("event_id", "data")
+
+
+def get_cached_events(event_ids):
+    """return {event_id: payload} for every id with a fresh cache entry"""
+    if not event_ids:
+        return {}
+    cached = dict(fresh_events(event_ids))
+    metrics.observe_cache("events", len(cached), len(event_ids) - len(cached))
+    return cached
+
+
+def missing_key(event_id):
+    """negative cache key of an event id"""
+    return f"event-missing:{event_id}"
+
+
+def uncached(event_ids, cached):
+    """ids that must be fetched upstream, skipping fresh cache entries and
+    ids that were recently reported missing"""
+    candidates = [event_id for event_id in event_ids if event_id not in cached]
+    if not candidates:
+        return []
+    known_missing = cache.get_many([missing_key(event_id) for event_id in candidates])
+    metrics.observe_cache(
+        "missing_events", len(known_missing), len(candidates) - len(known_missing)
+    )
+    return [
+        event_id
+        for event_id in candidates
+        if missing_key(event_id) not in known_missing
+    ]
+
+
+def remember_missing(requested, fetched):
+    """negatively cache the requested ids Ticketmaster returned nothing for"""
+    missing = [event_id for event_id in requested if event_id not in fetched]
+    if missing:
+        cache.set_many(
+            {missing_key(event_id): True for event_id in missing},
+            settings.TICKETMASTER_MISSING_EVENT_TTL,
+        )
+
+
+def store_events(events_by_id):
+    """upsert {event_id: payload} into the cache in a single query"""
+    if not events_by_id:
+        return
+    now = timezone.now()
+    TicketmasterEvent.objects.bulk_create(
+        [
+            TicketmasterEvent.from_payload(event_id, data, now)
+            for event_id, data in events_by_id.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["event_id"],
+        update_fields=TicketmasterEvent.PAYLOAD_FIELDS,
+    )
+    refresh_search_vectors(list(events_by_id))
+
+
+def get_events(event_ids):
+    """return the events for event_ids in order, reading fresh entries from
+    the cache and fetching the rest upstream in batches"""
+    cached = get_cached_events(event_ids)
+    requested = uncached(event_ids, cached)
+    fetched = fetch_events(requested)
+    remember_missing(requested, fetched)
+    store_events(fetched)
+    cached.update(fetched)
+    return [cached[event_id] for event_id in event_ids if event_id in cached]
+
+
+def iter_events(event_ids):
+    """yield the events for event_ids as soon as each one is available:
+    fresh cache entries first, then each upstream batch as it arrives"""
+    cached = get_cached_events(event_ids)
+    yield from (cached[event_id] for event_id in event_ids if event_id in cached)
+    requested = uncached(event_ids, cached)
+    found = set()
+    for fetched in iter_event_batches(requested):
+        store_events(fetched)
+        found.update(fetched)
+        yield from fetched.values()
+    remember_missing(requested, found)
+
+
+async def aget_events(event_ids):
+    """async get_events(), with all missing batches fetched at once"""
+    cached = {}
+    if event_ids:
+        cached = {event_id: data async for event_id, data in fresh_events(event_ids)}
+        metrics.observe_cache("events", len(cached), len(event_ids) - len(cached))
+    requested = await sync_to_async(uncached)(event_ids, cached)
+    fetched = await afetch_events(requested)
+    await sync_to_async(remember_missing)(requested, fetched)
+    await sync_to_async(store_events)(fetched)
+    cached.update(fetched)
+    return [cached[event_id] for event_id in event_ids if event_id in cached]
@@ -0,0 +1,91 @@
+"""
+Radius queries over the coordinates of mirrored events.
+
+Candidates are pre-filtered with a bounding box on the indexed
+(latitude, longitude) columns and then refined with the haversine distance.
+"""
+
+import math
+
+from django.conf import settings
+
+from .search import recent_syncs
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = 200
+
+
+class InvalidPoint(ValueError):
+    """Raised for malformed latlong or radius parameters"""
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle"""
+    angular_radius = radius_km / EARTH_RADIUS_KM
+    d_lat = math.degrees(angular_radius)
+    cos_lat = math.cos(math.radians(lat))
+    if abs(lat) + d_lat >= 90 or math.sin(angular_radius) >= cos_lat:
+        return max(lat - d_lat, -90), min(lat + d_lat, 90), -180, 180
+    d_lon = math.degrees(math.asin(math.sin(angular_radius) / cos_lat))
+    return lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon
+
+
+def within_bounding_box(queryset, lat, lon, radius_km):
+    """pre-filter events to the bounding box of the circle"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lon < -180 or max_lon > 180:
+        # the box wraps around the antimeridian, so latitude alone filters
+        return queryset.filter(longitude__isnull=False)
+    return queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+
+
+def within_radius(rows, lat, lon, radius_km):
+    """yield the rows whose coordinates lie inside the circle"""
+    for row in rows:
+        if haversine_km(lat, lon, row.latitude, row.longitude) <= radius_km:
+            yield row
+
+
+def parse_point(latlong, radius=None):
+    """(lat, lon, radius_km) from `lat,long` and an optional radius in km"""
+    try:
+        lat, lon = (float(part) for part in latlong.split(","))
+        radius_km = float(radius) if radius is not None else 20.0
+    except (TypeError, ValueError) as e:
+        raise InvalidPoint("Invalid latlong or radius") from e
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise InvalidPoint("Invalid latlong")
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise InvalidPoint(f"Radius must be between 0 and {MAX_RADIUS_KM} km")
+    return lat, lon, radius_km
+
+
+def location_point(code):
+    """(lat, lon, radius_km) of a configured CONCERT_LOCATIONS entry"""
+    location = settings.CONCERT_LOCATIONS[code]
+    return location["latitude"], location["longitude"], location["radius"]
+
+
+def covered_by_mirror(lat, lon, radius_km):
+    """whether the circle lies inside a location fetch_concerts has synced
+    recently"""
+    scopes = []
+    for code in settings.CONCERT_LOCATIONS:
+        center_lat, center_lon, center_radius = location_point(code)
+        distance = haversine_km(lat, lon, center_lat, center_lon)
+        if distance + radius_km <= center_radius:
+            scopes.append(f"location:{code}")
+    return bool(scopes) and recent_syncs().filter(scope__in=scopes).exists()
@@ -0,0 +1,186 @@
+"""
+Paged concert listings fetched from Ticketmaster.
+
+Pages map onto Ticketmaster's page/size paging and are handed to the client
+as opaque cursors. The page after the one being served can be prefetched in
+the background so that scrolling hits a warm cache.
+
+Listings are cached stale-while-revalidate: entries younger than
+CONCERT_LISTING_FRESH_TTL are served as is, entries younger than
+CONCERT_LISTING_STALE_TTL are served immediately while one background
+refresh runs, and older entries are refetched synchronously but still served
+as the last good result if Ticketmaster fails. afetch_listing is the same
+for async views; its background refreshes still run on the shared executor.
+"""
+
+import base64
+import binascii
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import metrics, ticketmaster
+from .singleflight import canonical_key
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 200
+# Ticketmaster rejects requests where page * size reaches 1000.
+MAX_DEEP_PAGING = 1000
+
+
+class InvalidCursor(ValueError):
+    """Raised for malformed page, size or cursor parameters"""
+
+
+def encode_cursor(page, size):
+    """opaque cursor for a page of results"""
+    raw = json.dumps({"page": page, "size": size}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """return (page, size) from a cursor produced by encode_cursor"""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return int(decoded["page"]), int(decoded["size"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def paging_params(query_params):
+    """upstream page/size params from a `cursor` or explicit `page`/`size`"""
+    cursor = query_params.get("cursor")
+    if cursor:
+        page, size = decode_cursor(cursor)
+    else:
+        try:
+            page = query_params.get("page")
+            page = None if page is None else int(page)
+            size = query_params.get("size")
+            size = None if size is None else int(size)
+        except ValueError as e:
+            raise InvalidCursor("Invalid page or size") from e
+
+    params = {}
+    if page is not None:
+        if page < 0:
+            raise InvalidCursor("Invalid page")
+        params["page"] = str(page)
+    if size is not None:
+        if size < 1:
+            raise InvalidCursor("Invalid size")
+        params["size"] = str(min(size, MAX_PAGE_SIZE))
+    return params
+
+
+def next_page_params(params, response):
+    """params for the page after response, or None on the last reachable page"""
+    page = response.get("page", {})
+    number = page.get("number", 0)
+    size = page.get("size", ticketmaster.DEFAULT_PAGE_SIZE)
+    if number + 1 >= page.get("totalPages", 0):
+        return None
+    if (number + 1) * size >= MAX_DEEP_PAGING:
+        return None
+    return {**params, "page": str(number + 1), "size": str(size)}
+
+
+def listing_key(params):
+    """cache key for a page of upstream results"""
+    return f"listing:{canonical_key('events', params)}"
+
+
+def store_listing(params, response):
+    """remember a successful upstream page as the last good result"""
+    if "page" not in response:
+        return
+    cache.set(
+        listing_key(params),
+        {"response": response, "stored_at": time.time()},
+        settings.CONCERT_LISTING_MAX_AGE,
+    )
+
+
+def refresh_listing(params):
+    """fetch a page upstream and cache it"""
+    response = ticketmaster.get_coalesced("events", params)
+    store_listing(params, response)
+    return response
+
+
+def refresh_in_background(params):
+    """refresh a page on the shared executor, once across workers"""
+    lock_key = f"{listing_key(params)}:refreshing"
+    if not cache.add(lock_key, 1, settings.TICKETMASTER_COALESCE_WAIT):
+        return
+
+    def refresh():
+        try:
+            refresh_listing(params)
+        except Exception as e:
+            logger.warning("Concert listing refresh failed: %s", str(e))
+        finally:
+            cache.delete(lock_key)
+            connection.close()
+
+    ticketmaster.executor.submit(refresh)
+
+
+def fetch_listing(params):
+    """return (response, is_stale) for a page of events"""
+    entry = cache.get(listing_key(params))
+    if entry is not None:
+        age = time.time() - entry["stored_at"]
+        if age < settings.CONCERT_LISTING_FRESH_TTL:
+            metrics.observe_cache("listings", hits=1)
+            return entry["response"], False
+        if age < settings.CONCERT_LISTING_STALE_TTL:
+            metrics.observe_cache("listings", stale=1)
+            refresh_in_background(params)
+            return entry["response"], True
+
+    metrics.observe_cache("listings", misses=1)
+    try:
+        return refresh_listing(params), False
+    except Exception as e:
+        if entry is None:
+            raise
+        logger.warning("Serving last good concert listing: %s", str(e))
+        return entry["response"], True
+
+
+def prefetch_listing(params):
+    """fetch a page in the background unless it is already cached"""
+    if cache.get(listing_key(params)) is None:
+        refresh_in_background(params)
+
+
+async def afetch_listing(params):
+    """async fetch_listing()"""
+    entry = await cache.aget(listing_key(params))
+    if entry is not None:
+        age = time.time() - entry["stored_at"]
+        if age < settings.CONCERT_LISTING_FRESH_TTL:
+            metrics.observe_cache("listings", hits=1)
+            return entry["response"], False
+        if age < settings.CONCERT_LISTING_STALE_TTL:
+            metrics.observe_cache("listings", stale=1)
+            await sync_to_async(refresh_in_background)(params)
+            return entry["response"], True
+
+    metrics.observe_cache("listings", misses=1)
+    try:
+        response = await ticketmaster.aget_coalesced("events", params)
+    except Exception as e:
+        if entry is None:
+            raise
+        logger.warning("Serving last good concert listing: %s", str(e))
+        return entry["response"], True
+    await sync_to_async(store_listing)(params, response)
+    return response, False
@@ -0,0 +1 @@
+"""management commands for the api app"""
@@ -0,0 +1,168 @@
+"""
+Drive the concert views over HTTP and report throughput and latency.
+
+Requests are sent concurrently to a running server as a real user, holding
+a knox token cookie created for --username, who favorites bench-* concerts
+for the duration of the run. Upstream latency comes from whatever
+Ticketmaster the server talks to, normally the stand-in started with the
+ticketmaster_standin command.
+"""
+
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from knox.models import AuthToken
+from requests.adapters import HTTPAdapter
+
+from ...models import Concert, FavoriteConcert
+
+User = get_user_model()
+
+KEYWORDS = ("rock", "jazz", "indie", "pop", "folk")
+
+
+def percentile(samples, fraction):
+    """nearest-rank percentile of samples, None without samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def summarize(latencies, errors, elapsed):
+    """throughput and latency percentiles in milliseconds of one endpoint,
+    latencies are of the successful requests only"""
+    total = len(latencies) + errors
+    summary = {
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed if elapsed else 0.0,
+    }
+    for key, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        value = percentile(latencies, fraction)
+        summary[key] = None if value is None else value * 1000
+    return summary
+
+
+def milliseconds(value):
+    """a latency column, n/a when no request succeeded"""
+    return f"{'n/a':>8}" if value is None else f"{value:>8.1f}"
+
+
+def endpoint_requests(favorites):
+    """(path, params) generators for every benchmarked endpoint"""
+    return {
+        "concerts": (
+            ("/api/concerts/", {"query": keyword, "page": page})
+            for page, keyword in cycle(enumerate(KEYWORDS))
+        ),
+        "get_concert": (
+            ("/api/concerts/concert_by_id/", {"ids": f"bench-{i},bench-{i + 1}"})
+            for i in cycle(range(favorites or 50))
+        ),
+        "favorites": cycle([("/api/concerts/favorites/", {})]),
+    }
+
+
+def run_endpoint(base_url, token, requests_iter, total, concurrency):
+    """send total requests with concurrency workers, returns the summary"""
+    http = requests.Session()
+    http.headers["Cookie"] = f"knox_token={token}"
+    adapter = HTTPAdapter(pool_maxsize=concurrency)
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+
+    def send(request):
+        path, params = request
+        started = time.perf_counter()
+        try:
+            ok = http.get(f"{base_url}{path}", params=params, timeout=60).ok
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, islice(requests_iter, total)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, ok in results if ok]
+    errors = sum(1 for _, ok in results if not ok)
+    return summarize(latencies, errors, elapsed)
+
+
+class Command(BaseCommand):
+    """benchmark concerts, get_concert and user_favorite_concerts"""
+
+    help = "Benchmark the concert views against a running server"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument(
+            "--username", required=True, help="user the requests are sent as"
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            choices=["concerts", "get_concert", "favorites"],
+            help="only benchmark these endpoints",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="requests per endpoint"
+        )
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--favorites",
+            type=int,
+            default=50,
+            help="favorited concerts the user has during the run",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist as e:
+            raise CommandError(f"Unknown user {options['username']}") from e
+
+        instance, token = AuthToken.objects.create(user=user)
+        added_concerts, added_favorites = [], []
+        try:
+            for i in range(options["favorites"]):
+                concert, created = Concert.objects.get_or_create(
+                    concert_id=f"bench-{i}"
+                )
+                if created:
+                    added_concerts.append(concert.pk)
+                favorite, created = FavoriteConcert.objects.get_or_create(
+                    user=user, concert=concert
+                )
+                if created:
+                    added_favorites.append(favorite.pk)
+
+            generators = endpoint_requests(options["favorites"])
+            self.stdout.write(
+                f"{'endpoint':<12} {'requests':>8} {'errors':>6} "
+                f"{'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+            )
+            for name in options["endpoint"] or list(generators):
+                result = run_endpoint(
+                    options["base_url"].rstrip("/"),
+                    token,
+                    generators[name],
+                    options["requests"],
+                    options["concurrency"],
+                )
+                self.stdout.write(
+                    f"{name:<12} {result['requests']:>8} {result['errors']:>6} "
+                    f"{result['throughput']:>8.1f} {milliseconds(result['p50'])} "
+                    f"{milliseconds(result['p95'])} {milliseconds(result['p99'])}"
+                )
+        finally:
+            # leave the user's favorites as they were before the run
+            FavoriteConcert.objects.filter(pk__in=added_favorites).delete()
+            Concert.objects.filter(pk__in=added_concerts).delete()
+            instance.delete()
@@ -0,0 +1,161 @@
+"""
+Mirror upcoming Ticketmaster music events for the configured locations and
+venues into the local TicketmasterEvent table.
+
+The Discovery API has no modified-since filter, so every run pages through
+the upcoming window of each scope but only rewrites events whose payload
+hash changed. Each scope keeps a SyncCheckpoint holding the start of its last
+completed run, which --max-age uses to skip scopes that are still fresh and
+local listings use to leave out events that run no longer saw.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from ... import ticketmaster
+from ...listings import MAX_DEEP_PAGING, MAX_PAGE_SIZE
+from ...models import SyncCheckpoint, TicketmasterEvent
+from ...search import refresh_search_vectors
+from ...views.concert_views import VENUES
+
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def sync_scopes():
+    """upstream filters for every configured location and venue"""
+    scopes = {
+        f"location:{code}": {
+            "latlong": f"{location['latitude']},{location['longitude']}",
+            "radius": f"{location['radius']:g}",
+            "unit": "km",
+        }
+        for code, location in settings.CONCERT_LOCATIONS.items()
+    }
+    scopes.update(
+        {f"venue:{code}": {"venueId": venue_id} for code, venue_id in VENUES.items()}
+    )
+    return scopes
+
+
+def upsert_events(events):
+    """write new and changed events in bulk and bump the fetch time of the
+    unchanged ones, returns every row built and the number written"""
+    now = timezone.now()
+    rows = {
+        event["id"]: TicketmasterEvent.from_payload(event["id"], event, now)
+        for event in events
+    }
+    known_hashes = dict(
+        TicketmasterEvent.objects.filter(event_id__in=list(rows)).values_list(
+            "event_id", "content_hash"
+        )
+    )
+    changed = [
+        row
+        for event_id, row in rows.items()
+        if known_hashes.get(event_id) != row.content_hash
+    ]
+    unchanged = [
+        event_id
+        for event_id, row in rows.items()
+        if known_hashes.get(event_id) == row.content_hash
+    ]
+
+    with transaction.atomic():
+        TicketmasterEvent.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["event_id"],
+            update_fields=TicketmasterEvent.PAYLOAD_FIELDS,
+        )
+        refresh_search_vectors([row.event_id for row in changed])
+        TicketmasterEvent.objects.filter(event_id__in=unchanged).update(fetched_at=now)
+    return list(rows.values()), len(changed)
+
+
+class Command(BaseCommand):
+    """sync upcoming music events into the local mirror"""
+
+    help = "Mirror upcoming Ticketmaster music events for CONCERT_LOCATIONS and VENUES"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scope",
+            action="append",
+            help="only sync these scopes, e.g. location:KW or venue:HISTORY",
+        )
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=0,
+            help="skip scopes synced within this many minutes",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=MAX_PAGE_SIZE,
+            help="events requested per upstream page",
+        )
+
+    def handle(self, *args, **options):
+        scopes = sync_scopes()
+        selected = options["scope"] or list(scopes)
+        unknown = set(selected) - set(scopes)
+        if unknown:
+            self.stderr.write(f"Unknown scopes: {', '.join(sorted(unknown))}")
+            return
+
+        for scope in selected:
+            checkpoint, _ = SyncCheckpoint.objects.get_or_create(scope=scope)
+            max_age = timedelta(minutes=options["max_age"])
+            if checkpoint.synced_at and timezone.now() - checkpoint.synced_at < max_age:
+                self.stdout.write(f"{scope}: synced recently, skipping")
+                continue
+            self.sync_scope(checkpoint, scopes[scope], options["page_size"])
+
+    def sync_scope(self, checkpoint, filters, page_size):
+        """page through the upcoming events of one scope"""
+        started_at = timezone.now()
+        params = {
+            "classificationName": "Music",
+            "includeTest": "no",
+            "sort": "date,asc",
+            "size": str(page_size),
+            "startDateTime": started_at.strftime(DATETIME_FORMAT),
+            **filters,
+        }
+        page, fetched, written = 0, 0, 0
+
+        while True:
+            response = ticketmaster.get("events", {**params, "page": str(page)})
+            events = response.get("_embedded", {}).get("events", [])
+            if not events:
+                break
+            rows, changed = upsert_events(events)
+            fetched += len(events)
+            written += changed
+
+            starts = [row.starts_at for row in rows if row.starts_at]
+
+            page_info = response.get("page", {})
+            if page_info.get("number", page) + 1 >= page_info.get("totalPages", 0):
+                break
+            page += 1
+            if page * page_size >= MAX_DEEP_PAGING:
+                # Ticketmaster stops paging at 1000 results, so restart the
+                # window at the last start time seen. Overlaps are upserted.
+                window_start = max(starts).strftime(DATETIME_FORMAT) if starts else None
+                if window_start is None or window_start == params["startDateTime"]:
+                    break
+                params["startDateTime"] = window_start
+                page = 0
+
+        checkpoint.synced_at = started_at
+        checkpoint.save()
+        self.stdout.write(
+            f"{checkpoint.scope}: fetched {fetched} events, wrote {written}"
+        )
@@ -0,0 +1,67 @@
+"""
+Mark concerts whose Ticketmaster events were cancelled or removed as dead.
+
+Every live concert is looked up in multi-id batches; the ones Ticketmaster
+no longer returns get Concert.dead_at set, and favorites skip them from then
+on instead of asking Ticketmaster about them on every page load. The events
+that were found refresh the event cache on the way.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ... import ticketmaster
+from ...event_cache import store_events
+from ...models import Concert, FavoriteConcert
+from ...signals import bump_versions
+
+# concert ids looked up per transaction
+CHUNK_SIZE = 1000
+
+
+def reap(concert_ids):
+    """look concert_ids up and mark the ones Ticketmaster did not return as
+    dead, returns the number of concerts marked"""
+    fetched = ticketmaster.fetch_events(concert_ids)
+    store_events(fetched)
+    dead = [concert_id for concert_id in concert_ids if concert_id not in fetched]
+    if not dead:
+        return 0
+
+    with transaction.atomic():
+        marked = Concert.objects.filter(
+            concert_id__in=dead, dead_at__isnull=True
+        ).update(dead_at=timezone.now())
+        # favorites change without a FavoriteConcert save, bump their ETags
+        bump_versions(
+            FavoriteConcert.objects.filter(concert__concert_id__in=dead).values(
+                "user_id"
+            ),
+            "favorites_version",
+        )
+    return marked
+
+
+class Command(BaseCommand):
+    """Django command marking concerts Ticketmaster no longer knows as dead"""
+
+    help = "Mark concerts whose Ticketmaster events no longer exist as dead"
+
+    def handle(self, *args, **options):
+        concert_ids = list(
+            Concert.objects.filter(dead_at__isnull=True)
+            .exclude(concert_id__isnull=True)
+            .exclude(concert_id="")
+            .values_list("concert_id", flat=True)
+            .distinct()
+        )
+        marked = 0
+        try:
+            for chunk in ticketmaster.chunked(concert_ids, CHUNK_SIZE):
+                marked += reap(chunk)
+        except ticketmaster.UpstreamUnavailable as e:
+            raise CommandError(
+                f"Ticketmaster lookup failed after marking {marked} dead: {e}"
+            ) from e
+        self.stdout.write(f"checked {len(concert_ids)} concerts, marked {marked} dead")
@@ -0,0 +1,255 @@
+"""
+Recompute the match candidates and scores of every user into MatchCandidate.
+
+Favorited concerts, favorite artists and favorite genres are loaded once into
+sparse binary user x item matrices. Users are split into shards of consecutive
+ids; a shard multiplies its rows of the concert matrix with the whole matrix to
+count the concerts it shares with every other user, scores the pairs sharing
+any the same way api.scoring does, keeps the best MATCHING_CANDIDATES_PER_USER
+of each user, and replaces its users' MatchCandidate rows in one transaction.
+Shards run on a pool of forked processes, each opening a database connection
+of its own.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from scipy import sparse
+
+from ...models import Concert, FavoriteConcert, MatchCandidate
+from ...scoring import ArtistThrough, GenreThrough, pair_similarity
+from ...signals import bump_versions
+
+BATCH_SIZE = 5000
+
+# matrices shared with the workers, set by init_worker
+shared = {}
+
+
+def pair_array(pairs):
+    """(n, 2) int64 array of (user id, item id) pairs"""
+    return np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def item_matrix(pairs, user_ids):
+    """sparse binary matrix of pairs with a row per user in user_ids, which
+    is sorted, and a column per distinct item, with the items of the columns"""
+    pairs = pairs[np.isin(pairs[:, 0], user_ids)]
+    items, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (
+            np.ones(len(pairs), dtype=np.int32),
+            (np.searchsorted(user_ids, pairs[:, 0]), columns),
+        ),
+        shape=(len(user_ids), len(items)),
+    )
+    return matrix, items
+
+
+def load_matrices():
+    """user x concert, artist and genre matrices of every user with a favorite
+    concert, with the ids their rows and concert columns stand for"""
+    favorites = pair_array(
+        FavoriteConcert.objects.values_list("user_id", "concert_id").iterator()
+    )
+    user_ids = np.unique(favorites[:, 0])
+    concerts, concert_pks = item_matrix(favorites, user_ids)
+    concert_ids = dict(
+        Concert.objects.filter(pk__in=concert_pks.tolist()).values_list(
+            "pk", "concert_id"
+        )
+    )
+
+    loaded = {
+        "user_ids": user_ids,
+        "concert_pks": concert_pks,
+        "concert_ids": [concert_ids.get(pk) for pk in concert_pks.tolist()],
+        "concerts": concerts,
+    }
+    for kind, through, item in (
+        ("artists", ArtistThrough, "artist_id"),
+        ("genres", GenreThrough, "genre_id"),
+    ):
+        pairs = pair_array(
+            through.objects.values_list("userprofile__user_id", item).iterator()
+        )
+        loaded[kind], _items = item_matrix(pairs, user_ids)
+    return loaded
+
+
+def shard_bounds(count, shard_size):
+    """(start, stop) row ranges of shards of at most shard_size users"""
+    return [
+        (start, min(start + shard_size, count)) for start in range(0, count, shard_size)
+    ]
+
+
+def init_worker(matrices):
+    """share the matrices with a worker, which opens its own connection"""
+    shared.update(matrices)
+    connections.close_all()
+
+
+def best_per_row(rows, columns, scores, per_row):
+    """indices of the per_row best scored pairs of every row, best first"""
+    order = np.lexsort((columns, -scores, rows))
+    rows = rows[order]
+    firsts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    positions = np.arange(len(rows)) - np.repeat(
+        firsts, np.diff(np.r_[firsts, len(rows)])
+    )
+    return order[positions < per_row]
+
+
+def score_shard(start, stop, per_user):
+    """(rows, columns, shared counts, scores) of the per_user best pairs of
+    every user in rows start to stop with users sharing a concert"""
+    method = settings.MATCHING_SIMILARITY
+    concerts = shared["concerts"]
+    counts = (concerts[start:stop] @ concerts.T).tocoo()
+    rows = counts.row.astype(np.int64) + start
+    keep = rows != counts.col
+    rows, columns, counts = rows[keep], counts.col[keep], counts.data[keep]
+
+    scores = np.zeros(len(rows))
+    for kind in ("concerts", "artists", "genres"):
+        weight = settings.MATCHING_WEIGHTS.get(kind, 0)
+        if not weight:
+            continue
+        matrix = shared[kind]
+        sizes = np.asarray(matrix.sum(axis=1)).ravel()
+        if kind == "concerts":
+            intersection = counts
+        else:
+            intersection = np.asarray(
+                matrix[rows].multiply(matrix[columns]).sum(axis=1)
+            ).ravel()
+        scores += weight * pair_similarity(
+            intersection, sizes[rows], sizes[columns], method
+        )
+    best = best_per_row(rows, columns, scores, per_user)
+    return rows[best], columns[best], counts[best], scores[best]
+
+
+def recompute_shard(bounds, computed_at, per_user):
+    """replace the MatchCandidate rows of the users of a shard, returns the
+    number of rows written"""
+    start, stop = bounds
+    rows, columns, counts, scores = score_shard(start, stop, per_user)
+    concerts = shared["concerts"]
+    common = concerts[rows].multiply(concerts[columns]).tocsr()
+    user_ids = shared["user_ids"].tolist()
+    concert_pks = shared["concert_pks"].tolist()
+    concert_ids = shared["concert_ids"]
+
+    candidates = [
+        MatchCandidate(
+            user_id=user_ids[row],
+            other_id=user_ids[column],
+            score=round(float(score), 4),
+            shared_count=int(count),
+            concerts=[
+                [concert_pks[index], concert_ids[index]]
+                for index in sorted(
+                    common.indices[common.indptr[i] : common.indptr[i + 1]]
+                )
+            ],
+            computed_at=computed_at,
+        )
+        for i, (row, column, count, score) in enumerate(
+            zip(rows.tolist(), columns.tolist(), counts.tolist(), scores.tolist())
+        )
+    ]
+    with transaction.atomic():
+        MatchCandidate.objects.filter(user_id__in=user_ids[start:stop]).delete()
+        MatchCandidate.objects.bulk_create(candidates, batch_size=BATCH_SIZE)
+        # clients holding a matchings ETag must see the new candidates
+        bump_versions(user_ids[start:stop], "matchings_version")
+    return len(candidates)
+
+
+def recompute_shard_in_worker(bounds, computed_at, per_user):
+    """recompute_shard, releasing the worker's connection between shards"""
+    try:
+        return recompute_shard(bounds, computed_at, per_user)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """Django command precomputing the match candidates of every user"""
+
+    help = "Recompute match candidates and scores for every user"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="processes computing shards, 1 computes them in this process",
+        )
+        parser.add_argument(
+            "--shard-size",
+            type=int,
+            default=1000,
+            help="users per shard",
+        )
+        parser.add_argument(
+            "--per-user",
+            type=int,
+            default=settings.MATCHING_CANDIDATES_PER_USER,
+            help="best scored candidates kept for every user",
+        )
+
+    def handle(self, *args, **options):
+        if min(options["workers"], options["shard_size"], options["per_user"]) < 1:
+            raise CommandError(
+                "--workers, --shard-size and --per-user must be positive"
+            )
+
+        computed_at = timezone.now()
+        matrices = load_matrices()
+        bounds = shard_bounds(len(matrices["user_ids"]), options["shard_size"])
+
+        if options["workers"] == 1:
+            shared.update(matrices)
+            written = sum(
+                recompute_shard(shard, computed_at, options["per_user"])
+                for shard in bounds
+            )
+        else:
+            # forked workers must not share the parent's connection
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=init_worker,
+                initargs=(matrices,),
+            ) as pool:
+                written = sum(
+                    pool.map(
+                        recompute_shard_in_worker,
+                        bounds,
+                        [computed_at] * len(bounds),
+                        [options["per_user"]] * len(bounds),
+                    )
+                )
+
+        # users who no longer share a concert with anyone
+        stale = MatchCandidate.objects.filter(computed_at__lt=computed_at)
+        with transaction.atomic():
+            bump_versions(
+                list(stale.values_list("user_id", flat=True).distinct()),
+                "matchings_version",
+            )
+            stale.delete()
+        self.stdout.write(
+            f"scored {len(matrices['user_ids'])} users in {len(bounds)} shards, "
+            f"wrote {written} candidates"
+        )
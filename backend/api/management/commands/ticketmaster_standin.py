@@ -0,0 +1,242 @@
+"""
+Serve a local stand-in for the Ticketmaster Discovery API events endpoint.
+
+Events come from a recorded fixture and are cloned under synthetic ids up to
+--catalog-size, and any id asked for by a multi-id lookup is answered with a
+clone as well, except ids starting with "missing" which behave like removed
+events. Responses are delayed by a configurable latency distribution, can
+fail at a given rate, and 429 bursts can be injected on a schedule.
+
+Point the app at it with TICKETMASTER_URL_BASE=http://127.0.0.1:8089 and
+drive it with the benchmark_concerts command.
+"""
+
+import copy
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_FIXTURE = os.path.join(
+    settings.BASE_DIR, "api", "tests", "ticketmaster_response.json"
+)
+
+
+def parse_latency(spec):
+    """return a function sampling response delays in seconds from a spec:
+    `fixed:MS`, `uniform:MIN_MS,MAX_MS` or `lognormal:MEDIAN_MS,SIGMA`"""
+    try:
+        kind, _, args = spec.partition(":")
+        values = [float(value) for value in args.split(",")] if args else []
+        if kind == "fixed" and len(values) == 1:
+            return lambda: values[0] / 1000
+        if kind == "uniform" and len(values) == 2:
+            return lambda: random.uniform(*values) / 1000
+        if kind == "lognormal" and len(values) == 2:
+            mu = math.log(values[0])
+            return lambda: random.lognormvariate(mu, values[1]) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+def load_events(path):
+    """events of a recorded Ticketmaster response, or a JSON list of events"""
+    with open(path, encoding="utf-8") as f:
+        recorded = json.load(f)
+    if isinstance(recorded, dict):
+        recorded = recorded.get("populated_response", recorded)
+        recorded = recorded.get("_embedded", {}).get("events", [])
+    if not recorded:
+        raise ValueError(f"No events in {path}")
+    return recorded
+
+
+class StandIn:
+    """Catalog and fault injection behind the stand-in server"""
+
+    def __init__(
+        self,
+        templates,
+        catalog_size=1000,
+        latency=None,
+        error_rate=0.0,
+        burst_every=0,
+        burst_length=0,
+    ):
+        self.templates = templates
+        self.latency = latency or (lambda: 0)
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.started_at = time.monotonic()
+        self.catalog = [self.event(f"standin-{i}") for i in range(catalog_size)]
+
+    def event(self, event_id):
+        """a template event cloned under event_id"""
+        template = self.templates[zlib.crc32(event_id.encode()) % len(self.templates)]
+        event = copy.deepcopy(template)
+        event["id"] = event_id
+        event["name"] = f"{template.get('name', 'Event')} {event_id}"
+        return event
+
+    def in_burst(self):
+        """whether a 429 burst is currently being injected"""
+        if not self.burst_every:
+            return False
+        elapsed = time.monotonic() - self.started_at
+        return elapsed % self.burst_every < self.burst_length
+
+    def respond(self, params):
+        """(status, headers, body) for an events request with params"""
+        time.sleep(self.latency())
+        if self.in_burst():
+            return 429, {"Retry-After": "1"}, {"fault": "Rate limit exceeded"}
+        if random.random() < self.error_rate:
+            return 500, {}, {"fault": "Injected failure"}
+
+        if "id" in params:
+            ids = [event_id for event_id in params["id"].split(",") if event_id]
+            events = [
+                self.event(event_id)
+                for event_id in ids
+                if not event_id.startswith("missing")
+            ]
+        else:
+            events = self.catalog
+            keyword = params.get("keyword", "").lower()
+            if keyword:
+                events = [event for event in events if keyword in event["name"].lower()]
+
+        size = int(params.get("size", 20))
+        number = int(params.get("page", 0))
+        page = events[number * size : (number + 1) * size]
+        body = {
+            "page": {
+                "size": size,
+                "totalElements": len(events),
+                "totalPages": math.ceil(len(events) / size),
+                "number": number,
+            }
+        }
+        if page:
+            body["_embedded"] = {"events": page}
+        return 200, {}, body
+
+
+def build_server(standin, host="127.0.0.1", port=8089):
+    """a threaded HTTP server answering /events requests from standin"""
+
+    class Handler(BaseHTTPRequestHandler):
+        """answers GET .../events like the Discovery API"""
+
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """serve one events request"""
+            url = urlparse(self.path)
+            if not url.path.rstrip("/").endswith("/events"):
+                status, headers, body = 404, {}, {"fault": "Unknown resource"}
+            else:
+                params = {
+                    key: values[-1] for key, values in parse_qs(url.query).items()
+                }
+                status, headers, body = standin.respond(params)
+
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            """keep request logs out of benchmark output"""
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_in_background(server):
+    """run server on a daemon thread, returns the thread"""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+class Command(BaseCommand):
+    """serve recorded Ticketmaster events with injected latency and faults"""
+
+    help = "Run a local Ticketmaster stand-in for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+        parser.add_argument(
+            "--fixture",
+            default=DEFAULT_FIXTURE,
+            help="recorded Ticketmaster response or JSON list of events",
+        )
+        parser.add_argument(
+            "--catalog-size",
+            type=int,
+            default=1000,
+            help="events returned by listings, cloned from the fixture",
+        )
+        parser.add_argument(
+            "--latency",
+            default="lognormal:120,0.5",
+            help="fixed:MS, uniform:MIN_MS,MAX_MS or lognormal:MEDIAN_MS,SIGMA",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="fraction of requests answered with a 500",
+        )
+        parser.add_argument(
+            "--burst-every",
+            type=float,
+            default=0,
+            help="seconds between the starts of 429 bursts, 0 for none",
+        )
+        parser.add_argument(
+            "--burst-length",
+            type=float,
+            default=2,
+            help="seconds each 429 burst lasts",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            standin = StandIn(
+                load_events(options["fixture"]),
+                catalog_size=options["catalog_size"],
+                latency=parse_latency(options["latency"]),
+                error_rate=options["error_rate"],
+                burst_every=options["burst_every"],
+                burst_length=options["burst_length"],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e)) from e
+
+        server = build_server(standin, options["host"], options["port"])
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Ticketmaster stand-in serving on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,322 @@
+"""
+Candidate generation for matchings.
+
+Candidates are the users who favorited at least one of the concerts the
+current user favorited. The overlap of every pair of users is kept current
+in CoFavorite by api.signals, so they are read with a single range scan over
+the user's CoFavorite rows. Served matchings are ranked with api.scoring:
+candidates are scored in batches, most shared concerts first, until the rest
+cannot beat the page, pages are cut on (score, other id) and only the
+candidates of the page are read with their cards and concerts. When
+the recompute_matchings command has scored the user recently and they changed
+no favorite since, the candidates are read ranked from MatchCandidate
+instead. With a limit the page ends with a cursor holding
+the position to resume from. Their Matching rows are written in bulk with a
+fixed number of queries.
+"""
+
+import base64
+import binascii
+import heapq
+import json
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .listings import InvalidCursor
+from .models import CoFavorite, Concert, MatchCandidate, Matching, UserProfile
+from .scoring import item_counts, rank, score_bound
+
+MAX_LIMIT = 100
+# candidates scored per query while looking for the best of a live page
+SCORE_BATCH = 200
+
+CANDIDATE_FIELDS = (
+    "other_id",
+    "other__username",
+    "other__profile__profile_photo",
+    "other__profile__first_name",
+    "other__profile__last_name",
+    "other__profile__faculty",
+    "other__profile__term",
+)
+
+
+def decided_targets(user):
+    """ids of the users user already said yes or no to"""
+    return (
+        Matching.objects.filter(user_id=user.id)
+        .exclude(decision="UNKNOWN")
+        .values("target_id")
+    )
+
+
+def encode_cursor(key, other_id):
+    """opaque cursor resuming candidates after the one at (key, other_id),
+    key being the shared count or score they are ordered by"""
+    raw = json.dumps({"key": key, "other_id": other_id})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """return (key, other_id) from a cursor produced by encode_cursor"""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        key = decoded["key"]
+        if isinstance(key, bool) or not isinstance(key, (int, float)):
+            raise TypeError("key is not a number")
+        return key, int(decoded["other_id"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def page_params(query_params):
+    """(limit, after) from the `limit` and `cursor` params, both optional"""
+    limit = query_params.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError as e:
+            raise InvalidCursor("Invalid limit") from e
+        if not 0 < limit <= MAX_LIMIT:
+            raise InvalidCursor("Invalid limit")
+    cursor = query_params.get("cursor")
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def co_favorites(user, limit=None, after=None, other_ids=None):
+    """shared concerts of user with every undecided user, or those in
+    other_ids, with the profile fields of the other user, most shared concerts
+    first. limit bounds the number of other users, after is a (shared_count,
+    other_id) position"""
+    # pairs left without a shared concert are not candidates
+    pairs = CoFavorite.objects.filter(user_id=user.id, shared_count__gt=0).exclude(
+        other_id__in=decided_targets(user)
+    )
+    if other_ids is not None:
+        pairs = pairs.filter(other_id__in=other_ids)
+    if after:
+        shared_count, other_id = after
+        pairs = pairs.filter(
+            Q(shared_count__lt=shared_count)
+            | Q(shared_count=shared_count, other_id__gt=other_id)
+        )
+    if limit:
+        pairs = CoFavorite.objects.filter(
+            id__in=pairs.order_by("-shared_count", "other_id").values("id")[:limit]
+        )
+    return pairs.order_by("-shared_count", "other_id", "shared_concerts__id").values(
+        *CANDIDATE_FIELDS,
+        "shared_count",
+        "shared_concerts__id",
+        "shared_concerts__concert_id",
+    )
+
+
+def candidates(user, limit=None, after=None, other_ids=None):
+    """users sharing a favorite concert with user and not decided on yet, or
+    those of them in other_ids, with their card fields and shared concerts, in
+    one query. Returns the candidates and the cursor of the next page, if
+    there may be one"""
+    found = []
+    # one row past the limit tells whether there is a next page
+    scanned = co_favorites(user, limit + 1 if limit else None, after, other_ids)
+    for _other_id, rows in groupby(scanned, key=itemgetter("other_id")):
+        rows = list(rows)
+        first = rows[0]
+        shared = [row for row in rows if row["shared_concerts__id"] is not None]
+        if not shared:
+            continue
+        found.append(
+            {
+                "user_id": first["other_id"],
+                "username": first["other__username"],
+                "profile_photo": first["other__profile__profile_photo"],
+                "first_name": first["other__profile__first_name"],
+                "last_name": first["other__profile__last_name"],
+                "faculty": first["other__profile__faculty"],
+                "term": first["other__profile__term"],
+                "shared_count": first["shared_count"],
+                "concert_pks": [row["shared_concerts__id"] for row in shared],
+                "concerts": [row["shared_concerts__concert_id"] for row in shared],
+            }
+        )
+    if not limit or len(found) <= limit:
+        return found, None
+    found = found[:limit]
+    return found, encode_cursor(found[-1]["shared_count"], found[-1]["user_id"])
+
+
+def precomputed_at(user):
+    """when recompute_matchings last scored user, if that is recent enough
+    and user changed no favorite since. Favorite changes of their candidates
+    only show once recomputed, within MATCHING_CANDIDATES_MAX_AGE"""
+    computed_at = MatchCandidate.objects.filter(user_id=user.id).aggregate(
+        computed_at=Max("computed_at")
+    )["computed_at"]
+    max_age = timedelta(seconds=settings.MATCHING_CANDIDATES_MAX_AGE)
+    if computed_at is None or computed_at < timezone.now() - max_age:
+        return None
+    changed = UserProfile.objects.filter(
+        user_id=user.id, favorites_changed_at__gt=computed_at
+    )
+    if changed.exists():
+        return None
+    return computed_at
+
+
+def request_precomputed_at(request):
+    """precomputed_at() of the requesting user, read once per request since
+    both the matchings ETag and body depend on it"""
+    if not hasattr(request, "matchings_computed_at"):
+        request.matchings_computed_at = precomputed_at(request.user)
+    return request.matchings_computed_at
+
+
+def precomputed_candidates(user, limit=None, after=None):
+    """candidates of user from MatchCandidate, best first, like candidates()
+    in one query"""
+    rows = (
+        MatchCandidate.objects.filter(user_id=user.id)
+        .exclude(other_id__in=decided_targets(user))
+        .order_by("-score", "other_id")
+    )
+    if after:
+        score, other_id = after
+        rows = rows.filter(Q(score__lt=score) | Q(score=score, other_id__gt=other_id))
+    rows = rows.values(*CANDIDATE_FIELDS, "score", "shared_count", "concerts")
+    if limit:
+        rows = rows[: limit + 1]
+
+    found = [
+        {
+            "user_id": row["other_id"],
+            "username": row["other__username"],
+            "profile_photo": row["other__profile__profile_photo"],
+            "first_name": row["other__profile__first_name"],
+            "last_name": row["other__profile__last_name"],
+            "faculty": row["other__profile__faculty"],
+            "term": row["other__profile__term"],
+            "score": row["score"],
+            "shared_count": row["shared_count"],
+            "concert_pks": [pk for pk, _concert_id in row["concerts"]],
+            "concerts": [concert_id for _pk, concert_id in row["concerts"]],
+        }
+        for row in rows
+    ]
+    if not limit or len(found) <= limit:
+        return found, None
+    found = found[:limit]
+    return found, encode_cursor(found[-1]["score"], found[-1]["user_id"])
+
+
+def live_candidates(user, limit=None, after=None):
+    """candidates of user best first like precomputed_candidates(), after is
+    a (score, other_id) position. Candidates are scored SCORE_BATCH at a time,
+    most shared concerts first, and the scan stops once the rest cannot score
+    high enough to make the page"""
+    pairs = (
+        CoFavorite.objects.filter(user_id=user.id, shared_count__gt=0)
+        .exclude(other_id__in=decided_targets(user))
+        .order_by("-shared_count", "other_id")
+    )
+    # (score, -other_id) of the best candidates past after, a min-heap of one
+    # past the limit, so that the worst of them is best[0]
+    best = []
+    own_counts = None
+    position = None
+    while True:
+        batch = pairs
+        if position:
+            shared_count, other_id = position
+            batch = batch.filter(
+                Q(shared_count__lt=shared_count)
+                | Q(shared_count=shared_count, other_id__gt=other_id)
+            )
+        batch = list(batch.values_list("shared_count", "other_id")[:SCORE_BATCH])
+        scored = rank(user, [{"user_id": other_id} for _count, other_id in batch])
+        for candidate in scored:
+            key = (candidate["score"], -candidate["user_id"])
+            if after and key >= (after[0], -after[1]):
+                continue
+            if not limit or len(best) <= limit:
+                heapq.heappush(best, key)
+            else:
+                heapq.heappushpop(best, key)
+        if len(batch) < SCORE_BATCH:
+            break
+        position = batch[-1]
+        if limit and len(best) > limit:
+            own_counts = own_counts or item_counts(user.id)
+            if round(score_bound(position[0], own_counts), 4) < best[0][0]:
+                break
+
+    ranked = sorted(best, reverse=True)
+    page = ranked[:limit] if limit else ranked
+    found, _next = candidates(user, other_ids=[-other_id for _score, other_id in page])
+    details = {candidate["user_id"]: candidate for candidate in found}
+    found = [
+        dict(details[-other_id], score=score)
+        for score, other_id in page
+        if -other_id in details
+    ]
+    if not limit or len(ranked) <= limit or not found:
+        return found, None
+    return found, encode_cursor(found[-1]["score"], found[-1]["user_id"])
+
+
+def ranked_candidates(user, limit=None, after=None, precomputed=None):
+    """candidates of user best first and the cursor of the next page,
+    precomputed when they are fresh and computed live otherwise, both paged
+    on (score, other_id). precomputed tells whether they are fresh when the
+    caller already knows"""
+    if precomputed is None:
+        precomputed = precomputed_at(user) is not None
+    if precomputed:
+        return precomputed_candidates(user, limit, after)
+    return live_candidates(user, limit, after)
+
+
+def create_matchings(user, found):
+    """make sure user has an undecided Matching with every candidate in found,
+    linked to exactly the shared concerts, returns {target id: matching id}"""
+    if not found:
+        return {}
+    Through = Matching.matched_concerts.through
+    with transaction.atomic():
+        Matching.objects.bulk_create(
+            [
+                Matching(
+                    user_id=user.id, target_id=candidate["user_id"], decision="UNKNOWN"
+                )
+                for candidate in found
+            ],
+            ignore_conflicts=True,
+        )
+        matching_ids = dict(
+            Matching.objects.filter(
+                user_id=user.id,
+                target_id__in=[candidate["user_id"] for candidate in found],
+            ).values_list("target_id", "id")
+        )
+        # precomputed candidates can name concerts deleted since
+        existing = set(
+            Concert.objects.filter(
+                pk__in=[pk for candidate in found for pk in candidate["concert_pks"]]
+            ).values_list("pk", flat=True)
+        )
+        Through.objects.filter(matching_id__in=matching_ids.values()).delete()
+        Through.objects.bulk_create(
+            [
+                Through(matching_id=matching_ids[candidate["user_id"]], concert_id=pk)
+                for candidate in found
+                for pk in candidate["concert_pks"]
+                if pk in existing
+            ]
+        )
+    return matching_ids
@@ -0,0 +1,205 @@
+"""
+Counters and latency histograms for upstream Ticketmaster traffic.
+
+Every process keeps its own running totals in memory and a background thread
+writes them to the shared Django cache at most every METRICS_FLUSH_INTERVAL
+seconds, so recording a metric costs no I/O on the request path, sync or
+async. snapshot() adds up the totals of all workers that flushed recently.
+
+Series are keyed "name|label=value|...". Upstream calls are labelled with
+the URL name of the view that made them (see ViewLabelMiddleware), or
+"background" for refreshes and prefetches.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in milliseconds of the upstream latency histogram buckets
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+WORKERS_KEY = "metrics:workers"
+# totals of a worker that stopped flushing are dropped after this long
+WORKER_TTL = 2 * 24 * 3600
+
+current_view = contextvars.ContextVar("metrics_view", default="background")
+
+
+def series(name, **labels):
+    """key of a series of name with labels"""
+    return "|".join([name] + [f"{label}={value}" for label, value in labels.items()])
+
+
+def parse_series(key):
+    """(name, labels) of a series key"""
+    name, *labels = key.split("|")
+    return name, dict(label.split("=", 1) for label in labels)
+
+
+def today():
+    """the UTC date the Ticketmaster quota is counted against"""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class Registry:
+    """Running totals of one process, periodically flushed to the cache"""
+
+    def __init__(self):
+        self.key = f"metrics:worker:{uuid.uuid4().hex}"
+        self.lock = threading.Lock()
+        self.totals = defaultdict(int)
+        self.flushed_at = time.monotonic()
+        self.flushing = False
+
+    def add(self, key, amount=1):
+        """add amount to a series"""
+        with self.lock:
+            self.totals[key] += amount
+            if self.flushing:
+                return
+            elapsed = time.monotonic() - self.flushed_at
+            self.flushing = elapsed >= settings.METRICS_FLUSH_INTERVAL
+            if not self.flushing:
+                return
+        threading.Thread(target=self.flush_in_background, daemon=True).start()
+
+    def flush_in_background(self):
+        """flush from a thread of its own, releasing its database connection"""
+        try:
+            self.flush()
+        finally:
+            self.flushing = False
+            connection.close()
+
+    def flush(self):
+        """write this process's totals to the shared cache"""
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            day = today()
+            for key in [key for key in self.totals if key.startswith("quota|")]:
+                if not key.endswith(f"day={day}"):
+                    del self.totals[key]
+            totals = dict(self.totals)
+        try:
+            cache.set(self.key, totals, WORKER_TTL)
+            # a racing worker may drop us from the set, the next flush re-adds
+            workers = cache.get(WORKERS_KEY, set())
+            if self.key not in workers:
+                cache.set(WORKERS_KEY, workers | {self.key}, None)
+        except Exception as e:
+            logger.warning("Could not flush metrics: %s", str(e))
+
+    def reset(self):
+        """forget this process's totals"""
+        with self.lock:
+            self.totals.clear()
+
+
+registry = Registry()
+
+
+def observe_upstream(path, status, elapsed, attempts=1):
+    """record one upstream call: its final status, its latency in seconds,
+    and the attempts it took, which all count against the daily quota"""
+    view = current_view.get()
+    registry.add(series("upstream_requests", view=view, path=path, status=status))
+    if attempts > 1:
+        registry.add(series("upstream_retries", path=path), attempts - 1)
+    registry.add(series("quota", day=today()), attempts)
+
+    elapsed_ms = int(elapsed * 1000)
+    registry.add(series("upstream_latency_ms_sum", path=path), elapsed_ms)
+    registry.add(series("upstream_latency_ms_count", path=path))
+    for bound in LATENCY_BUCKETS_MS:
+        if elapsed_ms <= bound:
+            registry.add(series("upstream_latency_ms_bucket", path=path, le=bound))
+
+
+def observe_rejected(path):
+    """record a call the open circuit breaker did not let through"""
+    view = current_view.get()
+    registry.add(
+        series("upstream_requests", view=view, path=path, status="circuit_open")
+    )
+
+
+def observe_cache(name, hits=0, misses=0, stale=0):
+    """record lookups in one of the caches in front of Ticketmaster"""
+    for result, count in (("hit", hits), ("miss", misses), ("stale", stale)):
+        if count:
+            registry.add(series("cache_lookups", cache=name, result=result), count)
+
+
+def snapshot():
+    """totals across all workers, with the running daily quota tally"""
+    registry.flush()
+    workers = cache.get(WORKERS_KEY, set())
+    flushed = cache.get_many(list(workers))
+    if len(flushed) < len(workers):
+        cache.set(WORKERS_KEY, set(flushed), None)
+
+    totals = defaultdict(int)
+    for worker_totals in flushed.values():
+        for key, value in worker_totals.items():
+            totals[key] += value
+
+    used = totals.pop(series("quota", day=today()), 0)
+    metrics = []
+    for key in sorted(totals):
+        if key.startswith("quota|"):
+            continue
+        name, labels = parse_series(key)
+        metrics.append({"name": name, "labels": labels, "value": totals[key]})
+    return {
+        "metrics": metrics,
+        "quota": {
+            "day": today(),
+            "used": used,
+            "limit": settings.TICKETMASTER_DAILY_QUOTA,
+            "remaining": max(settings.TICKETMASTER_DAILY_QUOTA - used, 0),
+        },
+    }
+
+
+class ViewLabelMiddleware:
+    """label upstream calls made while serving a request with its URL name,
+    natively under both WSGI and ASGI so async views keep their thread free"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_view.set(current_view.get())
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    async def __acall__(self, request):
+        """async __call__()"""
+        token = current_view.set(current_view.get())
+        try:
+            return await self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """label the rest of the request once the view is resolved"""
+        current_view.set(request.resolver_match.url_name or "unnamed")
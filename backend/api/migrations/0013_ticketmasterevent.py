@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_matching_matched_concerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketmasterEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=200, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_ticketmasterevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scope", models.CharField(max_length=200, unique=True)),
+                ("synced_at", models.DateTimeField(blank=True, null=True)),
+                ("high_water_mark", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="attractions",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="city",
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="genre",
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="local_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="name",
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="starts_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="venue_id",
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="venue_name",
+            field=models.CharField(blank=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS api_tmevent_search_vector_gin "
+    "ON api_ticketmasterevent USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS api_tmevent_name_trgm "
+    "ON api_ticketmasterevent USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS api_tmevent_attractions_trgm "
+    "ON api_ticketmasterevent USING gin (attractions gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS api_tmevent_venue_name_trgm "
+    "ON api_ticketmasterevent USING gin (venue_name gin_trgm_ops)",
+]
+
+DROP_SEARCH_INDEXES = [
+    "DROP INDEX IF EXISTS api_tmevent_search_vector_gin",
+    "DROP INDEX IF EXISTS api_tmevent_name_trgm",
+    "DROP INDEX IF EXISTS api_tmevent_attractions_trgm",
+    "DROP INDEX IF EXISTS api_tmevent_venue_name_trgm",
+]
+
+POPULATE_SEARCH_VECTORS = """
+UPDATE api_ticketmasterevent SET search_vector =
+    setweight(to_tsvector(coalesce(name, '')), 'A')
+    || setweight(to_tsvector(coalesce(attractions, '')), 'A')
+    || setweight(to_tsvector(coalesce(venue_name, '')), 'B')
+    || setweight(to_tsvector(coalesce(genre, '')), 'C')
+"""
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN and trigram indexes only exist on Postgres"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for statement in SEARCH_INDEXES + [POPULATE_SEARCH_VECTORS]:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for statement in DROP_SEARCH_INDEXES:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_ticketmasterevent_metadata_synccheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticketmasterevent",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
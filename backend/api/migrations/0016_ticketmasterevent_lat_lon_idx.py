@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_ticketmasterevent_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ticketmasterevent",
+            index=models.Index(
+                fields=["latitude", "longitude"], name="api_tmevent_lat_lon_idx"
+            ),
+        ),
+    ]
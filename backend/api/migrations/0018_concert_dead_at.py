@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0017_userprofile_versions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="concert",
+            name="dead_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
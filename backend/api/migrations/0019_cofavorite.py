@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:17
+
+from collections import defaultdict
+from itertools import groupby, permutations
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_co_favorites(apps, schema_editor):
+    """count the concerts every pair of users already favorited together"""
+    FavoriteConcert = apps.get_model("api", "FavoriteConcert")
+    CoFavorite = apps.get_model("api", "CoFavorite")
+    Through = CoFavorite.shared_concerts.through
+
+    shared = defaultdict(list)
+    favorites = FavoriteConcert.objects.order_by("concert_id").values_list(
+        "concert_id", "user_id"
+    )
+    for concert_id, rows in groupby(favorites.iterator(), key=lambda row: row[0]):
+        fans = [user_id for _concert_id, user_id in rows]
+        for pair in permutations(fans, 2):
+            shared[pair].append(concert_id)
+
+    CoFavorite.objects.bulk_create(
+        [
+            CoFavorite(user_id=user_id, other_id=other_id, shared_count=len(concerts))
+            for (user_id, other_id), concerts in shared.items()
+        ],
+        batch_size=1000,
+    )
+    ids = {
+        (user_id, other_id): pk
+        for pk, user_id, other_id in CoFavorite.objects.values_list(
+            "id", "user_id", "other_id"
+        )
+    }
+    Through.objects.bulk_create(
+        [
+            Through(cofavorite_id=ids[pair], concert_id=concert_id)
+            for pair, concerts in shared.items()
+            for concert_id in concerts
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0018_concert_dead_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CoFavorite",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shared_count", models.PositiveIntegerField(default=0)),
+                (
+                    "other",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "shared_concerts",
+                    models.ManyToManyField(related_name="+", to="api.concert"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="co_favorites",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-shared_count"],
+                        name="api_cofav_user_count_idx",
+                    )
+                ],
+                "unique_together": {("user", "other")},
+            },
+        ),
+        migrations.RunPython(backfill_co_favorites, migrations.RunPython.noop),
+    ]
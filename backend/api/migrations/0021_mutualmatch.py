@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_mutual_matches(apps, schema_editor):
+    """record the users who already said yes to each other"""
+    Matching = apps.get_model("api", "Matching")
+    MutualMatch = apps.get_model("api", "MutualMatch")
+
+    yes = Matching.objects.filter(decision="YES")
+    said_yes = {
+        (user_id, target_id): pk
+        for pk, user_id, target_id in yes.values_list("id", "user_id", "target_id")
+    }
+    MutualMatch.objects.bulk_create(
+        [
+            MutualMatch(user_id=target_id, other_id=user_id, matching_id=pk)
+            for (user_id, target_id), pk in said_yes.items()
+            if (target_id, user_id) in said_yes
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0020_matchcandidate"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MutualMatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("matched_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "matching",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="api.matching",
+                    ),
+                ),
+                (
+                    "other",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mutual_matches",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-matched_at"], name="api_mutual_user_time_idx"
+                    )
+                ],
+                "unique_together": {("user", "other")},
+            },
+        ),
+        migrations.RunPython(backfill_mutual_matches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0022_userprofile_favorites_changed_at"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="synccheckpoint",
+            name="high_water_mark",
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:59
+
+from django.db import migrations
+
+# search only matches trigrams of the name, attractions and venue names are
+# searched through the tsvector
+UNUSED_INDEXES = {
+    "api_tmevent_attractions_trgm": "attractions",
+    "api_tmevent_venue_name_trgm": "venue_name",
+}
+
+
+def drop_unused_indexes(apps, schema_editor):
+    """trigram indexes only exist on Postgres"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in UNUSED_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def create_unused_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, column in UNUSED_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} "
+            f"ON api_ticketmasterevent USING gin ({column} gin_trgm_ops)"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0023_remove_synccheckpoint_high_water_mark"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_unused_indexes, create_unused_indexes),
+    ]
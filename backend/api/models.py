@@ -2,12 +2,16 @@
 Provides some arithmetic functions
 """
 
+import hashlib
+import json
 import secrets
 from datetime import timedelta
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 MATCHING_DECISIONS = [("YES", "YES"), ("NO", "NO"), ("UNKNOWN", "UNKNOWN")]
 
@@ -42,6 +46,111 @@ class Concert(models.Model):
     users_favorited = models.ManyToManyField(
         User, through="FavoriteConcert", related_name="favourite_concerts"
     )
+    # set by the reap_concerts command once Ticketmaster no longer knows the
+    # event, dead concerts are no longer looked up for favorites
+    dead_at = models.DateTimeField(null=True, blank=True)
+
+
+class TicketmasterEvent(models.Model):
+    """Model to store Ticketmaster event payloads keyed by their event id,
+    with the fields concert listings filter on copied into columns"""
+
+    event_id = models.CharField(max_length=200, unique=True)
+    data = models.JSONField(default=dict)
+    fetched_at = models.DateTimeField(default=timezone.now)
+    content_hash = models.CharField(max_length=64, blank=True)
+    name = models.CharField(max_length=500, blank=True)
+    starts_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    local_date = models.DateField(null=True, blank=True)
+    venue_id = models.CharField(max_length=200, blank=True, db_index=True)
+    venue_name = models.CharField(max_length=500, blank=True)
+    city = models.CharField(max_length=200, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    attractions = models.TextField(blank=True)
+    genre = models.CharField(max_length=200, blank=True)
+    # maintained by api.search.refresh_search_vectors, only used on Postgres
+    search_vector = SearchVectorField(null=True, blank=True)
+
+    # columns rewritten whenever a payload is stored
+    PAYLOAD_FIELDS = [
+        "data",
+        "fetched_at",
+        "content_hash",
+        "name",
+        "starts_at",
+        "local_date",
+        "venue_id",
+        "venue_name",
+        "city",
+        "latitude",
+        "longitude",
+        "attractions",
+        "genre",
+    ]
+
+    class Meta:
+        """Meta class for TicketmasterEvent"""
+
+        indexes = [
+            models.Index(
+                fields=["latitude", "longitude"], name="api_tmevent_lat_lon_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.event_id)
+
+    @staticmethod
+    def hash_payload(data):
+        """stable digest of an event payload, used to skip unchanged events"""
+        encoded = json.dumps(data, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_payload(cls, event_id, data, fetched_at=None):
+        """Build an unsaved row with its columns extracted from the payload"""
+        start = data.get("dates", {}).get("start", {})
+        venues = data.get("_embedded", {}).get("venues") or [{}]
+        venue = venues[0]
+        location = venue.get("location", {})
+        attractions = data.get("_embedded", {}).get("attractions", [])
+        classifications = data.get("classifications") or [{}]
+
+        def to_float(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+
+        return cls(
+            event_id=event_id,
+            data=data,
+            fetched_at=fetched_at or timezone.now(),
+            content_hash=cls.hash_payload(data),
+            name=data.get("name", "")[:500],
+            starts_at=parse_datetime(start.get("dateTime") or ""),
+            local_date=parse_date(start.get("localDate") or ""),
+            venue_id=venue.get("id", ""),
+            venue_name=venue.get("name", "")[:500],
+            city=venue.get("city", {}).get("name", ""),
+            latitude=to_float(location.get("latitude")),
+            longitude=to_float(location.get("longitude")),
+            attractions=" ".join(
+                attraction.get("name", "") for attraction in attractions
+            ),
+            genre=classifications[0].get("genre", {}).get("name", ""),
+        )
+
+
+class SyncCheckpoint(models.Model):
+    """Model to store how far a catalog sync scope has been mirrored"""
+
+    scope = models.CharField(max_length=200, unique=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.scope)
 
 
 class FavoriteConcert(models.Model):
@@ -57,6 +166,52 @@ class FavoriteConcert(models.Model):
         unique_together = ("user", "concert")
 
 
+class CoFavorite(models.Model):
+    """Concerts favorited by both user and other, kept current by api.signals.
+    Every pair is stored in both directions so that the candidates of a user
+    are one indexed range scan"""
+
+    user = models.ForeignKey(
+        User, related_name="co_favorites", on_delete=models.CASCADE
+    )
+    other = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    shared_count = models.PositiveIntegerField(default=0)
+    shared_concerts = models.ManyToManyField(Concert, related_name="+")
+
+    class Meta:
+        """Meta class for CoFavorite"""
+
+        unique_together = ("user", "other")
+        indexes = [
+            models.Index(
+                fields=["user", "-shared_count"], name="api_cofav_user_count_idx"
+            )
+        ]
+
+
+class MatchCandidate(models.Model):
+    """Candidate other for user with its score, written for every user by the
+    recompute_matchings command. concerts holds [pk, concert_id] of each
+    concert they share"""
+
+    user = models.ForeignKey(
+        User, related_name="match_candidates", on_delete=models.CASCADE
+    )
+    other = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    score = models.FloatField()
+    shared_count = models.PositiveIntegerField()
+    concerts = models.JSONField(default=list)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        """Meta class for MatchCandidate"""
+
+        unique_together = ("user", "other")
+        indexes = [
+            models.Index(fields=["user", "-score"], name="api_matchcand_score_idx")
+        ]
+
+
 class TemporaryRegistration(models.Model):
     """Model to store temporary registration details"""
 
@@ -87,6 +242,29 @@ class Matching(models.Model):
         unique_together = ("user", "target")
 
 
+class MutualMatch(models.Model):
+    """user and other said yes to each other, kept current by api.signals.
+    Every match is stored in both directions and points at the Matching of
+    other with user, whose concerts are shown"""
+
+    user = models.ForeignKey(
+        User, related_name="mutual_matches", on_delete=models.CASCADE
+    )
+    other = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    matching = models.ForeignKey(Matching, related_name="+", on_delete=models.CASCADE)
+    matched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        """Meta class for MutualMatch"""
+
+        unique_together = ("user", "other")
+        indexes = [
+            models.Index(
+                fields=["user", "-matched_at"], name="api_mutual_user_time_idx"
+            ),
+        ]
+
+
 class UserProfile(models.Model):
     """Extended user profile model"""
 
@@ -99,6 +277,14 @@ class UserProfile(models.Model):
     favorite_artists = models.ManyToManyField("Artist", related_name="favorited_by")
     favorite_genres = models.ManyToManyField("Genre", related_name="favorited_by")
     user_socials = models.JSONField(default=dict)  # Stores socials as a JSON object
+    # bumped by api.signals whenever the data behind an endpoint changes, and
+    # used to build the ETags of favorites, matchings and matches
+    favorites_version = models.PositiveIntegerField(default=0)
+    matchings_version = models.PositiveIntegerField(default=0)
+    matches_version = models.PositiveIntegerField(default=0)
+    # last favorite or unfavorite, tells whether precomputed candidates of the
+    # user, or of anyone sharing concerts with them, are out of date
+    favorites_changed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -0,0 +1,107 @@
+"""
+Weighted similarity ranking of matching candidates.
+
+A candidate's score is a weighted sum of its similarity to the user over
+three kinds of items: favorited concerts, favorite artists and favorite
+genres, with the weights in MATCHING_WEIGHTS. Similarities are Jaccard or
+cosine (MATCHING_SIMILARITY) and are computed for all candidates at once
+from a binary user x item matrix, one matrix product per kind of item.
+"""
+
+import math
+
+import numpy as np
+from django.conf import settings
+
+from .models import FavoriteConcert, UserProfile
+
+ArtistThrough = UserProfile.favorite_artists.through
+GenreThrough = UserProfile.favorite_genres.through
+
+
+def item_pairs(user_ids):
+    """(user id, item id) pairs of every kind of item for user_ids"""
+    return {
+        "concerts": FavoriteConcert.objects.filter(user_id__in=user_ids).values_list(
+            "user_id", "concert_id"
+        ),
+        "artists": ArtistThrough.objects.filter(
+            userprofile__user_id__in=user_ids
+        ).values_list("userprofile__user_id", "artist_id"),
+        "genres": GenreThrough.objects.filter(
+            userprofile__user_id__in=user_ids
+        ).values_list("userprofile__user_id", "genre_id"),
+    }
+
+
+def pair_similarity(intersection, sizes_a, sizes_b, method="jaccard"):
+    """elementwise Jaccard or cosine similarity of item sets from the sizes
+    of their intersections and of the sets themselves"""
+    intersection = np.asarray(intersection, dtype=np.float64)
+    sizes_a = np.asarray(sizes_a, dtype=np.float64)
+    sizes_b = np.asarray(sizes_b, dtype=np.float64)
+    if method == "cosine":
+        norm = np.sqrt(sizes_a * sizes_b)
+    else:
+        norm = sizes_a + sizes_b - intersection
+    return np.divide(
+        intersection, norm, out=np.zeros_like(intersection), where=norm > 0
+    )
+
+
+def item_counts(user_id):
+    """number of items of every kind user_id holds"""
+    return {kind: pairs.count() for kind, pairs in item_pairs([user_id]).items()}
+
+
+def score_bound(shared_count, own_counts):
+    """highest score a candidate sharing shared_count concerts can reach with
+    a user holding own_counts items of every kind"""
+    bound = 0.0
+    for kind, weight in settings.MATCHING_WEIGHTS.items():
+        if not weight or not own_counts.get(kind):
+            continue
+        if kind != "concerts":
+            bound += weight
+            continue
+        # the candidate holds at least the shared concerts, so the Jaccard
+        # and cosine similarities are at most shared / own and its root
+        fraction = min(shared_count / own_counts[kind], 1.0)
+        if settings.MATCHING_SIMILARITY == "cosine":
+            fraction = math.sqrt(fraction)
+        bound += weight * fraction
+    return bound
+
+
+def similarity(user_ids, pairs, method="jaccard"):
+    """similarity of every user in user_ids to the first one, from the
+    (user id, item id) pairs they hold, as an array in user_ids order"""
+    rows = {user_id: i for i, user_id in enumerate(user_ids)}
+    pairs = np.array(
+        [(rows[user_id], item_id) for user_id, item_id in pairs], dtype=np.int64
+    ).reshape(-1, 2)
+    sizes = np.bincount(pairs[:, 0], minlength=len(user_ids)).astype(np.float64)
+
+    # only the first user's items can be shared, so they are the only columns
+    own_items = np.unique(pairs[pairs[:, 0] == 0, 1])
+    shared = pairs[np.isin(pairs[:, 1], own_items)]
+    matrix = np.zeros((len(user_ids), len(own_items)), dtype=np.float64)
+    matrix[shared[:, 0], np.searchsorted(own_items, shared[:, 1])] = 1.0
+    return pair_similarity(matrix @ matrix[0], sizes, sizes[0], method)
+
+
+def rank(user, found):
+    """candidates in found with their "score", best first"""
+    if not found:
+        return found
+    user_ids = [user.id] + [candidate["user_id"] for candidate in found]
+    scores = np.zeros(len(user_ids))
+    for kind, pairs in item_pairs(user_ids).items():
+        weight = settings.MATCHING_WEIGHTS.get(kind, 0)
+        if weight:
+            scores += weight * similarity(user_ids, pairs, settings.MATCHING_SIMILARITY)
+
+    for candidate, score in zip(found, scores[1:]):
+        candidate["score"] = round(float(score), 4)
+    # stable, so ties keep the shared concert order of candidates()
+    return sorted(found, key=lambda candidate: -candidate["score"])
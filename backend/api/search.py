@@ -0,0 +1,138 @@
+"""
+Local full-text search over the mirrored Ticketmaster catalog.
+
+On Postgres, events are matched against a weighted tsvector over name,
+attractions, venue and genre, or on the name alone by trigram similarity for
+typos (pg_trgm's % operator, at its similarity_threshold), each predicate
+answered by a GIN index and the matches ranked afterwards. Other databases (SQLite in tests and local
+development) use a small in-process engine that pre-filters with LIKE and
+ranks the candidates by weighted token hits.
+"""
+
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from .models import SyncCheckpoint, TicketmasterEvent
+
+# weight of a query token found in each searchable column
+FIELD_WEIGHTS = {"name": 3, "attractions": 3, "venue_name": 2, "genre": 1}
+# candidates ranked in-process by the fallback engine
+FALLBACK_CANDIDATES = 2000
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def is_postgres():
+    """whether the default database supports tsvector and trigram search"""
+    return connection.vendor == "postgresql"
+
+
+def recent_syncs():
+    """checkpoints of the scopes fetch_concerts synced within
+    CONCERT_MIRROR_MAX_AGE"""
+    max_age = timedelta(seconds=settings.CONCERT_MIRROR_MAX_AGE)
+    return SyncCheckpoint.objects.filter(synced_at__gte=timezone.now() - max_age)
+
+
+def mirror_synced_since():
+    """start of the oldest recent sync, every event still listed upstream then
+    has been fetched since, or None when no scope was synced recently"""
+    return recent_syncs().aggregate(synced_since=Min("synced_at"))["synced_since"]
+
+
+def mirror_available():
+    """whether fetch_concerts has completed a sync recently"""
+    return recent_syncs().exists()
+
+
+def upcoming_events():
+    """mirrored events that have not started yet, leaving out those the recent
+    syncs no longer saw, such as cancelled ones"""
+    now = timezone.now()
+    synced_since = mirror_synced_since()
+    if synced_since is None:
+        return TicketmasterEvent.objects.none()
+    return TicketmasterEvent.objects.filter(
+        Q(starts_at__gte=now) | Q(starts_at__isnull=True, local_date__gte=now.date()),
+        fetched_at__gte=synced_since,
+    )
+
+
+def refresh_search_vectors(event_ids):
+    """recompute the tsvector of the given events on Postgres"""
+    if not is_postgres() or not event_ids:
+        return
+    from django.contrib.postgres.search import SearchVector
+
+    TicketmasterEvent.objects.filter(event_id__in=event_ids).update(
+        search_vector=SearchVector("name", weight="A")
+        + SearchVector("attractions", weight="A")
+        + SearchVector("venue_name", weight="B")
+        + SearchVector("genre", weight="C")
+    )
+
+
+def rank_events(query, queryset=None):
+    """events matching query, best match first"""
+    queryset = upcoming_events() if queryset is None else queryset
+    if is_postgres():
+        return _postgres_rank(queryset, query)
+    return _fallback_rank(queryset, query)
+
+
+def search_events(query, offset=0, limit=20, queryset=None):
+    """return (payloads, has_more) for a page of the events matching query"""
+    rows = list(rank_events(query, queryset)[offset : offset + limit + 1])
+    return [row.data for row in rows[:limit]], len(rows) > limit
+
+
+def _postgres_rank(queryset, query):
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                TrigramSimilarity)
+
+    search_query = SearchQuery(query, search_type="websearch")
+    # both predicates are answered by a GIN index, the rank only orders them
+    return (
+        queryset.filter(
+            Q(search_vector=search_query) | Q(TrigramSimilar(F("name"), query))
+        )
+        .annotate(
+            rank=SearchRank(F("search_vector"), search_query)
+            + TrigramSimilarity("name", query)
+        )
+        .order_by("-rank", "starts_at")
+    )
+
+
+def _fallback_rank(queryset, query):
+    tokens = [token.lower() for token in TOKEN_RE.findall(query)]
+    if not tokens:
+        return []
+    for token in tokens:
+        queryset = queryset.filter(
+            Q(name__icontains=token)
+            | Q(attractions__icontains=token)
+            | Q(venue_name__icontains=token)
+            | Q(genre__icontains=token)
+        )
+
+    def score(row):
+        return sum(
+            weight * getattr(row, field).lower().count(token)
+            for field, weight in FIELD_WEIGHTS.items()
+            for token in tokens
+        )
+
+    candidates = queryset.only(
+        "data", "starts_at", "latitude", "longitude", *FIELD_WEIGHTS
+    )[:FALLBACK_CANDIDATES]
+    return sorted(
+        candidates,
+        key=lambda row: (-score(row), row.starts_at is None, row.starts_at),
+    )
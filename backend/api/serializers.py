@@ -9,6 +9,9 @@ from .models import Artist, Concert, FavoriteConcert, Genre, UserProfile
 
 User = get_user_model()
 
+# Venue keys kept in the compact event representation.
+COMPACT_VENUE_FIELDS = ("id", "name", "city", "state", "address", "location")
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     """register serializer"""
@@ -107,3 +110,47 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("id", "username", "email", "profile")
+
+
+def best_image(images):
+    """pick the widest non-fallback image, falling back to the widest image"""
+    if not images:
+        return None
+    return max(
+        images, key=lambda image: (not image.get("fallback"), image.get("width", 0))
+    )
+
+
+def compact_event(event, fields=()):
+    """Reduce a raw Ticketmaster event to the keys the client renders.
+    Top level keys listed in fields are copied from the raw event as is,
+    and "all" returns the raw event untouched."""
+    if "all" in fields:
+        return event
+
+    compact = {
+        key: event[key]
+        for key in ("id", "name", "url", "info", "priceRanges")
+        if key in event
+    }
+    image = best_image(event.get("images"))
+    compact["images"] = [image] if image else []
+    if "dates" in event:
+        compact["dates"] = {
+            key: event["dates"][key]
+            for key in ("start", "status")
+            if key in event["dates"]
+        }
+    venues = event.get("_embedded", {}).get("venues")
+    if venues:
+        compact["_embedded"] = {
+            "venues": [
+                {key: venue[key] for key in COMPACT_VENUE_FIELDS if key in venue}
+                for venue in venues
+            ]
+        }
+
+    for field in fields:
+        if field in event:
+            compact[field] = event[field]
+    return compact
@@ -1,17 +1,294 @@
 """
-Create or get user profile when user is created/saved
+Create or get user profile when user is created/saved, keep the per-user
+versions behind the favorites, matchings and matches ETags current, and
+maintain the CoFavorite overlap table as favorites come and go and the
+MutualMatch table as decisions are made
 """
 
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 
-from .models import UserProfile
+from .models import (
+    CoFavorite,
+    Concert,
+    FavoriteConcert,
+    Matching,
+    MutualMatch,
+    UserProfile,
+)
 
 User = get_user_model()
 
 
+def bump_versions(user_ids, *fields):
+    """Increment the given version counters on the profiles of user_ids"""
+    UserProfile.objects.filter(user_id__in=user_ids).update(
+        **{field: F(field) + 1 for field in fields}
+    )
+
+
 @receiver(post_save, sender=User)
 def create_or_get_user_profile(instance, **kwargs):
     """Create or get user profile when user is created/saved"""
     UserProfile.objects.get_or_create(user=instance)
+
+
+def bump_profile_versions(user_id):
+    """Bump the versions of everyone whose matchings or matches embed or are
+    ranked by the profile of user_id"""
+    bump_versions([user_id], "matchings_version")
+    related = Matching.objects.filter(
+        Q(user_id=user_id) | Q(target_id=user_id)
+    ).values_list("user_id", "target_id")
+    user_ids = {related_id for pair in related for related_id in pair}
+    user_ids.discard(user_id)
+    if user_ids:
+        bump_versions(user_ids, "matchings_version", "matches_version")
+    # Live candidates are ranked by their artists and genres too
+    co_fans = CoFavorite.objects.filter(other_id=user_id, shared_count__gt=0)
+    bump_versions(
+        co_fans.exclude(user_id__in=user_ids).values("user_id"), "matchings_version"
+    )
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_changed(instance, created, **kwargs):
+    """Profiles are embedded in the matchings and matches of related users,
+    and their artists and genres rank the owner's matchings and the live
+    candidates of their co-fans"""
+    if created:
+        return
+    bump_profile_versions(instance.user_id)
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_artists.through)
+@receiver(m2m_changed, sender=UserProfile.favorite_genres.through)
+def profile_items_changed(instance, action, reverse, pk_set, **kwargs):
+    """Artists and genres are set after the profile is saved, so their
+    changes bump the same versions as a profile save"""
+    if reverse and action == "pre_clear":
+        # pk_set is None on clear, so note the profiles before they are gone
+        instance.cleared_profiles = set(
+            instance.favorited_by.values_list("pk", flat=True)
+        )
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        bump_profile_versions(instance.user_id)
+        return
+    if action == "post_clear":
+        pk_set = instance.cleared_profiles
+    profiles = UserProfile.objects.filter(pk__in=pk_set)
+    for user_id in profiles.values_list("user_id", flat=True):
+        bump_profile_versions(user_id)
+
+
+@receiver(post_save, sender=FavoriteConcert)
+@receiver(post_delete, sender=FavoriteConcert)
+def favorite_changed(instance, **kwargs):
+    """A favorite changes its owner's favorites and the candidate matchings
+    of everyone else who favorited the same concert"""
+    UserProfile.objects.filter(user_id=instance.user_id).update(
+        favorites_version=F("favorites_version") + 1,
+        favorites_changed_at=timezone.now(),
+    )
+    fans = FavoriteConcert.objects.filter(concert_id=instance.concert_id)
+    bump_versions(
+        list(fans.values_list("user_id", flat=True)) + [instance.user_id],
+        "matchings_version",
+    )
+
+
+@receiver(post_save, sender=Matching)
+@receiver(post_delete, sender=Matching)
+def matching_changed(instance, created=False, **kwargs):
+    """Decisions hide matchings from their owner and can make a match for
+    both users; freshly created undecided matchings change neither"""
+    if created and instance.decision == "UNKNOWN":
+        return
+    bump_versions([instance.user_id], "matchings_version")
+    bump_versions([instance.user_id, instance.target_id], "matches_version")
+
+
+@receiver(post_save, sender=Matching)
+def mutual_match_changed(instance, created, **kwargs):
+    """Record a mutual match both ways once both users said yes, and drop it
+    when either takes their yes back"""
+    if created and instance.decision == "UNKNOWN":
+        return
+    with transaction.atomic():
+        pair = MutualMatch.objects.filter(
+            Q(user_id=instance.user_id, other_id=instance.target_id)
+            | Q(user_id=instance.target_id, other_id=instance.user_id)
+        )
+        reciprocal = (
+            Matching.objects.filter(
+                user_id=instance.target_id, target_id=instance.user_id, decision="YES"
+            )
+            .values_list("id", flat=True)
+            .first()
+        )
+        if instance.decision != "YES" or reciprocal is None:
+            pair.delete()
+            return
+        matched_at = timezone.now()
+        MutualMatch.objects.bulk_create(
+            [
+                MutualMatch(
+                    user_id=instance.user_id,
+                    other_id=instance.target_id,
+                    matching_id=reciprocal,
+                    matched_at=matched_at,
+                ),
+                MutualMatch(
+                    user_id=instance.target_id,
+                    other_id=instance.user_id,
+                    matching_id=instance.id,
+                    matched_at=matched_at,
+                ),
+            ],
+            ignore_conflicts=True,
+        )
+
+
+@receiver(post_delete, sender=Matching)
+def mutual_match_removed(instance, **kwargs):
+    """A match needs both decisions, drop it both ways with either"""
+    MutualMatch.objects.filter(
+        Q(user_id=instance.user_id, other_id=instance.target_id)
+        | Q(user_id=instance.target_id, other_id=instance.user_id)
+    ).delete()
+
+
+SharedConcert = CoFavorite.shared_concerts.through
+
+
+def co_favorite_pairs(user_id, other_ids):
+    """CoFavorite rows between user_id and other_ids, in both directions"""
+    return CoFavorite.objects.filter(
+        Q(user_id=user_id, other_id__in=other_ids)
+        | Q(user_id__in=other_ids, other_id=user_id)
+    )
+
+
+def concert_fans(favorite):
+    """ids of the other fans of a favorite's concert, once the concert row is
+    locked so that favorites of the same concert change overlaps one at a time"""
+    list(
+        Concert.objects.select_for_update()
+        .filter(pk=favorite.concert_id)
+        .values_list("pk", flat=True)
+    )
+    return list(
+        FavoriteConcert.objects.filter(concert_id=favorite.concert_id)
+        .exclude(user_id=favorite.user_id)
+        .values_list("user_id", flat=True)
+    )
+
+
+def lock_co_favorites(pairs):
+    """lock the CoFavorite rows of pairs in id order, returning their ids, so
+    that changes to the same pair through different concerts are recounted
+    one at a time"""
+    return list(pairs.select_for_update().order_by("id").values_list("id", flat=True))
+
+
+def recount_co_favorites(pair_ids):
+    """set shared_count of the pairs from their shared concerts, rather than
+    adjusting it, so that it cannot drift from them"""
+    shared = (
+        SharedConcert.objects.filter(cofavorite_id=OuterRef("pk"))
+        .order_by()
+        .values("cofavorite_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    CoFavorite.objects.filter(id__in=pair_ids).update(
+        shared_count=Coalesce(Subquery(shared), 0)
+    )
+
+
+def uncount_concert(concert_id, pair_ids):
+    """remove a concert from the overlaps of the locked pairs, dropping pairs
+    that no longer share any concert"""
+    removed = list(
+        SharedConcert.objects.filter(
+            cofavorite_id__in=pair_ids, concert_id=concert_id
+        ).values_list("cofavorite_id", flat=True)
+    )
+    if not removed:
+        return
+    SharedConcert.objects.filter(
+        cofavorite_id__in=removed, concert_id=concert_id
+    ).delete()
+    recount_co_favorites(removed)
+    CoFavorite.objects.filter(id__in=removed, shared_count=0).delete()
+
+
+@receiver(post_save, sender=FavoriteConcert)
+def co_favorite_added(instance, created, **kwargs):
+    """Count the new favorite towards its owner's overlap with every other
+    fan of the concert, in time proportional to the concert's popularity"""
+    if not created:
+        return
+
+    with transaction.atomic():
+        fans = concert_fans(instance)
+        if not fans:
+            return
+        CoFavorite.objects.bulk_create(
+            [
+                CoFavorite(user_id=user_id, other_id=other_id)
+                for fan in fans
+                for user_id, other_id in (
+                    (instance.user_id, fan),
+                    (fan, instance.user_id),
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        pair_ids = lock_co_favorites(co_favorite_pairs(instance.user_id, fans))
+        counted = set(
+            SharedConcert.objects.filter(
+                cofavorite_id__in=pair_ids, concert_id=instance.concert_id
+            ).values_list("cofavorite_id", flat=True)
+        )
+        added = [pair_id for pair_id in pair_ids if pair_id not in counted]
+        SharedConcert.objects.bulk_create(
+            [
+                SharedConcert(cofavorite_id=pair_id, concert_id=instance.concert_id)
+                for pair_id in added
+            ],
+            ignore_conflicts=True,
+        )
+        recount_co_favorites(added)
+
+
+@receiver(post_delete, sender=FavoriteConcert)
+def co_favorite_removed(instance, **kwargs):
+    """Take a removed favorite out of its owner's overlaps, dropping pairs
+    that no longer share any concert"""
+    with transaction.atomic():
+        fans = concert_fans(instance)
+        if not fans:
+            return
+        pair_ids = lock_co_favorites(co_favorite_pairs(instance.user_id, fans))
+        uncount_concert(instance.concert_id, pair_ids)
+
+
+@receiver(pre_delete, sender=Concert)
+def co_favorite_concert_deleted(instance, **kwargs):
+    """Deleting a concert cascades to its favorites and shared concert rows
+    in bulk, before co_favorite_removed could see the other fans, so take it
+    out of every overlap beforehand"""
+    with transaction.atomic():
+        shared = SharedConcert.objects.filter(concert_id=instance.pk)
+        pair_ids = lock_co_favorites(
+            CoFavorite.objects.filter(id__in=shared.values("cofavorite_id"))
+        )
+        uncount_concert(instance.pk, pair_ids)
@@ -0,0 +1,137 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+Concurrent callers asking for the same key wait on one in-flight call and
+share its result. SingleFlight does this between threads of a worker,
+AsyncSingleFlight between coroutines on an event loop, and shared_flight
+extends it across workers through the Django cache, which needs a cache
+backend shared by all workers (see CACHES in settings).
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+POLL_INTERVAL = 0.05
+
+
+class CoalescedCallFailed(Exception):
+    """Raised to followers when the call they waited on failed"""
+
+
+class _Call:
+    """An in-flight call that followers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key inside one process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        """run fn once for all concurrent callers of key and share its result"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Coalesces concurrent coroutine calls with the same key on one loop"""
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, fn):
+        """await fn() once for all concurrent callers of key and share its
+        result"""
+        loop = asyncio.get_running_loop()
+        call = self.calls.get((loop, key))
+        if call is not None:
+            return await asyncio.shield(call)
+
+        call = self.calls[(loop, key)] = loop.create_future()
+        try:
+            result = await fn()
+            call.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except Exception as e:
+            call.set_exception(e)
+            # mark the error retrieved when no follower was waiting for it
+            call.exception()
+            raise
+        finally:
+            del self.calls[(loop, key)]
+
+
+def canonical_key(*parts):
+    """stable digest of JSON-serializable parts, independent of dict ordering"""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def shared_flight(key, fn):
+    """run fn once across workers holding the shared cache lock for key,
+    workers that find the lock taken wait for the holder's result"""
+    wait = settings.TICKETMASTER_COALESCE_WAIT
+    lock_key = f"singleflight:lock:{key}"
+    token = uuid.uuid4().hex
+
+    if cache.add(lock_key, token, timeout=wait):
+        result_key = f"singleflight:result:{key}:{token}"
+        try:
+            result = fn()
+        except Exception:
+            cache.set(result_key, {"ok": False}, wait)
+            cache.delete(lock_key)
+            raise
+        cache.set(result_key, {"ok": True, "result": result}, wait)
+        cache.delete(lock_key)
+        return result
+
+    leader_token = cache.get(lock_key)
+    deadline = time.monotonic() + wait
+    while leader_token is not None and time.monotonic() < deadline:
+        outcome = cache.get(f"singleflight:result:{key}:{leader_token}")
+        if outcome is not None:
+            if not outcome["ok"]:
+                raise CoalescedCallFailed("coalesced upstream call failed")
+            return outcome["result"]
+        time.sleep(POLL_INTERVAL)
+
+    # the holder vanished or timed out, do the call ourselves
+    return fn()
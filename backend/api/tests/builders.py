@@ -0,0 +1,64 @@
+"""
+Builders for the Ticketmaster pages, events and responses the tests mock.
+"""
+
+import json
+import os
+from io import BytesIO
+
+from requests import Response
+
+RESPONSE_FILE = os.path.join(os.path.dirname(__file__), "ticketmaster_response.json")
+
+
+def canned_responses():
+    """the canned Ticketmaster bodies kept in ticketmaster_response.json"""
+    with open(RESPONSE_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def events_page(events, number=0, total_pages=1):
+    """a Ticketmaster page body containing events"""
+    return {
+        "page": {
+            "size": len(events),
+            "totalElements": len(events),
+            "totalPages": total_pages,
+            "number": number,
+        },
+        "_embedded": {"events": events},
+    }
+
+
+def upstream_response(body, status_code=200):
+    """a mocked Ticketmaster response answering with body"""
+    res = Response()
+    res.status_code = status_code
+    res.raw = BytesIO(json.dumps(body).encode("ascii"))
+    return res
+
+
+def upstream_page(events, number=0, total_pages=1):
+    """a mocked Ticketmaster response for a page of events"""
+    return upstream_response(events_page(events, number, total_pages))
+
+
+def music_event(event_id, name="Show", start="2030-01-01T00:00:00Z"):
+    """a minimal Ticketmaster music event"""
+    return {
+        "id": event_id,
+        "name": name,
+        "dates": {"start": {"localDate": start[:10], "dateTime": start}},
+        "classifications": [{"genre": {"name": "Rock"}}],
+        "_embedded": {
+            "venues": [
+                {
+                    "id": "venue-1",
+                    "name": "Hall",
+                    "city": {"name": "Waterloo"},
+                    "location": {"latitude": "43.46", "longitude": "-80.52"},
+                }
+            ],
+            "attractions": [{"name": "The Band"}],
+        },
+    }
@@ -3,13 +3,24 @@
 # pylint: disable=W0621
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from rest_framework.test import APIClient
 
+from .. import metrics, ticketmaster
 from ..models import EmailVerificationToken
 
 User = get_user_model()
 
 
+@pytest.fixture(autouse=True)
+def reset_ticketmaster_state():
+    """Start every test with a closed Ticketmaster circuit, an empty cache
+    and no recorded metrics."""
+    ticketmaster.breaker.reset()
+    metrics.registry.reset()
+    cache.clear()
+
+
 @pytest.fixture
 def api_client():
     """Return a Django REST framework APIClient instance."""
@@ -0,0 +1,201 @@
+"""
+Test cases for the async concert views.
+"""
+
+# pylint: disable=W0621
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+from django.test import Client
+from django.urls import reverse
+from knox.models import AuthToken
+
+from .. import ticketmaster
+from ..models import Concert, FavoriteConcert, TicketmasterEvent
+from ..serializers import compact_event
+from ..views.concert_views import MAX_CONCERT_IDS
+from .builders import canned_responses, events_page
+
+
+@pytest.fixture
+def populated_response():
+    """The canned Ticketmaster listing used across the concert tests"""
+    return canned_responses()["populated_response"]
+
+
+@pytest.fixture
+def cookie_client(test_user):
+    """A plain Django client carrying a knox token cookie for test_user"""
+    client = Client()
+    _instance, token = AuthToken.objects.create(user=test_user)
+    client.cookies["knox_token"] = token
+    return client
+
+
+def upstream(handler):
+    """patch the async Ticketmaster client to answer with handler"""
+    return patch(
+        "api.ticketmaster.async_client",
+        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+@pytest.mark.django_db
+class TestAsyncConcertsView:
+    """Test cases for the async concert listing"""
+
+    def test_requires_authentication(self):
+        """Test requests without the token cookie are rejected"""
+
+        response = Client().get(reverse("async_concerts"))
+        assert response.status_code == 401
+
+    def test_concerts(self, cookie_client, populated_response):
+        """Test the listing is fetched upstream and compacted"""
+
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, json=populated_response)
+
+        with upstream(handler):
+            response = cookie_client.get(reverse("async_concerts"), {"query": "jazz"})
+
+        assert response.status_code == 200
+        assert response.json()["concerts"] == [
+            compact_event(event) for event in populated_response["_embedded"]["events"]
+        ]
+        assert len(requests_seen) == 1
+        assert requests_seen[0].url.params["keyword"] == "jazz"
+        assert requests_seen[0].url.params["apikey"] == os.environ["TICKETMASTER_KEY"]
+
+    def test_retries_server_errors(self, cookie_client, populated_response):
+        """Test 5xx responses are retried before giving up"""
+
+        responses = [
+            httpx.Response(503),
+            httpx.Response(200, json=populated_response),
+        ]
+
+        with upstream(lambda request: responses.pop(0)), patch(
+            "api.ticketmaster.retry_delay", return_value=0
+        ):
+            response = cookie_client.get(reverse("async_concerts"))
+
+        assert response.status_code == 200
+        assert not responses
+
+    def test_open_circuit(self, cookie_client):
+        """Test an open circuit is answered with 503 without calling upstream"""
+
+        for _ in range(ticketmaster.breaker.failure_threshold):
+            ticketmaster.breaker.record_failure()
+
+        def handler(request):
+            raise AssertionError("upstream should not be called")
+
+        with upstream(handler):
+            response = cookie_client.get(reverse("async_concerts"))
+
+        assert response.status_code == 503
+
+
+@pytest.mark.django_db
+class TestAsyncGetConcertView:
+    """Test cases for the async concert lookup"""
+
+    def test_ids_are_batched(self, cookie_client):
+        """Test several ids are fetched in one multi-id request"""
+
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(
+                200,
+                json=events_page([{"id": "a", "name": "A"}, {"id": "b", "name": "B"}]),
+            )
+
+        with upstream(handler):
+            response = cookie_client.get(reverse("async_get_concert"), {"ids": "b,a"})
+
+        assert response.status_code == 200
+        assert [event["name"] for event in response.json()["concerts"]] == ["B", "A"]
+        assert len(requests_seen) == 1
+        assert requests_seen[0].url.params["id"] == "b,a"
+        assert TicketmasterEvent.objects.count() == 2
+
+    def test_too_many_ids(self, cookie_client):
+        """Test lookups of more than MAX_CONCERT_IDS ids are rejected"""
+
+        def handler(request):
+            raise AssertionError("upstream should not be called")
+
+        ids = ",".join(str(i) for i in range(MAX_CONCERT_IDS + 1))
+        with upstream(handler):
+            response = cookie_client.get(reverse("async_get_concert"), {"ids": ids})
+
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestAsyncFavoritesView:
+    """Test cases for the async favorites"""
+
+    def test_favorites_mix_cache_and_upstream(self, cookie_client, test_user):
+        """Test cached favorites are not refetched and the rest are"""
+
+        for concert_id in ("cached", "missing"):
+            concert = Concert.objects.create(concert_id=concert_id)
+            FavoriteConcert.objects.create(user=test_user, concert=concert)
+        TicketmasterEvent.objects.create(
+            event_id="cached", data={"id": "cached", "name": "Cached"}
+        )
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(
+                200, json=events_page([{"id": "missing", "name": "Missing"}])
+            )
+
+        with upstream(handler):
+            response = cookie_client.get(reverse("async_favorites"))
+
+        assert response.status_code == 200
+        assert [event["name"] for event in response.json()["concerts"]] == [
+            "Cached",
+            "Missing",
+        ]
+        assert [request.url.params["id"] for request in requests_seen] == ["missing"]
+        assert TicketmasterEvent.objects.filter(event_id="missing").exists()
+
+    def test_favorites_not_modified(self, cookie_client, test_user):
+        """Test a current ETag is answered with 304 without calling upstream,
+        and a new favorite changes it"""
+
+        concert = Concert.objects.create(concert_id="cached")
+        FavoriteConcert.objects.create(user=test_user, concert=concert)
+        TicketmasterEvent.objects.create(event_id="cached", data={"id": "cached"})
+
+        def handler(request):
+            raise AssertionError("upstream should not be called")
+
+        url = reverse("async_favorites")
+        with upstream(handler):
+            response = cookie_client.get(url)
+            etag = response["ETag"]
+            not_modified = cookie_client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert not_modified.status_code == 304
+        assert not_modified["ETag"] == etag
+
+        FavoriteConcert.objects.filter(user=test_user).delete()
+        response = cookie_client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response["ETag"] != etag
@@ -0,0 +1,402 @@
+"""
+Test cases for the api management commands.
+"""
+
+# pylint: disable=W0621
+
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from ..event_cache import missing_key
+from ..management.commands.benchmark_concerts import percentile, summarize
+from ..management.commands.ticketmaster_standin import (StandIn, build_server,
+                                                        parse_latency,
+                                                        serve_in_background)
+from ..matching import (candidates, precomputed_at, precomputed_candidates,
+                        ranked_candidates)
+from ..models import (Artist, Concert, FavoriteConcert, MatchCandidate,
+                      SyncCheckpoint, TicketmasterEvent, UserProfile)
+from ..scoring import rank
+from .builders import music_event, upstream_page, upstream_response
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+class TestFetchConcertsCommand:
+    """Test cases for mirroring the Ticketmaster catalog"""
+
+    @patch("api.ticketmaster.session.get")
+    def test_pages_and_upserts(self, mocked_get):
+        """Test every page of a scope is mirrored with its metadata"""
+
+        mocked_get.side_effect = [
+            upstream_page([music_event("1")], number=0, total_pages=2),
+            upstream_page(
+                [music_event("2", start="2030-02-01T00:00:00Z")],
+                number=1,
+                total_pages=2,
+            ),
+        ]
+
+        call_command("fetch_concerts", scope=["location:KW"], stdout=StringIO())
+
+        assert mocked_get.call_count == 2
+        assert [call.kwargs["params"]["page"] for call in mocked_get.mock_calls] == [
+            "0",
+            "1",
+        ]
+        event = TicketmasterEvent.objects.get(event_id="1")
+        assert event.name == "Show"
+        assert event.venue_name == "Hall"
+        assert event.latitude == pytest.approx(43.46)
+        assert event.attractions == "The Band"
+        assert event.genre == "Rock"
+        checkpoint = SyncCheckpoint.objects.get(scope="location:KW")
+        assert checkpoint.synced_at is not None
+
+    @patch("api.ticketmaster.session.get")
+    def test_rerun_only_writes_changes(self, mocked_get):
+        """Test unchanged events are not rewritten on a rerun"""
+
+        mocked_get.side_effect = [
+            upstream_page([music_event("1"), music_event("2")]),
+            upstream_page([music_event("1"), music_event("2", name="Renamed")]),
+        ]
+
+        call_command("fetch_concerts", scope=["location:KW"], stdout=StringIO())
+        out = StringIO()
+        call_command("fetch_concerts", scope=["location:KW"], stdout=out)
+
+        assert "fetched 2 events, wrote 1" in out.getvalue()
+        assert TicketmasterEvent.objects.get(event_id="2").name == "Renamed"
+
+    @patch("api.ticketmaster.session.get")
+    def test_max_age_skips_fresh_scopes(self, mocked_get):
+        """Test scopes synced recently are skipped"""
+
+        mocked_get.return_value = upstream_page([music_event("1")])
+
+        call_command("fetch_concerts", scope=["venue:HISTORY"], stdout=StringIO())
+        call_command(
+            "fetch_concerts", scope=["venue:HISTORY"], max_age=60, stdout=StringIO()
+        )
+
+        assert mocked_get.call_count == 1
+
+
+@pytest.mark.django_db
+class TestReapConcertsCommand:
+    """Test cases for marking removed concerts as dead"""
+
+    @patch("api.ticketmaster.session.get")
+    def test_marks_missing_concerts_dead(self, mocked_get, test_user):
+        """Test concerts Ticketmaster no longer returns are marked dead"""
+
+        for concert_id in ["1", "2"]:
+            concert = Concert.objects.create(concert_id=concert_id)
+            FavoriteConcert.objects.create(user=test_user, concert=concert)
+        version = UserProfile.objects.get(user=test_user).favorites_version
+        mocked_get.return_value = upstream_page([music_event("1")])
+
+        out = StringIO()
+        call_command("reap_concerts", stdout=out)
+
+        assert "checked 2 concerts, marked 1 dead" in out.getvalue()
+        assert Concert.objects.get(concert_id="1").dead_at is None
+        assert Concert.objects.get(concert_id="2").dead_at is not None
+        assert TicketmasterEvent.objects.filter(event_id="1").exists()
+        profile = UserProfile.objects.get(user=test_user)
+        assert profile.favorites_version == version + 1
+
+    @patch("api.ticketmaster.session.get")
+    def test_fault_marks_nothing_dead(self, mocked_get, test_user):
+        """Test a rejected request is not taken as every concert being gone"""
+
+        for concert_id in ["1", "2"]:
+            concert = Concert.objects.create(concert_id=concert_id)
+            FavoriteConcert.objects.create(user=test_user, concert=concert)
+        mocked_get.return_value = upstream_response(
+            {"fault": {"faultstring": "Invalid ApiKey"}}, status_code=401
+        )
+
+        with pytest.raises(CommandError):
+            call_command("reap_concerts", stdout=StringIO())
+
+        assert not Concert.objects.filter(dead_at__isnull=False).exists()
+        assert cache.get(missing_key("1")) is None
+
+    @patch("api.ticketmaster.session.get")
+    def test_dead_concerts_are_not_rechecked(self, mocked_get):
+        """Test concerts already marked dead are skipped"""
+
+        Concert.objects.create(concert_id="1", dead_at=timezone.now())
+
+        call_command("reap_concerts", stdout=StringIO())
+
+        mocked_get.assert_not_called()
+
+
+@pytest.mark.django_db
+class TestRecomputeMatchingsCommand:
+    """Test cases for precomputing match candidates"""
+
+    @staticmethod
+    def favorite(user, *concert_ids):
+        """favorite concerts for user, creating them as needed"""
+        for concert_id in concert_ids:
+            concert, _ = Concert.objects.get_or_create(concert_id=concert_id)
+            FavoriteConcert.objects.create(user=user, concert=concert)
+
+    def test_scores_match_live_ranking(self, test_user, other_user):
+        """Test precomputed candidates agree with the live ranking whatever
+        the shard size"""
+
+        third_user = User.objects.create_user(
+            username="third", password="third123", email="third@uwaterloo.ca"
+        )
+        self.favorite(test_user, "1", "2")
+        self.favorite(other_user, "1", "2", "4")
+        self.favorite(third_user, "1", "3")
+        artist = Artist.objects.create(name="Artist")
+        for user in (test_user, third_user):
+            UserProfile.objects.get(user=user).favorite_artists.add(artist)
+        live = rank(test_user, candidates(test_user)[0])
+
+        for shard_size in (1, 100):
+            out = StringIO()
+            call_command(
+                "recompute_matchings", workers=1, shard_size=shard_size, stdout=out
+            )
+
+            assert "scored 3 users" in out.getvalue()
+            assert "wrote 6 candidates" in out.getvalue()
+            found, _next = precomputed_candidates(test_user)
+            assert [c["user_id"] for c in found] == [c["user_id"] for c in live]
+            assert [c["score"] for c in found] == [c["score"] for c in live]
+            assert [c["concerts"] for c in found] == [c["concerts"] for c in live]
+
+    def test_stale_rows_are_dropped(self, test_user, other_user):
+        """Test users who no longer share concerts lose their candidates"""
+
+        self.favorite(test_user, "1")
+        self.favorite(other_user, "1")
+        call_command("recompute_matchings", workers=1, stdout=StringIO())
+        FavoriteConcert.objects.filter(user=other_user).delete()
+
+        call_command("recompute_matchings", workers=1, stdout=StringIO())
+
+        assert not MatchCandidate.objects.exists()
+
+    def test_matchings_read_precomputed_until_new_favorite(
+        self, test_user, other_user
+    ):
+        """Test precomputed candidates are served until the user favorites
+        another concert"""
+
+        self.favorite(test_user, "1")
+        self.favorite(other_user, "1")
+        call_command("recompute_matchings", workers=1, stdout=StringIO())
+        MatchCandidate.objects.filter(user=test_user).update(score=0.123)
+
+        found, _next = ranked_candidates(test_user)
+        assert found[0]["score"] == 0.123
+
+        self.favorite(test_user, "2")
+
+        assert precomputed_at(test_user) is None
+        found, _next = ranked_candidates(test_user)
+        assert found[0]["score"] != 0.123
+
+    def test_candidate_unfavorites_wait_for_recompute(self, test_user, other_user):
+        """Test favorite changes of a candidate leave the precomputed
+        candidates served, while those of the user do not"""
+
+        third_user = User.objects.create_user(
+            username="third", password="third123", email="third@uwaterloo.ca"
+        )
+        self.favorite(test_user, "1", "2")
+        self.favorite(other_user, "1")
+        self.favorite(third_user, "2")
+        call_command("recompute_matchings", workers=1, stdout=StringIO())
+
+        FavoriteConcert.objects.filter(user=other_user).delete()
+
+        assert precomputed_at(test_user) is not None
+        found, _next = ranked_candidates(test_user)
+        assert [c["user_id"] for c in found] == sorted([other_user.id, third_user.id])
+
+        FavoriteConcert.objects.filter(user=test_user, concert__concert_id="2").delete()
+
+        assert precomputed_at(test_user) is None
+        assert ranked_candidates(test_user)[0] == []
+
+    def test_matchings_read_freshness_once(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test a matchings request checks the precomputed candidates once for
+        both its ETag and its body"""
+
+        self.favorite(test_user, "1")
+        self.favorite(other_user, "1")
+        call_command("recompute_matchings", workers=1, stdout=StringIO())
+
+        with patch("api.matching.precomputed_at", wraps=precomputed_at) as checked:
+            response = authenticated_client.get(reverse("matchings"))
+
+        assert response.status_code == 200
+        assert [m["username"] for m in response.data["matchings"]] == ["hello"]
+        checked.assert_called_once()
+
+    def test_recompute_changes_matchings_etag(
+        self, authenticated_client, test_user, other_user, settings
+    ):
+        """Test recomputing, and precomputed candidates expiring, change the
+        ETag of matchings"""
+
+        self.favorite(test_user, "1")
+        self.favorite(other_user, "1")
+        url = reverse("matchings")
+        etags = [authenticated_client.get(url)["ETag"]]
+
+        call_command("recompute_matchings", workers=1, stdout=StringIO())
+        etags.append(authenticated_client.get(url)["ETag"])
+        settings.MATCHING_CANDIDATES_MAX_AGE = 0
+        etags.append(authenticated_client.get(url)["ETag"])
+
+        assert len(set(etags)) == 3
+
+
+@pytest.fixture
+def standin_url():
+    """base URL of a stand-in Ticketmaster serving a small catalog"""
+    standin = StandIn([music_event("template")], catalog_size=30)
+    server = build_server(standin, port=0)
+    serve_in_background(server)
+    yield f"http://127.0.0.1:{server.server_address[1]}", standin
+    server.shutdown()
+    server.server_close()
+
+
+class TestTicketmasterStandIn:
+    """Test cases for the offline Ticketmaster stand-in"""
+
+    def test_latency_distributions(self):
+        """Test latency specs are parsed into samplers in seconds"""
+
+        assert parse_latency("fixed:120")() == 0.12
+        assert 0.05 <= parse_latency("uniform:50,100")() <= 0.1
+        assert parse_latency("lognormal:100,0.5")() > 0
+        with pytest.raises(ValueError):
+            parse_latency("gaussian:1")
+
+    def test_pages_the_catalog(self, standin_url):
+        """Test listings page through the cloned catalog"""
+
+        base_url, _standin = standin_url
+        body = requests.get(f"{base_url}/events", params={"page": 1}, timeout=5).json()
+
+        assert body["page"] == {
+            "size": 20,
+            "totalElements": 30,
+            "totalPages": 2,
+            "number": 1,
+        }
+        assert [event["id"] for event in body["_embedded"]["events"]][0] == "standin-20"
+
+    def test_id_lookups(self, standin_url):
+        """Test any id is found except the ones marked missing"""
+
+        base_url, _standin = standin_url
+        body = requests.get(
+            f"{base_url}/events", params={"id": "a,missing-b,c"}, timeout=5
+        ).json()
+
+        assert [event["id"] for event in body["_embedded"]["events"]] == ["a", "c"]
+
+    def test_rate_limit_bursts(self, standin_url):
+        """Test 429s with Retry-After are returned during a burst"""
+
+        base_url, standin = standin_url
+        standin.burst_every, standin.burst_length = 60, 60
+
+        response = requests.get(f"{base_url}/events", timeout=5)
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBenchmarkConcertsCommand:
+    """Test cases for the concert views benchmark"""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+
+        samples = list(range(1, 101))
+        assert percentile(samples, 0.5) == 50
+        assert percentile(samples, 0.99) == 99
+        assert percentile([7], 0.95) == 7
+        assert percentile([], 0.5) is None
+
+    def test_summarize_without_successes(self):
+        """Test a run without successful requests reports no latencies"""
+
+        summary = summarize([], 3, 1.0)
+        assert summary["requests"] == 3
+        assert summary["errors"] == 3
+        assert summary["p50"] is None and summary["p99"] is None
+        assert summarize([], 0, 0.0)["p95"] is None
+
+    def test_benchmark(self, live_server, standin_url, test_user, monkeypatch):
+        """Test every endpoint is driven and reported without errors and the
+        benchmark favorites are removed afterwards"""
+
+        base_url, _standin = standin_url
+        monkeypatch.setenv("TICKETMASTER_URL_BASE", base_url)
+        out = StringIO()
+
+        call_command(
+            "benchmark_concerts",
+            base_url=live_server.url,
+            username=test_user.username,
+            requests=6,
+            concurrency=2,
+            favorites=3,
+            stdout=out,
+        )
+
+        lines = out.getvalue().splitlines()
+        assert [line.split()[:3] for line in lines[1:]] == [
+            ["concerts", "6", "0"],
+            ["get_concert", "6", "0"],
+            ["favorites", "6", "0"],
+        ]
+        # the user is left with the favorites they had before the run
+        assert not FavoriteConcert.objects.filter(user=test_user).exists()
+        assert not Concert.objects.exists()
+
+    def test_benchmark_without_requests(self, live_server, test_user):
+        """Test a run of no requests reports n/a instead of failing"""
+
+        out = StringIO()
+        call_command(
+            "benchmark_concerts",
+            base_url=live_server.url,
+            username=test_user.username,
+            requests=0,
+            endpoint=["favorites"],
+            favorites=0,
+            stdout=out,
+        )
+
+        row = out.getvalue().splitlines()[1].split()
+        assert row == ["favorites", "0", "0", "0.0", "n/a", "n/a", "n/a"]
@@ -6,16 +6,27 @@ Test cases for concert views.
 
 import json
 import os
-from datetime import datetime
-from io import BytesIO
+import time
+from datetime import datetime, timedelta
 from unittest.mock import patch
 
 import pytest
+import requests
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
-from requests import Response
-
-from ..models import Concert, FavoriteConcert, Matching, UserProfile
+from django.utils import timezone
+
+from .. import matching, signals, ticketmaster
+from ..listings import encode_cursor, listing_key
+from ..matching import candidates
+from ..models import (Artist, CoFavorite, Concert, FavoriteConcert, Genre,
+                      Matching, MutualMatch, TicketmasterEvent, UserProfile)
+from ..scoring import rank
+from ..serializers import compact_event
+from ..views.concert_views import MAX_CONCERT_IDS
+from .builders import canned_responses, upstream_page, upstream_response
 
 User = get_user_model()
 
@@ -30,21 +41,13 @@ class TestConcertsView:
     def setup(self):
         """Setting up tests"""
 
-        file_path = os.path.join(
-            os.path.dirname(__file__), "ticketmaster_response.json"
-        )
-        with open(file_path, encoding="utf-8") as f:
-            self.res_body = json.load(f)
+        self.res_body = canned_responses()
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
     def test_concerts(self, mocked_get, authenticated_client):
         """Test basic GET concerts API call"""
 
-        res = Response()
-        res.status_code = 200
-        res.raw = BytesIO(
-            str(json.dumps(self.res_body["populated_response"])).encode("ascii")
-        )
+        res = upstream_response(self.res_body["populated_response"])
 
         mocked_get.return_value = res
         url = reverse("concerts")
@@ -52,20 +55,118 @@ class TestConcertsView:
 
         assert response.status_code == 200
         assert "concerts" in response.data
-        assert (
-            response.data["concerts"]
-            == self.res_body["populated_response"]["_embedded"]["events"]
-        )
+        assert response.data["concerts"] == [
+            compact_event(event)
+            for event in self.res_body["populated_response"]["_embedded"]["events"]
+        ]
+
+    @patch("api.ticketmaster.session.get")
+    def test_concerts_compact_schema(self, mocked_get, authenticated_client):
+        """Test concerts are compacted to the fields the client renders"""
+
+        res = upstream_response(self.res_body["populated_response"])
+
+        mocked_get.return_value = res
+        url = reverse("concerts")
+        response = authenticated_client.get(url, format="json")
+
+        raw_event = self.res_body["populated_response"]["_embedded"]["events"][0]
+        event = response.data["concerts"][0]
+        assert set(event) == {"id", "name", "url", "images", "dates", "_embedded"}
+        assert event["images"] == [
+            max(raw_event["images"], key=lambda image: image["width"])
+        ]
+        assert event["dates"] == {
+            "start": raw_event["dates"]["start"],
+            "status": raw_event["dates"]["status"],
+        }
+        venue = event["_embedded"]["venues"][0]
+        assert venue["name"] == raw_event["_embedded"]["venues"][0]["name"]
+        assert "_links" not in venue
+
+    def test_compact_event_without_images(self):
+        """Test events without images still carry an empty images list"""
+
+        raw_event = dict(self.res_body["populated_response"]["_embedded"]["events"][0])
+        del raw_event["images"]
+        assert compact_event(raw_event)["images"] == []
+
+    @patch("api.ticketmaster.session.get")
+    def test_concerts_with_fields(self, mocked_get, authenticated_client):
+        """Test fields= opts back into raw event sub-objects"""
+
+        res = upstream_response(self.res_body["populated_response"])
+
+        mocked_get.return_value = res
+        url = reverse("concerts") + "?fields=classifications,images"
+        response = authenticated_client.get(url, format="json")
+
+        raw_event = self.res_body["populated_response"]["_embedded"]["events"][0]
+        event = response.data["concerts"][0]
+        assert event["classifications"] == raw_event["classifications"]
+        assert event["images"] == raw_event["images"]
+        assert "sales" not in event
+
+    @patch("api.ticketmaster.session.get")
+    def test_concerts_paging(self, mocked_get, authenticated_client):
+        """Test page/size map onto Ticketmaster paging and return a next cursor"""
+
+        res = upstream_response(self.res_body["populated_response"])
+
+        mocked_get.return_value = res
+        url = reverse("concerts") + "?page=0&size=1"
+        response = authenticated_client.get(url, format="json")
+
+        assert mocked_get.call_args.kwargs["params"]["page"] == "0"
+        assert mocked_get.call_args.kwargs["params"]["size"] == "1"
+        assert response.status_code == 200
+        assert response.data["next"] == encode_cursor(1, 1)
+
+    @patch("api.ticketmaster.session.get")
+    def test_concerts_cursor_uses_prefetched_page(
+        self, mocked_get, authenticated_client, settings
+    ):
+        """Test the next page is prefetched and served from cache via its cursor"""
+
+        settings.CONCERT_PREFETCH_NEXT_PAGE = True
+        next_page = {
+            "page": {"size": 1, "totalElements": 2, "totalPages": 2, "number": 1},
+            "_embedded": {"events": [{"id": "next"}]},
+        }
+
+        def respond(_url, params, timeout):
+            body = self.res_body["populated_response"]
+            if params.get("page") == "1":
+                body = next_page
+            return upstream_response(body)
+
+        mocked_get.side_effect = respond
+        with patch("api.ticketmaster.executor.submit", side_effect=lambda task: task()):
+            response = authenticated_client.get(reverse("concerts"), format="json")
+        assert mocked_get.call_count == 2
+
+        url = reverse("concerts") + "?cursor=" + response.data["next"]
+        response = authenticated_client.get(url, format="json")
+
+        assert mocked_get.call_count == 2
+        assert response.status_code == 200
+        assert response.data["concerts"] == [{"id": "next", "images": []}]
+        assert response.data["next"] is None
+
+    def test_concerts_with_invalid_cursor(self, authenticated_client):
+        """Test a malformed cursor is rejected"""
 
-    @patch("api.views.concert_views.requests.get")
+        url = reverse("concerts") + "?cursor=not-a-cursor"
+        response = authenticated_client.get(url, format="json")
+
+        assert response.status_code == 400
+        assert "error" in response.data
+
+    @patch("api.ticketmaster.session.get")
     def test_nonpopulated_concerts(self, mocked_get, authenticated_client):
         """Test basic GET concerts API call when Ticketmaster returns nothing"""
 
-        res = Response()
-        res.raw = BytesIO(
-            str(json.dumps(self.res_body["nonpopulated_response"])).encode("ascii")
-        )
-        res.status_code = 200
+        res = upstream_response(self.res_body["nonpopulated_response"])
 
         mocked_get.return_value = res
         url = reverse("concerts")
@@ -75,15 +176,11 @@ class TestConcertsView:
         assert "concerts" in response.data
         assert response.data["concerts"] == []
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
     def test_concerts_with_query(self, mocked_get, authenticated_client):
         """Test GET concerts API call with search query and location"""
 
-        res = Response()
-        res.raw = BytesIO(
-            str(json.dumps(self.res_body["populated_response"])).encode("ascii")
-        )
-        res.status_code = 200
+        res = upstream_response(self.res_body["populated_response"])
 
         request_params = {
             "apikey": os.environ["TICKETMASTER_KEY"],
@@ -107,20 +204,16 @@ class TestConcertsView:
 
         assert response.status_code == 200
         assert "concerts" in response.data
-        assert (
-            response.data["concerts"]
-            == self.res_body["populated_response"]["_embedded"]["events"]
-        )
+        assert response.data["concerts"] == [
+            compact_event(event)
+            for event in self.res_body["populated_response"]["_embedded"]["events"]
+        ]
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
     def test_concerts_with_onsale(self, mocked_get, authenticated_client):
         """Test GET concerts API call with search query and location"""
 
-        res = Response()
-        res.raw = BytesIO(
-            str(json.dumps(self.res_body["populated_response"])).encode("ascii")
-        )
-        res.status_code = 200
+        res = upstream_response(self.res_body["populated_response"])
 
         today = datetime.today().strftime("%Y-%m-%dT00:00:00Z")
         request_params = {
@@ -146,20 +239,16 @@ class TestConcertsView:
 
         assert response.status_code == 200
         assert "concerts" in response.data
-        assert (
-            response.data["concerts"]
-            == self.res_body["populated_response"]["_embedded"]["events"]
-        )
+        assert response.data["concerts"] == [
+            compact_event(event)
+            for event in self.res_body["populated_response"]["_embedded"]["events"]
+        ]
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
     def test_concerts_with_valid_location(self, mocked_get, authenticated_client):
         """Test GET concerts API call with search query and location"""
 
-        res = Response()
-        res.raw = BytesIO(
-            str(json.dumps(self.res_body["populated_response"])).encode("ascii")
-        )
-        res.status_code = 200
+        res = upstream_response(self.res_body["populated_response"])
 
         request_params = {
             "apikey": os.environ["TICKETMASTER_KEY"],
@@ -183,20 +272,16 @@ class TestConcertsView:
 
         assert response.status_code == 200
         assert "concerts" in response.data
-        assert (
-            response.data["concerts"]
-            == self.res_body["populated_response"]["_embedded"]["events"]
-        )
+        assert response.data["concerts"] == [
+            compact_event(event)
+            for event in self.res_body["populated_response"]["_embedded"]["events"]
+        ]
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
     def test_concerts_with_invalid_location(self, mocked_get, authenticated_client):
         """Test GET concerts API call with search query and location"""
 
-        res = Response()
-        res.raw = BytesIO(
-            str(json.dumps(self.res_body["populated_response"])).encode("ascii")
-        )
-        res.status_code = 200
+        res = upstream_response(self.res_body["populated_response"])
 
         mocked_get.return_value = res
         url = reverse("concerts") + "?location=JKAHKJ"
@@ -209,15 +294,25 @@ class TestConcertsView:
             == "Unable to fetch concerts. Please try again later."
         )
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
+    def test_concerts_with_open_circuit(self, mocked_get, authenticated_client):
+        """Test concerts fail fast with a 503 while Ticketmaster is down"""
+
+        for _ in range(settings.TICKETMASTER_BREAKER_THRESHOLD):
+            ticketmaster.breaker.record_failure()
+
+        url = reverse("concerts")
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_not_called()
+        assert response.status_code == 503
+        assert response.data["error"] == "Service temporarily unavailable"
+
+    @patch("api.ticketmaster.session.get")
     def test_concerts_with_query_and_location(self, mocked_get, authenticated_client):
         """Test GET concerts API call with search query and location"""
 
-        res = Response()
-        res.raw = BytesIO(
-            str(json.dumps(self.res_body["populated_response"])).encode("ascii")
-        )
-        res.status_code = 200
+        res = upstream_response(self.res_body["populated_response"])
 
         request_params = {
             "apikey": os.environ["TICKETMASTER_KEY"],
@@ -242,11 +337,150 @@ class TestConcertsView:
 
         assert response.status_code == 200
         assert "concerts" in response.data
-        assert (
-            response.data["concerts"]
-            == self.res_body["populated_response"]["_embedded"]["events"]
+        assert response.data["concerts"] == [
+            compact_event(event)
+            for event in self.res_body["populated_response"]["_embedded"]["events"]
+        ]
+
+
+@pytest.mark.django_db
+class TestConcertListingCache:
+    """Test cases for stale-while-revalidate concert listings"""
+
+    params = {
+        "radius": "20",
+        "unit": "km",
+        "classificationName": "Music",
+        "includeTest": "no",
+        "sort": "date,asc",
+    }
+    listing = {
+        "page": {"size": 20, "totalElements": 1, "totalPages": 1, "number": 0},
+        "_embedded": {"events": [{"id": "cached"}]},
+    }
+
+    def cache_listing(self, age):
+        """cache the listing for the default search as if stored age seconds ago"""
+        cache.set(
+            listing_key(self.params),
+            {"response": self.listing, "stored_at": time.time() - age},
         )
 
+    @patch("api.ticketmaster.session.get")
+    def test_fresh_listing_served_from_cache(self, mocked_get, authenticated_client):
+        """Test fresh listings skip Ticketmaster"""
+
+        self.cache_listing(age=0)
+
+        response = authenticated_client.get(reverse("concerts"), format="json")
+
+        mocked_get.assert_not_called()
+        assert response.data["concerts"] == [{"id": "cached", "images": []}]
+        assert "X-Concerts-Stale" not in response
+
+    @patch("api.listings.refresh_in_background")
+    @patch("api.ticketmaster.session.get")
+    def test_stale_listing_revalidates_in_background(
+        self, mocked_get, mocked_refresh, authenticated_client, settings
+    ):
+        """Test stale listings are served immediately and refreshed"""
+
+        self.cache_listing(age=settings.CONCERT_LISTING_FRESH_TTL + 1)
+
+        response = authenticated_client.get(reverse("concerts"), format="json")
+
+        mocked_get.assert_not_called()
+        mocked_refresh.assert_called_once_with(self.params)
+        assert response.data["concerts"] == [{"id": "cached", "images": []}]
+        assert response["X-Concerts-Stale"] == "true"
+
+    @patch("api.ticketmaster.session.get")
+    def test_upstream_error_falls_back_to_last_good(
+        self, mocked_get, authenticated_client, settings
+    ):
+        """Test an expired listing is still served when Ticketmaster fails"""
+
+        self.cache_listing(age=settings.CONCERT_LISTING_STALE_TTL + 1)
+        mocked_get.side_effect = requests.ConnectionError("upstream down")
+
+        response = authenticated_client.get(reverse("concerts"), format="json")
+
+        mocked_get.assert_called_once()
+        assert response.status_code == 200
+        assert response.data["concerts"] == [{"id": "cached", "images": []}]
+        assert response["X-Concerts-Stale"] == "true"
+
+    @patch("api.ticketmaster.session.get")
+    def test_upstream_error_without_cache(self, mocked_get, authenticated_client):
+        """Test an upstream error with nothing cached is still an error"""
+
+        mocked_get.side_effect = requests.ConnectionError("upstream down")
+
+        response = authenticated_client.get(reverse("concerts"), format="json")
+
+        assert response.status_code == 500
+
+
+@pytest.mark.django_db
+class TestGetConcertView:
+    """Test cases for fetching a single concert"""
+
+    @patch("api.ticketmaster.session.get")
+    def test_get_concert_caches_event(self, mocked_get, authenticated_client):
+        """Test a fetched concert is cached and reused on the next request"""
+
+        res = upstream_page([{"name": "hello"}])
+        mocked_get.return_value = res
+
+        url = reverse("get_concert") + "?id=123"
+        response = authenticated_client.get(url, format="json")
+        assert response.status_code == 200
+        assert response.data["concerts"] == [{"name": "hello", "images": []}]
+        assert TicketmasterEvent.objects.filter(event_id="123").exists()
+
+        response = authenticated_client.get(url, format="json")
+        assert response.status_code == 200
+        assert response.data["concerts"] == [{"name": "hello", "images": []}]
+        mocked_get.assert_called_once()
+
+    @patch("api.ticketmaster.session.get")
+    def test_get_concerts_by_ids(self, mocked_get, authenticated_client):
+        """Test several concerts are hydrated with one multi-id request"""
+
+        TicketmasterEvent.objects.create(event_id="b", data={"id": "b"})
+        res = upstream_page([{"id": "c"}, {"id": "a"}])
+        mocked_get.return_value = res
+
+        url = reverse("get_concert") + "?ids=a,b,c,missing"
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_called_once_with(
+            f'{os.environ["TICKETMASTER_URL_BASE"]}/events',
+            params={
+                "apikey": os.environ["TICKETMASTER_KEY"],
+                "id": "a,c,missing",
+                "includeTest": "no",
+            },
+            timeout=10,
+        )
+        assert response.status_code == 200
+        assert response.data["concerts"] == [
+            {"id": "a", "images": []},
+            {"id": "b", "images": []},
+            {"id": "c", "images": []},
+        ]
+
+    @patch("api.ticketmaster.session.get")
+    def test_get_concerts_too_many_ids(self, mocked_get, authenticated_client):
+        """Test lookups of more than MAX_CONCERT_IDS ids are rejected"""
+
+        ids = ",".join(str(i) for i in range(MAX_CONCERT_IDS + 1))
+        url = reverse("get_concert")
+        response = authenticated_client.get(url, {"ids": ids}, format="json")
+
+        mocked_get.assert_not_called()
+        assert response.status_code == 400
+
 
 @pytest.mark.django_db
 class TestFavoriteView:
@@ -336,31 +570,16 @@ class TestUserFavoritedConcertsView:
     def setup(self):
         """Setting up tests"""
 
-        file_path = os.path.join(
-            os.path.dirname(__file__), "ticketmaster_response.json"
-        )
-        with open(file_path, encoding="utf-8") as f:
-            self.res_body = json.load(f)
+        self.res_body = canned_responses()
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
     def test_user_favorited_concerts(self, mocked_get, authenticated_client, test_user):
         """Test basic GET user favorited concerts API call"""
 
         concert = Concert.objects.create(concert_id="123")
         FavoriteConcert.objects.create(concert=concert, user=test_user)
 
-        res = Response()
-        res.raw = BytesIO(
-            str(
-                json.dumps(
-                    {
-                        "page": {"totalElements": 1},
-                        "_embedded": {"events": [{"name": "hello"}]},
-                    }
-                )
-            ).encode("ascii")
-        )
-        res.status_code = 200
+        res = upstream_page([{"name": "hello"}])
 
         request_params = {
             "apikey": os.environ["TICKETMASTER_KEY"],
@@ -381,9 +600,196 @@ class TestUserFavoritedConcertsView:
         assert response.status_code == 200
         assert "concerts" in response.data
         assert len(response.data["concerts"]) == 1
-        assert response.data["concerts"][0] == {"name": "hello"}
+        assert response.data["concerts"][0] == {"name": "hello", "images": []}
+
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_batched(
+        self, mocked_get, authenticated_client, test_user, settings
+    ):
+        """Test favorites are fetched in multi-id chunks and keep favorite order"""
+
+        settings.TICKETMASTER_BATCH_SIZE = 2
+        for concert_id in ["1", "2", "3"]:
+            concert = Concert.objects.create(concert_id=concert_id)
+            FavoriteConcert.objects.create(concert=concert, user=test_user)
+
+        def respond(_url, params, timeout):
+            ids = params["id"].split(",")
+            return upstream_page([{"id": i, "name": i} for i in reversed(ids)])
+
+        mocked_get.side_effect = respond
+
+        url = reverse("favorites")
+        response = authenticated_client.get(url, format="json")
+
+        assert mocked_get.call_count == 2
+        requested = sorted(
+            call.kwargs["params"]["id"] for call in mocked_get.mock_calls
+        )
+        assert requested == ["1,2", "3"]
+        assert response.status_code == 200
+        assert [event["id"] for event in response.data["concerts"]] == ["1", "2", "3"]
+
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_cached(
+        self, mocked_get, authenticated_client, test_user
+    ):
+        """Test favorited concerts are served from the event cache when fresh"""
+
+        concert = Concert.objects.create(concert_id="123")
+        FavoriteConcert.objects.create(concert=concert, user=test_user)
+        TicketmasterEvent.objects.create(event_id="123", data={"name": "cached"})
+
+        url = reverse("favorites")
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_not_called()
+
+        assert response.status_code == 200
+        assert response.data["concerts"] == [{"name": "cached", "images": []}]
+
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_expired_cache(
+        self, mocked_get, authenticated_client, test_user
+    ):
+        """Test expired cache entries are refetched and refreshed"""
+
+        concert = Concert.objects.create(concert_id="123")
+        FavoriteConcert.objects.create(concert=concert, user=test_user)
+        TicketmasterEvent.objects.create(
+            event_id="123",
+            data={"name": "stale"},
+            fetched_at=timezone.now() - timedelta(days=1),
+        )
+
+        res = upstream_page([{"name": "hello"}])
+        mocked_get.return_value = res
+
+        url = reverse("favorites")
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_called_once()
+
+        assert response.status_code == 200
+        assert response.data["concerts"] == [{"name": "hello", "images": []}]
+        assert TicketmasterEvent.objects.get(event_id="123").data == {"name": "hello"}
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_missing_are_negatively_cached(
+        self, mocked_get, authenticated_client, test_user
+    ):
+        """Test ids Ticketmaster returned nothing for are not asked for again"""
+
+        concert = Concert.objects.create(concert_id="gone")
+        FavoriteConcert.objects.create(concert=concert, user=test_user)
+
+        def respond(*_args, **_kwargs):
+            return upstream_response({"page": {"totalElements": 0}})
+
+        mocked_get.side_effect = respond
+
+        url = reverse("favorites")
+        for _ in range(2):
+            response = authenticated_client.get(url, format="json")
+            assert response.status_code == 200
+            assert response.data["concerts"] == []
+
+        mocked_get.assert_called_once()
+
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_fault_is_not_negatively_cached(
+        self, mocked_get, authenticated_client, test_user
+    ):
+        """Test a fault body fails the request instead of hiding the ids"""
+
+        concert = Concert.objects.create(concert_id="123")
+        FavoriteConcert.objects.create(concert=concert, user=test_user)
+
+        def respond(*_args, **_kwargs):
+            return upstream_response(
+                {"fault": {"faultstring": "Invalid ApiKey"}}, status_code=401
+            )
+
+        mocked_get.side_effect = respond
+
+        url = reverse("favorites")
+        for _ in range(2):
+            response = authenticated_client.get(url, format="json")
+            assert response.status_code == 503
+
+        assert mocked_get.call_count == 2
+
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_skip_dead(
+        self, mocked_get, authenticated_client, test_user
+    ):
+        """Test concerts marked dead are not looked up at all"""
+
+        concert = Concert.objects.create(concert_id="gone", dead_at=timezone.now())
+        FavoriteConcert.objects.create(concert=concert, user=test_user)
+
+        url = reverse("favorites")
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_not_called()
+        assert response.status_code == 200
+        assert response.data["concerts"] == []
+
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_stream(
+        self, mocked_get, authenticated_client, test_user, settings
+    ):
+        """Test streamed favorites emit cached events first, then each batch"""
+
+        settings.TICKETMASTER_BATCH_SIZE = 1
+        for concert_id in ["1", "2", "3"]:
+            concert = Concert.objects.create(concert_id=concert_id)
+            FavoriteConcert.objects.create(concert=concert, user=test_user)
+        TicketmasterEvent.objects.create(event_id="3", data={"id": "3"})
+
+        def respond(_url, params, timeout):
+            res = upstream_page([{"id": params["id"]}])
+            return res
+
+        mocked_get.side_effect = respond
+
+        url = reverse("favorites")
+        response = authenticated_client.get(url, {"stream": "ndjson"})
+
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/x-ndjson"
+        lines = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        assert lines[0] == {"id": "3", "images": []}
+        assert sorted(event["id"] for event in lines) == ["1", "2", "3"]
+        assert mocked_get.call_count == 2
+        assert TicketmasterEvent.objects.count() == 3
+
+    @patch("api.ticketmaster.session.get")
+    def test_user_favorited_concerts_stream_error(
+        self, mocked_get, authenticated_client, test_user
+    ):
+        """Test a failure midway through the stream ends it with an error line"""
+
+        concert = Concert.objects.create(concert_id="1")
+        FavoriteConcert.objects.create(concert=concert, user=test_user)
+        for _ in range(ticketmaster.breaker.failure_threshold):
+            ticketmaster.breaker.record_failure()
+
+        url = reverse("favorites")
+        response = authenticated_client.get(url, {"stream": "ndjson"})
+
+        mocked_get.assert_not_called()
+        assert response.status_code == 200
+        assert json.loads(b"".join(response.streaming_content)) == {
+            "error": "Service temporarily unavailable"
+        }
+        # a client must not revalidate the broken stream later
+        assert not response.has_header("ETag")
+
+    @patch("api.ticketmaster.session.get")
     def test_user_favorited_concerts_with_no_concerts(
         self, mocked_get, authenticated_client
     ):
@@ -398,7 +804,7 @@ class TestUserFavoritedConcertsView:
         assert "concerts" in response.data
         assert len(response.data["concerts"]) == 0
 
-    @patch("api.views.concert_views.requests.get")
+    @patch("api.ticketmaster.session.get")
     def test_user_favorited_concerts_with_other_users(
         self, mocked_get, authenticated_client, other_user
     ):
@@ -417,6 +823,325 @@ class TestUserFavoritedConcertsView:
         assert len(response.data["concerts"]) == 0
 
 
+@pytest.mark.django_db
+class TestMatchingsView:
+    """Test cases for matchings flow"""
+
+    @staticmethod
+    def favorite(user, *concert_ids):
+        """favorite concerts for user, creating them as needed"""
+        for concert_id in concert_ids:
+            concert, _ = Concert.objects.get_or_create(concert_id=concert_id)
+            FavoriteConcert.objects.create(user=user, concert=concert)
+
+    def test_matchings(self, authenticated_client, test_user, other_user):
+        """Test users sharing favorites are returned with their shared concerts"""
+
+        profile = UserProfile.objects.get(user=other_user)
+        profile.first_name, profile.last_name = "Other", "User"
+        profile.faculty, profile.term = "Math", "2A"
+        profile.save()
+        self.favorite(test_user, "1", "2", "3")
+        self.favorite(other_user, "2", "3", "4")
+
+        url = reverse("matchings")
+        response = authenticated_client.get(url, format="json")
+
+        assert response.status_code == 200
+        matching = Matching.objects.get(user=test_user, target=other_user)
+        assert response.data["matchings"] == [
+            {
+                "id": matching.id,
+                "username": other_user.username,
+                "profile_photo": profile.profile_photo,
+                "target_name": "Other User",
+                "target_faculty": "Math",
+                "target_academic_term": "2A",
+                "concerts": ["2", "3"],
+            }
+        ]
+        assert matching.decision == "UNKNOWN"
+        assert sorted(
+            matching.matched_concerts.values_list("concert_id", flat=True)
+        ) == ["2", "3"]
+
+    def test_matchings_skip_unrelated_and_decided_users(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test users without shared favorites or already decided are left out"""
+
+        third_user = User.objects.create_user(
+            username="third", password="third123", email="third@uwaterloo.ca"
+        )
+        self.favorite(test_user, "1")
+        self.favorite(other_user, "1")
+        self.favorite(third_user, "2")
+        Matching.objects.create(user=test_user, target=other_user, decision="NO")
+
+        url = reverse("matchings")
+        response = authenticated_client.get(url, format="json")
+
+        assert response.status_code == 200
+        assert response.data["matchings"] == []
+
+    def test_candidates_single_query(
+        self, test_user, other_user, django_assert_num_queries
+    ):
+        """Test candidates are generated in one query however many users overlap"""
+
+        self.favorite(test_user, "1", "2")
+        for i in range(5):
+            user = User.objects.create_user(
+                username=f"fan{i}", password="fan12345", email=f"fan{i}@uwaterloo.ca"
+            )
+            self.favorite(user, "1", "2")
+
+        with django_assert_num_queries(1):
+            found, _next = candidates(test_user)
+
+        assert [candidate["concerts"] for candidate in found] == [["1", "2"]] * 5
+
+    def test_matchings_bulk_writes(
+        self, authenticated_client, test_user, django_assert_max_num_queries
+    ):
+        """Test matchings are written with a fixed number of queries and their
+        concerts follow the current overlap on later visits"""
+
+        self.favorite(test_user, "1", "2")
+        fans = []
+        for i in range(10):
+            fan = User.objects.create_user(
+                username=f"fan{i}", password="fan12345", email=f"fan{i}@uwaterloo.ca"
+            )
+            self.favorite(fan, "1", "2")
+            fans.append(fan)
+
+        url = reverse("matchings")
+        with django_assert_max_num_queries(14):
+            response = authenticated_client.get(url, format="json")
+
+        assert response.status_code == 200
+        assert len(response.data["matchings"]) == 10
+        assert Matching.objects.filter(user=test_user, decision="UNKNOWN").count() == 10
+
+        FavoriteConcert.objects.filter(user=fans[0], concert__concert_id="2").delete()
+        response = authenticated_client.get(url, format="json")
+
+        matching = Matching.objects.get(user=test_user, target=fans[0])
+        assert list(
+            matching.matched_concerts.values_list("concert_id", flat=True)
+        ) == ["1"]
+        assert Matching.objects.filter(user=test_user).count() == 10
+
+    def test_matchings_ranked_by_weighted_similarity(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test candidates sharing artists and genres too are ranked first"""
+
+        third_user = User.objects.create_user(
+            username="third", password="third123", email="third@uwaterloo.ca"
+        )
+        self.favorite(test_user, "1", "2")
+        self.favorite(other_user, "1", "2", "4")
+        self.favorite(third_user, "1", "3")
+        artist = Artist.objects.create(name="Artist")
+        genre = Genre.objects.create(name="Genre")
+        for user in (test_user, third_user):
+            profile = UserProfile.objects.get(user=user)
+            profile.favorite_artists.add(artist)
+            profile.favorite_genres.add(genre)
+
+        found = rank(test_user, candidates(test_user)[0])
+
+        assert [candidate["user_id"] for candidate in found] == [
+            third_user.id,
+            other_user.id,
+        ]
+        # concerts 1/3 * 0.6 + artists 1 * 0.25 + genres 1 * 0.15
+        assert found[0]["score"] == pytest.approx(0.6, abs=1e-4)
+        # concerts 2/3 * 0.6, ranked first by shared concerts alone
+        assert found[1]["score"] == pytest.approx(0.4, abs=1e-4)
+
+    def test_matchings_pages_best_scored_first(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test a live page holds the best scored candidates, not those
+        sharing the most concerts"""
+
+        third_user = User.objects.create_user(
+            username="third", password="third123", email="third@uwaterloo.ca"
+        )
+        self.favorite(test_user, "1", "2")
+        self.favorite(other_user, "1", "2", "4")
+        self.favorite(third_user, "1", "3")
+        artist = Artist.objects.create(name="Artist")
+        for user in (test_user, third_user):
+            UserProfile.objects.get(user=user).favorite_artists.add(artist)
+
+        url = reverse("matchings")
+        response = authenticated_client.get(url, {"limit": 1}, format="json")
+        assert response.status_code == 200
+        assert [m["username"] for m in response.data["matchings"]] == ["third"]
+
+        response = authenticated_client.get(
+            url, {"limit": 1, "cursor": response.data["next"]}, format="json"
+        )
+        assert [m["username"] for m in response.data["matchings"]] == ["hello"]
+        assert response.data["next"] is None
+
+    def test_live_pages_stop_scoring_early(self, test_user, monkeypatch):
+        """Test the live scan stops once the candidates sharing fewer concerts
+        cannot beat the page, and pages still hold the best candidates"""
+
+        self.favorite(test_user, "1", "2")
+        for i in range(2):
+            fan = User.objects.create_user(
+                username=f"both{i}", password="fan12345", email=f"b{i}@uwaterloo.ca"
+            )
+            self.favorite(fan, "1", "2")
+        for i in range(4):
+            fan = User.objects.create_user(
+                username=f"one{i}", password="fan12345", email=f"o{i}@uwaterloo.ca"
+            )
+            self.favorite(fan, "1", "3")
+        monkeypatch.setattr(matching, "SCORE_BATCH", 2)
+        scored = []
+
+        def counting_rank(user, found):
+            scored.extend(candidate["user_id"] for candidate in found)
+            return rank(user, found)
+
+        monkeypatch.setattr(matching, "rank", counting_rank)
+
+        found, next_cursor = matching.live_candidates(test_user, limit=1)
+
+        assert [candidate["username"] for candidate in found] == ["both0"]
+        # the second batch bounds the last two at 0.3, below both1's 0.6
+        assert len(scored) == 4
+
+        usernames = [found[0]["username"]]
+        while next_cursor:
+            found, next_cursor = matching.live_candidates(
+                test_user, limit=2, after=matching.decode_cursor(next_cursor)
+            )
+            usernames += [candidate["username"] for candidate in found]
+        assert usernames == ["both0", "both1", "one0", "one1", "one2", "one3"]
+
+    def test_matchings_pages(self, authenticated_client, test_user):
+        """Test limit pages through candidates, best scored first"""
+
+        self.favorite(test_user, "1", "2", "3")
+        fans = []
+        for i in range(5):
+            fan = User.objects.create_user(
+                username=f"fan{i}", password="fan12345", email=f"fan{i}@uwaterloo.ca"
+            )
+            self.favorite(fan, *["1", "2", "3"][: 3 - i % 3])
+            fans.append(fan)
+
+        url = reverse("matchings")
+        usernames = []
+        params = {"limit": 2}
+        while True:
+            response = authenticated_client.get(url, params, format="json")
+            assert response.status_code == 200
+            assert len(response.data["matchings"]) <= 2
+            usernames += [m["username"] for m in response.data["matchings"]]
+            if not response.data["next"]:
+                break
+            params = {"limit": 2, "cursor": response.data["next"]}
+
+        assert usernames == ["fan0", "fan3", "fan1", "fan4", "fan2"]
+
+    def test_matchings_invalid_page(self, authenticated_client, test_user):
+        """Test malformed limits and cursors are rejected"""
+
+        url = reverse("matchings")
+        for params in ({"limit": "abc"}, {"limit": 0}, {"cursor": "not-a-cursor"}):
+            response = authenticated_client.get(url, params, format="json")
+            assert response.status_code == 400
+
+    def test_co_favorites_follow_favorites(self, test_user, other_user):
+        """Test the overlap table is updated as favorites are added and removed"""
+
+        self.favorite(test_user, "1", "2", "3")
+        self.favorite(other_user, "2", "3")
+
+        for user, other in ((test_user, other_user), (other_user, test_user)):
+            co_favorite = CoFavorite.objects.get(user=user, other=other)
+            assert co_favorite.shared_count == 2
+            assert sorted(
+                co_favorite.shared_concerts.values_list("concert_id", flat=True)
+            ) == ["2", "3"]
+
+        FavoriteConcert.objects.filter(user=other_user, concert__concert_id="2").delete()
+        co_favorite = CoFavorite.objects.get(user=test_user, other=other_user)
+        assert co_favorite.shared_count == 1
+        assert list(
+            co_favorite.shared_concerts.values_list("concert_id", flat=True)
+        ) == ["3"]
+
+        FavoriteConcert.objects.filter(user=test_user, concert__concert_id="3").delete()
+        assert not CoFavorite.objects.exists()
+
+    def test_co_favorites_count_each_change_once(self, test_user, other_user):
+        """Test a favorite seen twice counts once and its removal seen twice
+        uncounts once, the count following the shared concerts"""
+
+        self.favorite(test_user, "1", "2")
+        self.favorite(other_user, "1", "2")
+        favorite = FavoriteConcert.objects.get(user=other_user, concert__concert_id="1")
+
+        signals.co_favorite_added(favorite, created=True)
+        assert set(CoFavorite.objects.values_list("shared_count", flat=True)) == {2}
+
+        favorite.delete()
+        signals.co_favorite_removed(favorite)
+        assert set(CoFavorite.objects.values_list("shared_count", flat=True)) == {1}
+        assert set(
+            CoFavorite.shared_concerts.through.objects.values_list(
+                "concert__concert_id", flat=True
+            )
+        ) == {"2"}
+
+    def test_deleted_concerts_leave_overlaps(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test deleting concerts, which cascades to their favorites in bulk,
+        takes them out of the overlaps and drops pairs left sharing none"""
+
+        self.favorite(test_user, "1", "2")
+        self.favorite(other_user, "1", "2")
+
+        Concert.objects.filter(concert_id="1").delete()
+        assert set(CoFavorite.objects.values_list("shared_count", flat=True)) == {1}
+
+        Concert.objects.filter(concert_id="2").delete()
+        assert not CoFavorite.objects.exists()
+
+        response = authenticated_client.get(reverse("matchings"), format="json")
+        assert response.status_code == 200
+        assert response.data["matchings"] == []
+
+    def test_candidates_most_shared_first(self, test_user, other_user):
+        """Test candidates sharing more concerts come first"""
+
+        third_user = User.objects.create_user(
+            username="third", password="third123", email="third@uwaterloo.ca"
+        )
+        self.favorite(test_user, "1", "2")
+        self.favorite(other_user, "1")
+        self.favorite(third_user, "1", "2")
+
+        found, _next = candidates(test_user)
+
+        assert [candidate["user_id"] for candidate in found] == [
+            third_user.id,
+            other_user.id,
+        ]
+        assert [candidate["concerts"] for candidate in found] == [["1", "2"], ["1"]]
+
+
 @pytest.mark.django_db
 class TestReviewMatchingView:
     """Test cases for review matching flow"""
@@ -437,6 +1162,31 @@ class TestReviewMatchingView:
         assert "message" in response.data
         assert response.data["message"] == "Matching processed successfully"
 
+    def test_review_matching_records_mutual_match(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test a yes to someone who said yes records the match both ways"""
+
+        reciprocal = Matching.objects.create(
+            user=other_user, target=test_user, decision="YES"
+        )
+        matching = Matching.objects.create(
+            user=test_user, target=other_user, decision="UNKNOWN"
+        )
+        assert not MutualMatch.objects.exists()
+
+        url = reverse("review-matching")
+        response = authenticated_client.post(
+            url, format="json", data={"matchingId": matching.id, "decision": "YES"}
+        )
+
+        assert response.status_code == 200
+        mine = MutualMatch.objects.get(user=test_user)
+        theirs = MutualMatch.objects.get(user=other_user)
+        assert (mine.other, mine.matching) == (other_user, reciprocal)
+        assert (theirs.other, theirs.matching) == (test_user, matching)
+        assert mine.matched_at == theirs.matched_at
+
     def test_review_already_reviewed_matching(
         self, authenticated_client, test_user, other_user
     ):
@@ -603,8 +1353,74 @@ class TestMatchesView:
                 if target_profile and hasattr(target_profile, "user_socials")
                 else None
             ),
+            "matched_at": MutualMatch.objects.get(user=test_user).matched_at,
         }
 
+    def test_matches_fixed_query_count(
+        self, authenticated_client, test_user, django_assert_num_queries
+    ):
+        """Test matches are listed with the same queries however many there are"""
+
+        artist = Artist.objects.create(name="Artist")
+        genre = Genre.objects.create(name="Genre")
+        concerts = [Concert.objects.create(concert_id=str(i)) for i in range(2)]
+        for i in range(6):
+            fan = User.objects.create_user(
+                username=f"fan{i}", password="fan12345", email=f"fan{i}@uwaterloo.ca"
+            )
+            profile = UserProfile.objects.get(user=fan)
+            profile.favorite_artists.add(artist)
+            profile.favorite_genres.add(genre)
+            Matching.objects.create(user=test_user, target=fan, decision="YES")
+            Matching.objects.create(
+                user=fan, target=test_user, decision="YES"
+            ).matched_concerts.set(concerts)
+
+        url = reverse("matches")
+        # ETag version, matches with profiles, then concerts, artists and genres
+        with django_assert_num_queries(5):
+            response = authenticated_client.get(url, format="json")
+
+        assert response.status_code == 200
+        assert len(response.data["matches"]) == 6
+        for match in response.data["matches"]:
+            assert sorted(match["concerts"]) == ["0", "1"]
+            assert match["top_artists"] == ["Artist"]
+            assert match["top_genres"] == ["Genre"]
+
+    def test_matches_since(self, authenticated_client, test_user, other_user):
+        """Test since only lists matches made after it"""
+
+        Matching.objects.create(user=test_user, target=other_user, decision="YES")
+        Matching.objects.create(user=other_user, target=test_user, decision="YES")
+        matched_at = MutualMatch.objects.get(user=test_user).matched_at
+
+        url = reverse("matches")
+        before = authenticated_client.get(
+            url, {"since": (matched_at - timedelta(seconds=1)).isoformat()}
+        )
+        after = authenticated_client.get(url, {"since": matched_at.isoformat()})
+        invalid = authenticated_client.get(url, {"since": "yesterday"})
+        out_of_range = authenticated_client.get(
+            url, {"since": "2024-13-45T00:00:00"}
+        )
+
+        assert [m["username"] for m in before.data["matches"]] == ["hello"]
+        assert after.data["matches"] == []
+        assert invalid.status_code == 400
+        assert out_of_range.status_code == 400
+
+    def test_deleted_matching_drops_match(self, test_user, other_user):
+        """Test deleting either decision removes the match both ways"""
+
+        Matching.objects.create(user=test_user, target=other_user, decision="YES")
+        Matching.objects.create(user=other_user, target=test_user, decision="YES")
+        assert MutualMatch.objects.count() == 2
+
+        Matching.objects.filter(user=test_user).delete()
+
+        assert not MutualMatch.objects.exists()
+
     def test_matches_with_other_user_rejection(
         self, authenticated_client, test_user, other_user
     ):
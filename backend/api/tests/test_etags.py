@@ -0,0 +1,214 @@
+"""Tests for ETags and conditional GETs on the concert and matching endpoints"""
+
+# pylint: disable=W0621
+from unittest.mock import patch
+
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ..models import Artist, Concert, FavoriteConcert, Matching, UserProfile
+from .builders import canned_responses, upstream_response
+
+
+def favorite(user, concert_id):
+    """Favorite the concert with the given Ticketmaster id for user"""
+    concert, _ = Concert.objects.get_or_create(concert_id=concert_id)
+    return FavoriteConcert.objects.create(user=user, concert=concert)
+
+
+def version(user, field):
+    """Current value of a version counter on the user's profile"""
+    return getattr(UserProfile.objects.get(user=user), field)
+
+
+@pytest.mark.django_db
+class TestVersionSignals:
+    """Test the profile versions are bumped by the data behind each endpoint"""
+
+    def test_favorite_bumps_owner_and_co_fans(self, test_user, other_user):
+        """Test a favorite changes the owner's favorites and co-fans' matchings"""
+
+        favorite(other_user, "123")
+        before = version(other_user, "matchings_version")
+
+        favorite(test_user, "123")
+
+        assert version(test_user, "favorites_version") == 1
+        assert version(other_user, "favorites_version") == 1
+        assert version(other_user, "matchings_version") == before + 1
+
+    def test_undecided_matching_bumps_nothing(self, test_user, other_user):
+        """Test creating an undecided matching leaves the versions alone"""
+
+        matching = Matching.objects.create(
+            user=test_user, target=other_user, decision="UNKNOWN"
+        )
+        assert version(test_user, "matches_version") == 0
+        assert version(test_user, "matchings_version") == 0
+
+        matching.decision = "YES"
+        matching.save()
+
+        assert version(test_user, "matchings_version") == 1
+        assert version(test_user, "matches_version") == 1
+        assert version(other_user, "matches_version") == 1
+
+    def test_profile_update_bumps_related_users(self, test_user, other_user):
+        """Test profile edits change the matches of users related to them"""
+
+        Matching.objects.create(user=test_user, target=other_user, decision="YES")
+        before = version(test_user, "matches_version")
+
+        profile = UserProfile.objects.get(user=other_user)
+        profile.first_name = "Renamed"
+        profile.save()
+
+        assert version(test_user, "matches_version") == before + 1
+
+    def test_profile_items_bump_co_fans(self, test_user, other_user):
+        """Test artist and genre edits change the matchings of co-fans"""
+
+        favorite(test_user, "123")
+        favorite(other_user, "123")
+        profile = UserProfile.objects.get(user=other_user)
+        before = version(test_user, "matchings_version")
+
+        profile.save()
+        assert version(test_user, "matchings_version") == before + 1
+
+        profile.favorite_artists.add(Artist.objects.create(name="Nina"))
+        assert version(test_user, "matchings_version") == before + 2
+
+        Artist.objects.get(name="Nina").favorited_by.clear()
+        assert version(test_user, "matchings_version") == before + 3
+
+
+@pytest.mark.django_db
+class TestVersionedETags:
+    """Test the per-user endpoints answer conditional GETs from the versions"""
+
+    def test_favorites_by_id_not_modified(self, authenticated_client, test_user):
+        """Test a current ETag is answered with 304 and a stale one is not"""
+
+        favorite(test_user, "123")
+        url = reverse("favorites_by_id")
+
+        response = authenticated_client.get(url)
+        assert response.status_code == 200
+        etag = response["ETag"]
+        assert etag.startswith('W/"')
+        assert "no-cache" in response["Cache-Control"]
+
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert not response.content
+
+        favorite(test_user, "456")
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+        assert list(response.data["concerts"]) == ["123", "456"]
+
+    def test_not_modified_skips_the_view(self, authenticated_client, test_user):
+        """Test a 304 is answered from the version without any other queries"""
+
+        url = reverse("matches")
+        etag = authenticated_client.get(url)["ETag"]
+
+        with patch("api.views.concert_views.Matching.objects") as objects:
+            response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 304
+        objects.filter.assert_not_called()
+
+    def test_matches_etag_follows_other_users_decisions(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test the other user's decision invalidates the matches ETag"""
+
+        Matching.objects.create(user=test_user, target=other_user, decision="YES")
+        url = reverse("matches")
+        response = authenticated_client.get(url)
+        assert response.data["matches"] == []
+        etag = response["ETag"]
+
+        Matching.objects.create(user=other_user, target=test_user, decision="YES")
+
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert len(response.data["matches"]) == 1
+
+    def test_etag_depends_on_user(
+        self, api_client, authenticated_client, test_user, other_user
+    ):
+        """Test one user's ETag is never current for another user"""
+
+        url = reverse("favorites_by_id")
+        etag = authenticated_client.get(url)["ETag"]
+
+        api_client.force_authenticate(user=other_user)
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+    def test_matchings_not_modified(self, authenticated_client, test_user, other_user):
+        """Test matchings are revalidated until a co-fan's favorites change"""
+
+        favorite(test_user, "123")
+        favorite(other_user, "123")
+        url = reverse("matchings")
+
+        response = authenticated_client.get(url)
+        assert len(response.data["matchings"]) == 1
+        etag = response["ETag"]
+        assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+        favorite(other_user, "456")
+        favorite(test_user, "456")
+
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data["matchings"][0]["concerts"] == ["123", "456"]
+
+    def test_matchings_follow_co_fan_artists(
+        self, authenticated_client, test_user, other_user
+    ):
+        """Test a co-fan's new artists invalidate the live matchings ETag"""
+
+        favorite(test_user, "123")
+        favorite(other_user, "123")
+        url = reverse("matchings")
+        etag = authenticated_client.get(url)["ETag"]
+
+        co_fan = APIClient()
+        co_fan.force_authenticate(user=other_user)
+        response = co_fan.post(
+            reverse("update-profile"),
+            {"favorite_artists": ["Nina"]},
+            format="json",
+        )
+        assert response.status_code == 200
+
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+
+@pytest.mark.django_db
+class TestContentETags:
+    """Test listings without versions still get content-hash ETags"""
+
+    @patch("api.ticketmaster.session.get")
+    def test_concerts_not_modified(self, mocked_get, authenticated_client):
+        """Test an unchanged concert listing is answered with 304"""
+
+        body = canned_responses()["populated_response"]
+        mocked_get.side_effect = lambda *_args, **_kwargs: upstream_response(body)
+        url = reverse("concerts")
+
+        response = authenticated_client.get(url)
+        assert response.status_code == 200
+        etag = response["ETag"]
+
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
@@ -0,0 +1,136 @@
+"""
+Test cases for geo radius filtering.
+"""
+
+import os
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..geo import (InvalidPoint, bounding_box, covered_by_mirror, haversine_km,
+                   parse_point)
+from ..models import SyncCheckpoint
+from .builders import music_event, upstream_response
+from .test_search import mirror
+
+
+def event_at(event_id, latitude, longitude):
+    """a music event whose venue sits at the given coordinates"""
+    event = music_event(event_id)
+    event["_embedded"]["venues"][0]["location"] = {
+        "latitude": str(latitude),
+        "longitude": str(longitude),
+    }
+    return event
+
+
+class TestGeoHelpers:
+    """Test cases for distance and bounding box helpers"""
+
+    def test_haversine_between_kw_and_toronto(self):
+        """Test the distance between the two default locations"""
+
+        distance = haversine_km(43.449791, -80.489090, 43.653225, -79.383186)
+        assert distance == pytest.approx(92.4, abs=1)
+
+    def test_bounding_box_contains_circle(self):
+        """Test points on the circle fall inside the box"""
+
+        min_lat, max_lat, min_lon, max_lon = bounding_box(43.45, -80.49, 20)
+        assert haversine_km(43.45, -80.49, max_lat, -80.49) == pytest.approx(20)
+        assert haversine_km(43.45, -80.49, 43.45, max_lon) >= 20
+        assert min_lat < 43.45 < max_lat
+        assert min_lon < -80.49 < max_lon
+
+    def test_parse_point(self):
+        """Test latlong and radius parsing and validation"""
+
+        assert parse_point("43.4,-80.5", "5") == (43.4, -80.5, 5.0)
+        assert parse_point("43.4,-80.5") == (43.4, -80.5, 20.0)
+        for latlong, radius in [("43.4", None), ("100,0", None), ("0,0", "0")]:
+            with pytest.raises(InvalidPoint):
+                parse_point(latlong, radius)
+
+    @pytest.mark.django_db
+    def test_covered_by_mirror(self):
+        """Test only circles inside a recently synced location are covered"""
+
+        assert not covered_by_mirror(43.46, -80.52, 5)
+        mirror()
+
+        assert covered_by_mirror(43.449791, -80.489090, 20)
+        assert covered_by_mirror(43.46, -80.52, 5)
+        assert not covered_by_mirror(43.449791, -80.489090, 50)
+        assert not covered_by_mirror(49.28, -123.12, 5)
+        # Toronto is configured but has not been synced
+        assert not covered_by_mirror(43.653225, -79.383186, 5)
+
+        SyncCheckpoint.objects.update(
+            synced_at=timezone.now()
+            - timedelta(seconds=settings.CONCERT_MIRROR_MAX_AGE + 60)
+        )
+        assert not covered_by_mirror(43.46, -80.52, 5)
+
+
+@pytest.mark.django_db
+class TestGeoListingView:
+    """Test cases for location listings"""
+
+    @patch("api.ticketmaster.session.get")
+    def test_location_served_locally(self, mocked_get, authenticated_client):
+        """Test a configured location is answered from the mirror"""
+
+        mirror(
+            event_at("near", 43.46, -80.52),
+            event_at("toronto", 43.653225, -79.383186),
+            event_at("edge", 43.449791, -80.2),
+        )
+
+        url = reverse("concerts") + "?location=KW"
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_not_called()
+        assert response.status_code == 200
+        assert [event["id"] for event in response.data["concerts"]] == ["near"]
+
+    @patch("api.ticketmaster.session.get")
+    def test_point_and_radius_served_locally(self, mocked_get, authenticated_client):
+        """Test an arbitrary circle inside a mirrored location is local"""
+
+        mirror(event_at("near", 43.46, -80.52), event_at("far", 43.40, -80.40))
+
+        url = reverse("concerts") + "?latlong=43.46,-80.52&radius=2"
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_not_called()
+        assert [event["id"] for event in response.data["concerts"]] == ["near"]
+
+    @patch("api.ticketmaster.session.get")
+    def test_uncovered_point_goes_upstream(self, mocked_get, authenticated_client):
+        """Test circles outside the mirror are passed on to Ticketmaster"""
+
+        mirror(event_at("near", 43.46, -80.52))
+        mocked_get.return_value = upstream_response(
+            {"page": {"totalElements": 0, "totalPages": 0}}
+        )
+
+        url = reverse("concerts") + "?latlong=49.28,-123.12&radius=5"
+        response = authenticated_client.get(url, format="json")
+
+        params = mocked_get.call_args.kwargs["params"]
+        assert params["latlong"] == "49.28,-123.12"
+        assert params["radius"] == "5"
+        assert params["apikey"] == os.environ["TICKETMASTER_KEY"]
+        assert response.status_code == 200
+
+    def test_invalid_point(self, authenticated_client):
+        """Test malformed coordinates are rejected"""
+
+        url = reverse("concerts") + "?latlong=north"
+        response = authenticated_client.get(url, format="json")
+
+        assert response.status_code == 400
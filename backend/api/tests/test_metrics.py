@@ -0,0 +1,140 @@
+"""
+Test cases for upstream metrics.
+"""
+
+# pylint: disable=W0621
+import logging
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import iscoroutinefunction
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import reverse
+
+from .. import metrics, ticketmaster
+from ..models import Concert, FavoriteConcert
+from .builders import upstream_page
+
+
+def value(snapshot, name, **labels):
+    """value of the series of name whose labels include labels"""
+    return sum(
+        metric["value"]
+        for metric in snapshot["metrics"]
+        if metric["name"] == name and labels.items() <= metric["labels"].items()
+    )
+
+
+@pytest.fixture
+def staff_client(api_client, test_user):
+    """An API client authenticated as a staff user"""
+    test_user.is_staff = True
+    test_user.save()
+    api_client.force_authenticate(user=test_user)
+    return api_client
+
+
+@pytest.mark.django_db
+class TestUpstreamMetrics:
+    """Test cases for recording upstream calls and cache lookups"""
+
+    @patch("api.ticketmaster.session.get")
+    def test_concerts_calls_are_labelled(self, mocked_get, authenticated_client):
+        """Test upstream calls are counted per view with latency and quota"""
+
+        mocked_get.side_effect = lambda *args, **kwargs: upstream_page([])
+
+        url = reverse("concerts")
+        authenticated_client.get(url)
+        authenticated_client.get(url)
+        snapshot = metrics.snapshot()
+
+        assert value(snapshot, "upstream_requests", view="concerts", status="200") == 1
+        assert value(snapshot, "upstream_latency_ms_count", path="events") == 1
+        assert value(snapshot, "cache_lookups", cache="listings", result="miss") == 1
+        assert value(snapshot, "cache_lookups", cache="listings", result="hit") == 1
+        assert snapshot["quota"]["used"] == 1
+        assert snapshot["quota"]["remaining"] == snapshot["quota"]["limit"] - 1
+
+    @patch("api.ticketmaster.session.get")
+    def test_batched_lookups_keep_the_view_label(
+        self, mocked_get, authenticated_client, test_user
+    ):
+        """Test lookups fanned out to worker threads are labelled with the view"""
+
+        concert = Concert.objects.create(concert_id="1")
+        FavoriteConcert.objects.create(concert=concert, user=test_user)
+        mocked_get.return_value = upstream_page([{"id": "1"}])
+
+        authenticated_client.get(reverse("favorites"))
+        snapshot = metrics.snapshot()
+
+        assert value(snapshot, "upstream_requests", view="favorites") == 1
+        assert value(snapshot, "cache_lookups", cache="events", result="miss") == 1
+
+    def test_middleware_stack_is_async(self, caplog):
+        """Test the ASGI handler runs the middleware without thread adapters"""
+
+        with caplog.at_level(logging.DEBUG, logger="django.request"):
+            ASGIHandler()
+
+        assert "ViewLabelMiddleware" not in caplog.text
+        assert iscoroutinefunction(
+            metrics.ViewLabelMiddleware(lambda request: None).__acall__
+        )
+
+    @patch("api.ticketmaster.session.get")
+    def test_open_circuit_is_counted(self, mocked_get):
+        """Test calls rejected by the breaker are counted but not charged"""
+
+        for _ in range(ticketmaster.breaker.failure_threshold):
+            ticketmaster.breaker.record_failure()
+
+        with pytest.raises(ticketmaster.UpstreamUnavailable):
+            ticketmaster.get("events", {})
+        snapshot = metrics.snapshot()
+
+        mocked_get.assert_not_called()
+        assert (
+            value(
+                snapshot, "upstream_requests", view="background", status="circuit_open"
+            )
+            == 1
+        )
+        assert snapshot["quota"]["used"] == 0
+
+    def test_totals_are_summed_across_workers(self):
+        """Test the snapshot adds up the totals every worker flushed"""
+
+        other_worker = metrics.Registry()
+        other_worker.add(metrics.series("quota", day=metrics.today()), 3)
+        other_worker.flush()
+        metrics.registry.add(metrics.series("quota", day=metrics.today()), 2)
+
+        assert metrics.snapshot()["quota"]["used"] == 5
+
+
+@pytest.mark.django_db
+class TestMetricsView:
+    """Test cases for the metrics endpoint"""
+
+    def test_requires_staff(self, authenticated_client):
+        """Test regular users cannot read the metrics"""
+
+        response = authenticated_client.get(reverse("metrics"))
+        assert response.status_code == 403
+
+    def test_metrics(self, staff_client):
+        """Test staff users get the metrics and quota"""
+
+        metrics.observe_upstream("events", 200, 0.12)
+
+        response = staff_client.get(reverse("metrics"))
+
+        assert response.status_code == 200
+        assert response.data["quota"]["used"] == 1
+        assert {
+            "name": "upstream_latency_ms_bucket",
+            "labels": {"path": "events", "le": "250"},
+            "value": 1,
+        } in response.data["metrics"]
@@ -0,0 +1,133 @@
+"""
+Test cases for local search over the mirrored catalog.
+"""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import SyncCheckpoint, TicketmasterEvent
+from ..search import search_events
+from .builders import music_event
+
+
+def mirror(*events):
+    """store events in the local mirror and mark it as synced"""
+    synced_at = timezone.now()
+    for event in events:
+        TicketmasterEvent.from_payload(event["id"], event).save()
+    SyncCheckpoint.objects.create(scope="location:KW", synced_at=synced_at)
+
+
+@pytest.mark.django_db
+class TestSearchEvents:
+    """Test cases for the in-process fallback search engine"""
+
+    def test_ranks_name_matches_first(self):
+        """Test events matching in higher weighted columns rank first"""
+
+        genre_match = music_event("genre", name="Night Out")
+        genre_match["classifications"] = [{"genre": {"name": "Jazz"}}]
+        mirror(genre_match, music_event("name", name="Jazz Festival"))
+
+        events, has_more = search_events("jazz")
+
+        assert [event["id"] for event in events] == ["name", "genre"]
+        assert not has_more
+
+    def test_all_tokens_must_match(self):
+        """Test multi-word queries only match events containing every word"""
+
+        mirror(music_event("1", name="Blue Rodeo"), music_event("2", name="Blue"))
+
+        events, _ = search_events("blue rodeo")
+
+        assert [event["id"] for event in events] == ["1"]
+
+    def test_skips_past_events(self):
+        """Test events that already started are not returned"""
+
+        mirror(music_event("old", name="Blue", start="2001-01-01T00:00:00Z"))
+
+        events, _ = search_events("blue")
+
+        assert events == []
+
+    def test_skips_events_unseen_by_last_sync(self):
+        """Test events the last sync no longer listed are not returned"""
+
+        gone = music_event("gone", name="Blue")
+        TicketmasterEvent.from_payload(
+            "gone", gone, timezone.now() - timedelta(hours=1)
+        ).save()
+        mirror(music_event("kept", name="Blue"))
+
+        events, _ = search_events("blue")
+
+        assert [event["id"] for event in events] == ["kept"]
+
+    def test_paging(self):
+        """Test offset and limit page through the ranked results"""
+
+        mirror(*[music_event(str(i), name="Blue") for i in range(3)])
+
+        events, has_more = search_events("blue", offset=0, limit=2)
+        assert len(events) == 2
+        assert has_more
+
+        events, has_more = search_events("blue", offset=2, limit=2)
+        assert len(events) == 1
+        assert not has_more
+
+
+@pytest.mark.django_db
+class TestLocalSearchView:
+    """Test cases for serving concert searches from the mirror"""
+
+    @patch("api.ticketmaster.session.get")
+    def test_query_served_locally(self, mocked_get, authenticated_client):
+        """Test keyword searches skip Ticketmaster once the mirror has synced"""
+
+        mirror(music_event("1", name="The Band Live"))
+
+        url = reverse("concerts") + "?query=band"
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_not_called()
+        assert response.status_code == 200
+        assert [event["id"] for event in response.data["concerts"]] == ["1"]
+        assert response.data["next"] is None
+
+    @patch("api.ticketmaster.session.get")
+    def test_stale_mirror_goes_upstream(self, mocked_get, authenticated_client):
+        """Test a mirror not synced within CONCERT_MIRROR_MAX_AGE is not used"""
+
+        mirror(music_event("1", name="The Band Live"))
+        SyncCheckpoint.objects.update(
+            synced_at=timezone.now()
+            - timedelta(seconds=settings.CONCERT_MIRROR_MAX_AGE + 60)
+        )
+        mocked_get.side_effect = Exception("upstream called")
+
+        url = reverse("concerts") + "?query=band"
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_called_once()
+        assert response.status_code == 500
+
+    @patch("api.ticketmaster.session.get")
+    def test_query_with_onsale_goes_upstream(self, mocked_get, authenticated_client):
+        """Test filters the mirror cannot answer still use Ticketmaster"""
+
+        mirror(music_event("1", name="The Band Live"))
+        mocked_get.side_effect = Exception("upstream called")
+
+        url = reverse("concerts") + "?query=band&onsaleSoon=true"
+        response = authenticated_client.get(url, format="json")
+
+        mocked_get.assert_called_once()
+        assert response.status_code == 500
@@ -0,0 +1,149 @@
+"""
+Test cases for single-flight coalescing.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+
+from ..singleflight import (AsyncSingleFlight, CoalescedCallFailed,
+                            SingleFlight, canonical_key, shared_flight)
+
+
+class TestSingleFlight:
+    """Test cases for in-process coalescing"""
+
+    def test_concurrent_callers_share_one_call(self):
+        """Test callers arriving while a call is in flight reuse its result"""
+
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"events": []}
+
+        results = []
+
+        def caller():
+            results.append(flights.do("k", slow_call))
+
+        leader = threading.Thread(target=caller)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=caller) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert results == [{"events": []}] * 5
+
+    def test_error_is_shared(self):
+        """Test the leader's exception is raised to the caller"""
+
+        flights = SingleFlight()
+
+        def failing_call():
+            raise ValueError("upstream down")
+
+        with pytest.raises(ValueError):
+            flights.do("k", failing_call)
+        assert not flights.calls
+
+    def test_canonical_key_ignores_param_order(self):
+        """Test equivalent parameter dicts coalesce onto the same key"""
+
+        assert canonical_key("events", {"a": "1", "b": "2"}) == canonical_key(
+            "events", {"b": "2", "a": "1"}
+        )
+        assert canonical_key("events", {"a": "1"}) != canonical_key(
+            "events", {"a": "2"}
+        )
+
+
+class TestSharedFlight:
+    """Test cases for cross-worker coalescing through the cache"""
+
+    def test_follower_reuses_leader_result(self):
+        """Test a worker finding the lock taken waits for the holder's result"""
+
+        cache.set("singleflight:lock:k", "leader")
+        cache.set("singleflight:result:k:leader", {"ok": True, "result": [1]})
+
+        def call():
+            raise AssertionError("follower must not call upstream")
+
+        assert shared_flight("k", call) == [1]
+        cache.clear()
+
+    def test_follower_sees_leader_failure(self):
+        """Test a failed leader call is reported to waiting workers"""
+
+        cache.set("singleflight:lock:k", "leader")
+        cache.set("singleflight:result:k:leader", {"ok": False})
+
+        with pytest.raises(CoalescedCallFailed):
+            shared_flight("k", lambda: [1])
+        cache.clear()
+
+    def test_leader_releases_lock(self):
+        """Test the lock is released once the leader has published its result"""
+
+        assert shared_flight("k", lambda: [1]) == [1]
+        assert cache.get("singleflight:lock:k") is None
+
+
+class TestAsyncSingleFlight:
+    """Test cases for coalescing coroutines on one event loop"""
+
+    def test_concurrent_callers_share_one_call(self):
+        """Test coroutines awaiting the same key share one call"""
+
+        flights = AsyncSingleFlight()
+        calls = []
+
+        async def slow_call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"events": []}
+
+        async def callers():
+            return await asyncio.gather(
+                *(flights.do("k", slow_call) for _ in range(5))
+            )
+
+        results = asyncio.run(callers())
+
+        assert calls == [1]
+        assert results == [{"events": []}] * 5
+        assert not flights.calls
+
+    def test_error_is_shared(self):
+        """Test every waiting coroutine sees the leader's failure"""
+
+        flights = AsyncSingleFlight()
+
+        async def failing_call():
+            await asyncio.sleep(0.05)
+            raise ValueError("upstream down")
+
+        async def callers():
+            return await asyncio.gather(
+                *(flights.do("k", failing_call) for _ in range(3)),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(callers())
+
+        assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,107 @@
+"""
+Test cases for the Ticketmaster client helpers.
+"""
+
+from unittest.mock import patch
+
+import pytest
+import requests
+from django.conf import settings
+from requests import Response
+
+from .. import ticketmaster
+from ..ticketmaster import CircuitBreaker, TokenBucket, UpstreamUnavailable
+
+
+class TestTokenBucket:
+    """Test cases for the upstream rate limiter"""
+
+    def test_burst_up_to_capacity(self):
+        """Test tokens are handed out without waiting up to capacity"""
+
+        bucket = TokenBucket(rate=5)
+        with patch("api.ticketmaster.time.sleep") as mocked_sleep:
+            for _ in range(5):
+                bucket.acquire()
+        mocked_sleep.assert_not_called()
+
+    def test_waits_when_empty(self):
+        """Test an empty bucket sleeps until the next token is available"""
+
+        bucket = TokenBucket(rate=5)
+        bucket.tokens = 0
+        clock = [100.0]
+        bucket.updated_at = clock[0]
+
+        def advance(seconds):
+            clock[0] += seconds
+
+        with patch("api.ticketmaster.time.monotonic", side_effect=lambda: clock[0]):
+            with patch("api.ticketmaster.time.sleep", side_effect=advance) as sleep:
+                bucket.acquire()
+
+        sleep.assert_called_once()
+        assert abs(sleep.call_args[0][0] - 0.2) < 1e-9
+
+
+class TestCircuitBreaker:
+    """Test cases for the upstream circuit breaker"""
+
+    def test_opens_after_threshold(self):
+        """Test the circuit rejects calls once enough failures were recorded"""
+
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        with pytest.raises(UpstreamUnavailable):
+            breaker.before_call()
+
+    def test_half_open_after_reset_timeout(self):
+        """Test one trial call is allowed after the reset timeout"""
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        with patch("api.ticketmaster.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+        with patch("api.ticketmaster.time.monotonic", return_value=131.0):
+            breaker.before_call()
+            breaker.record_failure()
+            with pytest.raises(UpstreamUnavailable):
+                breaker.before_call()
+
+    def test_success_closes_circuit(self):
+        """Test a success clears previously recorded failures"""
+
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.before_call()
+
+
+class TestUpstreamGet:
+    """Test cases for the shared upstream GET helper"""
+
+    def test_session_retries_and_pools(self):
+        """Test the shared session is mounted with retries and a sized pool"""
+
+        adapter = ticketmaster.session.get_adapter("https://app.ticketmaster.com")
+        assert adapter.max_retries.status_forcelist == ticketmaster.RETRY_STATUSES
+        assert adapter.max_retries.backoff_jitter > 0
+        assert adapter._pool_maxsize == settings.TICKETMASTER_POOL_SIZE
+
+    @patch("api.ticketmaster.session.get")
+    def test_server_errors_trip_breaker(self, mocked_get):
+        """Test repeated 5xx responses open the circuit and skip the network"""
+
+        res = Response()
+        res.status_code = 503
+        mocked_get.return_value = res
+
+        for _ in range(settings.TICKETMASTER_BREAKER_THRESHOLD):
+            with pytest.raises(requests.HTTPError):
+                ticketmaster.get("events", {})
+        with pytest.raises(UpstreamUnavailable):
+            ticketmaster.get("events", {})
+
+        assert mocked_get.call_count == settings.TICKETMASTER_BREAKER_THRESHOLD
@@ -0,0 +1,384 @@
+"""
+Shared client for all Ticketmaster Discovery API traffic.
+
+Every upstream call goes through one pooled keep-alive session per process,
+is gated by a token bucket sized to the API quota, retries 429/5xx responses
+with jittered backoff and fails fast while the circuit breaker is open.
+
+The a-prefixed coroutines are the same client for async views: they share
+the rate limiter and circuit breaker but go through one pooled httpx client
+per event loop, so a process can hold many upstream calls in flight without
+a thread per call.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+from .singleflight import (
+    AsyncSingleFlight,
+    CoalescedCallFailed,
+    SingleFlight,
+    canonical_key,
+    shared_flight,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ticketmaster returns 20 events per page unless a size is requested.
+DEFAULT_PAGE_SIZE = 20
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how fast upstream calls are started"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """consume a token if one is available, returns the seconds to wait
+        before trying again otherwise and 0 on success"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """block until a token is available and consume it"""
+        while wait := self.try_acquire():
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """wait without blocking the event loop until a token is available
+        and consume it"""
+        while wait := self.try_acquire():
+            await asyncio.sleep(wait)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling Ticketmaster while the circuit is open"""
+
+
+class MalformedResponse(UpstreamUnavailable):
+    """Raised for a Ticketmaster body that is not a page of events, such as
+    the fault of a rejected API key"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive upstream failures and rejects calls until
+    reset_timeout has passed, then lets a trial call through"""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """raise UpstreamUnavailable while the circuit is open"""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise UpstreamUnavailable("Ticketmaster circuit is open")
+            # half-open: allow one trial call, a failure re-opens immediately
+            self.opened_at = None
+            self.failures = self.failure_threshold - 1
+
+    def record_success(self):
+        """close the circuit"""
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        """count a failure, opening the circuit at the threshold"""
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(
+                        "Ticketmaster circuit opened after %s failures", self.failures
+                    )
+                self.opened_at = time.monotonic()
+
+    def reset(self):
+        """forget all recorded failures"""
+        self.record_success()
+
+
+def build_session():
+    """create a keep-alive session with a tuned connection pool and retries"""
+    retry = Retry(
+        total=settings.TICKETMASTER_RETRIES,
+        backoff_factor=0.25,
+        backoff_jitter=0.25,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.TICKETMASTER_POOL_SIZE,
+        max_retries=retry,
+    )
+    new_session = requests.Session()
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+    return new_session
+
+
+session = build_session()
+breaker = CircuitBreaker(
+    settings.TICKETMASTER_BREAKER_THRESHOLD, settings.TICKETMASTER_BREAKER_RESET
+)
+rate_limiter = TokenBucket(settings.TICKETMASTER_RATE_LIMIT)
+flights = SingleFlight()
+async_flights = AsyncSingleFlight()
+# httpx connection pools are bound to the loop they were opened on
+async_clients = weakref.WeakKeyDictionary()
+executor = ThreadPoolExecutor(
+    max_workers=settings.TICKETMASTER_MAX_WORKERS, thread_name_prefix="ticketmaster"
+)
+
+
+def upstream_request(path, params):
+    """(url, query params) of a Discovery API call"""
+    return (
+        f'{os.environ["TICKETMASTER_URL_BASE"]}/{path}',
+        {"apikey": os.environ["TICKETMASTER_KEY"], **params},
+    )
+
+
+def before_call(path):
+    """fail fast while the circuit is open, counting the rejected call"""
+    try:
+        breaker.before_call()
+    except UpstreamUnavailable:
+        metrics.observe_rejected(path)
+        raise
+
+
+def session_attempts(response):
+    """requests the shared session made to produce response, retries included"""
+    retries = getattr(response.raw, "retries", None)
+    return 1 + (len(retries.history) if retries is not None else 0)
+
+
+def get(path, params):
+    """GET a Discovery API path through the shared session and return the
+    decoded JSON body"""
+    before_call(path)
+    rate_limiter.acquire()
+    started = time.monotonic()
+    try:
+        url, query = upstream_request(path, params)
+        response = session.get(url, params=query, timeout=settings.TICKETMASTER_TIMEOUT)
+        metrics.observe_upstream(
+            path,
+            response.status_code,
+            time.monotonic() - started,
+            session_attempts(response),
+        )
+        if response.status_code in RETRY_STATUSES:
+            response.raise_for_status()
+    except requests.RequestException as e:
+        if e.response is None:
+            # connection errors and timeouts surface once retries ran out
+            metrics.observe_upstream(
+                path,
+                "error",
+                time.monotonic() - started,
+                settings.TICKETMASTER_RETRIES + 1,
+            )
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return response.json()
+
+
+def get_coalesced(path, params):
+    """like get(), but identical concurrent requests share one upstream call,
+    within this worker and across workers holding the shared cache lock"""
+    key = canonical_key(path, params)
+    try:
+        return flights.do(key, lambda: shared_flight(key, lambda: get(path, params)))
+    except CoalescedCallFailed as e:
+        raise UpstreamUnavailable(str(e)) from e
+
+
+def async_client():
+    """the keep-alive httpx client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = async_clients.get(loop)
+    if client is None:
+        client = async_clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.TICKETMASTER_ASYNC_POOL_SIZE,
+                max_keepalive_connections=settings.TICKETMASTER_POOL_SIZE,
+            ),
+            timeout=settings.TICKETMASTER_TIMEOUT,
+        )
+    return client
+
+
+def retry_delay(attempt, response=None):
+    """seconds to wait before retry number attempt, honouring Retry-After"""
+    retry_after = ""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return float(retry_after)
+    return 0.25 * 2**attempt + random.uniform(0, 0.25)
+
+
+async def aget(path, params):
+    """async get(), retrying 429/5xx responses and transport errors"""
+    before_call(path)
+    await rate_limiter.aacquire()
+    url, query = upstream_request(path, params)
+    retries = settings.TICKETMASTER_RETRIES
+    started = time.monotonic()
+    status = "error"
+    try:
+        for attempt in range(retries + 1):
+            try:
+                response = await async_client().get(url, params=query)
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(retry_delay(attempt))
+                continue
+            status = response.status_code
+            if status not in RETRY_STATUSES:
+                break
+            if attempt == retries:
+                response.raise_for_status()
+            await asyncio.sleep(retry_delay(attempt, response))
+    except httpx.HTTPError:
+        breaker.record_failure()
+        raise
+    finally:
+        metrics.observe_upstream(path, status, time.monotonic() - started, attempt + 1)
+    breaker.record_success()
+    return response.json()
+
+
+async def aget_coalesced(path, params):
+    """like aget(), but identical concurrent requests on this event loop
+    share one upstream call"""
+    return await async_flights.do(
+        canonical_key(path, params), lambda: aget(path, params)
+    )
+
+
+def in_context(fn):
+    """wrap fn to run on executor threads in a copy of the caller's context,
+    so their upstream calls are labelled with the caller's view"""
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(fn, *args)
+
+
+def chunked(items, size):
+    """split items into consecutive lists of at most size elements"""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def event_batch_params(event_ids):
+    """params of a multi-id request for up to one page of events"""
+    request_params = {"id": ",".join(event_ids), "includeTest": "no"}
+    if len(event_ids) > DEFAULT_PAGE_SIZE:
+        request_params["size"] = len(event_ids)
+    return request_params
+
+
+def events_by_id(event_ids, response):
+    """{event_id: event} for the ids found in a multi-id response, raises
+    MalformedResponse unless it is a page of events, so that ids are only
+    taken as missing when Ticketmaster actually left them out"""
+    page = response.get("page") if isinstance(response, dict) else None
+    if not isinstance(page, dict) or "totalElements" not in page:
+        logger.error("unexpected response structure: %s", response)
+        raise MalformedResponse("Unexpected Ticketmaster response")
+    if page["totalElements"] == 0:
+        return {}
+
+    events = response.get("_embedded", {}).get("events")
+    if not isinstance(events, list):
+        logger.error("unexpected response structure: %s", response)
+        raise MalformedResponse("Unexpected Ticketmaster response")
+    if len(event_ids) == 1:
+        return {event_ids[0]: events[0]}
+    return {event["id"]: event for event in events if event.get("id") in event_ids}
+
+
+def fetch_event_batch(event_ids):
+    """fetch up to one page of events in a single multi-id request,
+    returns {event_id: event} for the ids Ticketmaster knows about"""
+    return events_by_id(event_ids, get("events", event_batch_params(event_ids)))
+
+
+async def afetch_event_batch(event_ids):
+    """async fetch_event_batch()"""
+    response = await aget("events", event_batch_params(event_ids))
+    return events_by_id(event_ids, response)
+
+
+def fetch_events(event_ids):
+    """fetch events in chunked multi-id requests issued concurrently,
+    returns {event_id: event} for every id that was found"""
+    fetched = {}
+    chunks = chunked(list(event_ids), settings.TICKETMASTER_BATCH_SIZE)
+    for events in executor.map(in_context(fetch_event_batch), chunks):
+        fetched.update(events)
+    return fetched
+
+
+def iter_event_batches(event_ids):
+    """like fetch_events(), but yield {event_id: event} for each multi-id
+    request as soon as it completes"""
+    chunks = chunked(list(event_ids), settings.TICKETMASTER_BATCH_SIZE)
+    batch = in_context(fetch_event_batch)
+    futures = [executor.submit(batch, chunk) for chunk in chunks]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # the consumer went away, don't start batches nobody will read
+        for future in futures:
+            future.cancel()
+
+
+async def afetch_events(event_ids):
+    """async fetch_events(), with every batch in flight at once"""
+    fetched = {}
+    chunks = chunked(list(event_ids), settings.TICKETMASTER_BATCH_SIZE)
+    for events in await asyncio.gather(*map(afetch_event_batch, chunks)):
+        fetched.update(events)
+    return fetched
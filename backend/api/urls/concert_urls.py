@@ -2,6 +2,7 @@
 
 from django.urls import path
 
+from ..views import async_concert_views
 from ..views.concert_views import (concerts, favorite, matches, matchings,
                                    review_matching, user_favorite_concerts, user_favorite_concerts_by_id, unfavorite, get_concert, delete_match)
 
@@ -15,5 +16,17 @@ urlpatterns = [
     path("matchings/", matchings, name="matchings"),
     path("review-matching/", review_matching, name="review-matching"),
     path("matches/", matches, name="matches"),
-    path("delete_match/", delete_match, name="delete_match")
+    path("delete_match/", delete_match, name="delete_match"),
+    # async versions of the upstream-bound views, for ASGI deployments
+    path("async/", async_concert_views.concerts, name="async_concerts"),
+    path(
+        "async/concert_by_id/",
+        async_concert_views.get_concert,
+        name="async_get_concert",
+    ),
+    path(
+        "async/favorites/",
+        async_concert_views.user_favorite_concerts,
+        name="async_favorites",
+    ),
 ]
@@ -0,0 +1,9 @@
+"""configures urls associated with metrics"""
+
+from django.urls import path
+
+from ..views.metrics_views import upstream_metrics
+
+urlpatterns = [
+    path("", upstream_metrics, name="metrics"),
+]
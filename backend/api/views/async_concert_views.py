@@ -0,0 +1,130 @@
+"""
+Async versions of the concert views for deployments served over ASGI.
+
+Upstream calls go through the async Ticketmaster client and database access
+through the async ORM, so a worker process can hold many slow Ticketmaster
+requests in flight at once instead of blocking a thread on each of them.
+"""
+
+import logging
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+
+from .. import geo, ticketmaster
+from ..authentication import CookieTokenAuthentication
+from ..etags import favorite_events_version, versioned_etag
+from ..event_cache import aget_events
+from ..listings import InvalidCursor, afetch_listing, prefetch_listing
+from ..ticketmaster import UpstreamUnavailable
+from .concert_views import (MAX_CONCERT_IDS, STALE_HEADER, compact_events,
+                            favorite_concert_ids, listing_request,
+                            local_listing, requested_concert_ids,
+                            servable_locally, upstream_listing)
+
+logger = logging.getLogger(__name__)
+
+
+def async_authenticated(view):
+    """authenticate an async view with the knox token cookie, answering 401
+    like the DRF views when it is missing or invalid"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            auth_result = await sync_to_async(CookieTokenAuthentication().authenticate)(
+                request
+            )
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=401)
+        if not auth_result:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=401,
+            )
+        request.user, request.auth = auth_result
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+@require_GET
+@async_authenticated
+async def concerts(request):
+    """async version of concert_views.concerts"""
+    try:
+        request_params, search_params, point, onsale_params = listing_request(
+            request.GET
+        )
+        if await sync_to_async(servable_locally)(search_params, point, onsale_params):
+            body = await sync_to_async(local_listing)(
+                request, request_params, search_params, point
+            )
+            return JsonResponse(body, status=200)
+
+        response, is_stale = await afetch_listing(request_params)
+        body, next_params = upstream_listing(request, request_params, response)
+        if next_params and settings.CONCERT_PREFETCH_NEXT_PAGE:
+            await sync_to_async(prefetch_listing)(next_params)
+
+        headers = {STALE_HEADER: "true"} if is_stale else None
+        return JsonResponse(body, status=200, headers=headers)
+    except (InvalidCursor, geo.InvalidPoint) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except UpstreamUnavailable:
+        return JsonResponse({"error": "Service temporarily unavailable"}, status=503)
+    except Exception as e:
+        logger.error("Concert fetch error: %s", str(e))
+        return JsonResponse(
+            {"error": "Unable to fetch concerts. Please try again later."}, status=500
+        )
+
+
+@require_GET
+@async_authenticated
+async def get_concert(request):
+    """async version of concert_views.get_concert"""
+    try:
+        concert_ids = requested_concert_ids(request.GET)
+        if concert_ids is None:
+            return JsonResponse(
+                {"error": f"At most {MAX_CONCERT_IDS} ids per request"}, status=400
+            )
+        if concert_ids:
+            events = await aget_events(concert_ids)
+            return JsonResponse({"concerts": compact_events(request, events)})
+
+        response = await ticketmaster.aget("events", {"id": ""})
+        events = []
+        if "page" in response and response["page"]["totalElements"] > 0:
+            events = response["_embedded"]["events"]
+        return JsonResponse({"concerts": compact_events(request, events)})
+    except UpstreamUnavailable:
+        return JsonResponse({"error": "Service temporarily unavailable"}, status=503)
+    except Exception as e:
+        logger.error("Concert fetch error: %s", str(e))
+        return JsonResponse(
+            {"error": "Unable to fetch concerts. Please try again later."}, status=500
+        )
+
+
+@require_GET
+@async_authenticated
+@versioned_etag(favorite_events_version)
+async def user_favorite_concerts(request):
+    """async version of concert_views.user_favorite_concerts"""
+    try:
+        tm_concert_ids = [
+            concert_id async for concert_id in favorite_concert_ids(request.user)
+        ]
+        fetched_concerts = await aget_events(tm_concert_ids)
+        return JsonResponse({"concerts": compact_events(request, fetched_concerts)})
+    except UpstreamUnavailable:
+        return JsonResponse({"error": "Service temporarily unavailable"}, status=503)
+    except Exception as e:
+        logger.error("Unable to fetch favorited concerts: %s", str(e))
+        return JsonResponse({"error": "Unable to fetch favorited concerts"}, status=500)
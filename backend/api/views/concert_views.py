@@ -6,12 +6,15 @@ This module contains all the views related with concert interractions
 
 import json
 import logging
-import os
 from datetime import datetime
+from itertools import islice
 
-import requests
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
 from rest_framework.decorators import (
     api_view,
     authentication_classes,
@@ -19,33 +22,67 @@ from rest_framework.decorators import (
 )
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-import time
 
+from .. import geo, search, ticketmaster
 from ..authentication import CookieTokenAuthentication
-from ..models import MATCHING_DECISIONS, Concert, FavoriteConcert, Matching, UserProfile
+from ..etags import (favorite_events_version, favorites_version,
+                     matches_version, matchings_version, versioned_etag)
+from ..event_cache import get_events, iter_events
+from ..listings import (InvalidCursor, encode_cursor, fetch_listing,
+                        next_page_params, paging_params, prefetch_listing)
+from ..matching import (create_matchings, page_params, ranked_candidates,
+                        request_precomputed_at)
+from ..models import (MATCHING_DECISIONS, Concert, FavoriteConcert, Matching,
+                      MutualMatch)
+from ..serializers import compact_event
+from ..ticketmaster import UpstreamUnavailable
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-LOCATIONS = {"KW": "43.449791,-80.489090", "TO": "43.653225,-79.383186"}
 VENUES = {"HISTORY": "KovZ917AJ4f"}
+# set on listings served from the cache past their freshness window
+STALE_HEADER = "X-Concerts-Stale"
+# most event ids one concert lookup may ask for
+MAX_CONCERT_IDS = 200
+
+
+def requested_fields(request):
+    """raw event sub-objects the client opted into with `fields=a,b`"""
+    return {field for field in request.GET.get("fields", "").split(",") if field}
+
+
+def requested_concert_ids(query_params):
+    """ids of a single `id` or a comma separated list of `ids`, None when
+    there are more than MAX_CONCERT_IDS"""
+    ids_param = query_params.get("ids", query_params.get("id", ""))
+    concert_ids = [concert_id for concert_id in ids_param.split(",") if concert_id]
+    return concert_ids if len(concert_ids) <= MAX_CONCERT_IDS else None
+
+
+def compact_events(request, events):
+    """compact events, keeping the raw sub-objects requested in `fields=`"""
+    fields = requested_fields(request)
+    return [compact_event(event, fields) for event in events]
 
 
 @api_view(["GET"])
 @authentication_classes([CookieTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def get_concert(request):
-    """fetch all concerts based on query passed in"""
+    """fetch concerts by a single `id` or a comma separated list of `ids`"""
     try:
-        request_params = {"apikey": os.environ["TICKETMASTER_KEY"], "id": ""}
-        concert_id = request.GET.get("id", "")
-        if concert_id != "":
-            request_params["id"] = concert_id
-        response = requests.get(
-            f'{os.environ["TICKETMASTER_URL_BASE"]}/events',
-            params=request_params,
-            timeout=10,
-        ).json()
+        request_params = {"id": ""}
+        concert_ids = requested_concert_ids(request.GET)
+        if concert_ids is None:
+            return Response(
+                {"error": f"At most {MAX_CONCERT_IDS} ids per request"}, status=400
+            )
+        if concert_ids:
+            events = get_events(concert_ids)
+            return Response({"concerts": compact_events(request, events)}, status=200)
+
+        response = ticketmaster.get("events", request_params)
 
         events = []
         logger.info(
@@ -55,7 +92,9 @@ def get_concert(request):
         if "page" in response and response["page"]["totalElements"] > 0:
             events = response["_embedded"]["events"]
 
-        return Response({"concerts": events}, status=200)
+        return Response({"concerts": compact_events(request, events)}, status=200)
+    except UpstreamUnavailable:
+        return Response({"error": "Service temporarily unavailable"}, status=503)
     except Exception as e:
         logger.error("Concert fetch error: %s", str(e))
         return Response(
@@ -63,52 +102,122 @@ def get_concert(request):
         )
 
 
+def listing_request(query_params):
+    """return (upstream params, keyword, search point, onsale flag) for a
+    concert listing request"""
+    request_params = {
+        "radius": "20",
+        "unit": "km",
+        "classificationName": "Music",
+        "includeTest": "no",
+        "sort": "date,asc",
+    }
+
+    search_params = query_params.get("query", None)
+    location_params = query_params.get("location", "ALL")
+    latlong_params = query_params.get("latlong", None)
+    venue_params = query_params.get("venue", None)
+    onsale_params = query_params.get("onsaleSoon", False)
+
+    point = None
+    if latlong_params:
+        point = geo.parse_point(latlong_params, query_params.get("radius"))
+    elif location_params != "ALL":
+        point = geo.location_point(location_params)
+
+    if search_params:
+        request_params["keyword"] = search_params
+    if point:
+        request_params["latlong"] = f"{point[0]},{point[1]}"
+        request_params["radius"] = f"{point[2]:g}"
+    if venue_params:
+        request_params["venueId"] = VENUES[venue_params]
+    if onsale_params:
+        today = datetime.today().strftime("%Y-%m-%dT00:00:00Z")
+        request_params["onsaleStartDateTime"] = today
+        request_params["startDateTime"] = today
+    request_params.update(paging_params(query_params))
+    return request_params, search_params, point, onsale_params
+
+
+def servable_locally(query, point, onsale):
+    """whether a listing can be answered from the local mirror"""
+    covered = geo.covered_by_mirror(*point) if point else bool(query)
+    return (
+        covered
+        and not onsale
+        and settings.CONCERT_LOCAL_SEARCH
+        and search.mirror_available()
+    )
+
+
+def local_listing(request, request_params, query=None, point=None):
+    """serve a listing from the local mirror instead of Ticketmaster, ranked
+    by relevance for a keyword search and by date otherwise"""
+    page = int(request_params.get("page", 0))
+    size = int(request_params.get("size", ticketmaster.DEFAULT_PAGE_SIZE))
+    queryset = search.upcoming_events()
+    if "venueId" in request_params:
+        queryset = queryset.filter(venue_id=request_params["venueId"])
+    if point:
+        queryset = geo.within_bounding_box(queryset, *point)
+
+    if query:
+        rows = search.rank_events(query, queryset)
+    else:
+        rows = queryset.order_by("starts_at")
+    if point:
+        rows = geo.within_radius(rows, *point)
+
+    selected = list(islice(rows, page * size, (page + 1) * size + 1))
+    next_cursor = encode_cursor(page + 1, size) if len(selected) > size else None
+    events = [row.data for row in selected[:size]]
+    return {"concerts": compact_events(request, events), "next": next_cursor}
+
+
+def upstream_listing(request, request_params, response):
+    """return (body, params of the next page or None) for a page of events
+    fetched from Ticketmaster"""
+    events = []
+    logger.info(
+        "total retrieved events: %s",
+        response.get("page", {}).get("totalElements", 0),
+    )
+    if "page" in response and response["page"]["totalElements"] > 0:
+        events = response["_embedded"]["events"]
+
+    next_cursor = None
+    next_params = next_page_params(request_params, response)
+    if next_params:
+        next_cursor = encode_cursor(int(next_params["page"]), int(next_params["size"]))
+    body = {"concerts": compact_events(request, events), "next": next_cursor}
+    return body, next_params
+
+
 @api_view(["GET"])
 @authentication_classes([CookieTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def concerts(request):
     """fetch all concerts based on query passed in"""
     try:
-        request_params = {
-            "apikey": os.environ["TICKETMASTER_KEY"],
-            "radius": "20",
-            "unit": "km",
-            "classificationName": "Music",
-            "includeTest": "no",
-            "sort": "date,asc",
-        }
-
-        search_params = request.GET.get("query", None)
-        location_params = request.GET.get("location", "ALL")
-        venue_params = request.GET.get("venue", None)
-        onsale_params = request.GET.get("onsaleSoon", False)
-
-        if search_params:
-            request_params["keyword"] = search_params
-        if location_params != "ALL":
-            request_params["latlong"] = LOCATIONS[location_params]
-        if venue_params:
-            request_params["venueId"] = VENUES[venue_params]
-        if onsale_params:
-            today = datetime.today().strftime("%Y-%m-%dT00:00:00Z")
-            request_params["onsaleStartDateTime"] = today
-            request_params["startDateTime"] = today
-
-        response = requests.get(
-            f'{os.environ["TICKETMASTER_URL_BASE"]}/events',
-            params=request_params,
-            timeout=10,
-        ).json()
-
-        events = []
-        logger.info(
-            "total retrieved events: %s",
-            response.get("page", {}).get("totalElements", 0),
+        request_params, search_params, point, onsale_params = listing_request(
+            request.GET
         )
-        if "page" in response and response["page"]["totalElements"] > 0:
-            events = response["_embedded"]["events"]
-
-        return Response({"concerts": events}, status=200)
+        if servable_locally(search_params, point, onsale_params):
+            body = local_listing(request, request_params, search_params, point)
+            return Response(body, status=200)
+
+        response, is_stale = fetch_listing(request_params)
+        body, next_params = upstream_listing(request, request_params, response)
+        if next_params and settings.CONCERT_PREFETCH_NEXT_PAGE:
+            prefetch_listing(next_params)
+
+        headers = {STALE_HEADER: "true"} if is_stale else None
+        return Response(body, status=200, headers=headers)
+    except (InvalidCursor, geo.InvalidPoint) as e:
+        return Response({"error": str(e)}, status=400)
+    except UpstreamUnavailable:
+        return Response({"error": "Service temporarily unavailable"}, status=503)
     except Exception as e:
         logger.error("Concert fetch error: %s", str(e))
         return Response(
@@ -172,40 +281,54 @@ def unfavorite(request):
         return Response({"error": "Failed to favorite concert"}, status=500)
 
 
-@api_view(["GET"])
-@authentication_classes([CookieTokenAuthentication])
-@permission_classes([IsAuthenticated])
-def user_favorite_concerts(request):
-    """fetching all the concerts that users favorited"""
+def ndjson_events(request, event_ids):
+    """compacted events as newline-delimited JSON, one line per event as
+    soon as it is fetched, and an error line if fetching fails midway"""
+    fields = requested_fields(request)
     try:
-        fav_concerts = FavoriteConcert.objects.filter(user_id=request.user.id)
-        tm_concert_ids = Concert.objects.filter(
-            id__in=fav_concerts.values_list("concert_id")
-        ).values_list("concert_id", flat=True)
+        for event in iter_events(event_ids):
+            yield json.dumps(compact_event(event, fields)) + "\n"
+    except UpstreamUnavailable:
+        yield json.dumps({"error": "Service temporarily unavailable"}) + "\n"
+    except Exception as e:
+        logger.error("Unable to stream favorited concerts: %s", str(e))
+        yield json.dumps({"error": "Unable to fetch favorited concerts"}) + "\n"
 
-        fetched_concerts = []
-        for concert_id in tm_concert_ids:
-            request_params = {
-                "apikey": os.environ["TICKETMASTER_KEY"],
-                "id": concert_id,
-                "includeTest": "no",
-            }
 
-            response = requests.get(
-                f'{os.environ["TICKETMASTER_URL_BASE"]}/events',
-                params=request_params,
-                timeout=10,
-            ).json()
+def favorite_concert_ids(user):
+    """Ticketmaster ids of the concerts user favorited, skipping the ones
+    reap_concerts found dead"""
+    fav_concerts = FavoriteConcert.objects.filter(user_id=user.id)
+    return Concert.objects.filter(
+        id__in=fav_concerts.values_list("concert_id"), dead_at__isnull=True
+    ).values_list("concert_id", flat=True)
 
-            if "page" in response and "totalElements" in response["page"]:
-                if response["page"]["totalElements"] > 0:
-                    fetched_concerts.append(response["_embedded"]["events"][0])
-            else:
-                logger.error("unexpected response structure: %s", response)
 
-            time.sleep(0.2)
+@api_view(["GET"])
+@authentication_classes([CookieTokenAuthentication])
+@permission_classes([IsAuthenticated])
+@versioned_etag(favorite_events_version)
+def user_favorite_concerts(request):
+    """fetching all the concerts that users favorited, streamed one event per
+    line with `stream=ndjson`"""
+    try:
+        tm_concert_ids = favorite_concert_ids(request.user)
+        if request.GET.get("stream") == "ndjson":
+            # events arrive in cache-then-completion order, not favorite order
+            response = StreamingHttpResponse(
+                ndjson_events(request, list(tm_concert_ids)),
+                content_type="application/x-ndjson",
+            )
+            # keep reverse proxies from buffering the stream
+            response["X-Accel-Buffering"] = "no"
+            return response
 
-        return Response({"concerts": fetched_concerts}, status=200)
+        fetched_concerts = get_events(list(tm_concert_ids))
+        return Response(
+            {"concerts": compact_events(request, fetched_concerts)}, status=200
+        )
+    except UpstreamUnavailable:
+        return Response({"error": "Service temporarily unavailable"}, status=503)
     except Exception as e:
         logger.error("errors", e)
         return Response({"error": "Unable to fetch favorited concerts"}, status=500)
@@ -215,6 +338,7 @@ def user_favorite_concerts(request):
 @api_view(["GET"])
 @authentication_classes([CookieTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@versioned_etag(favorites_version)
 def user_favorite_concerts_by_id(request):
     """fetching all the concerts that users favorited"""
     try:
@@ -230,62 +354,33 @@ def user_favorite_concerts_by_id(request):
 @api_view(["GET"])
 @authentication_classes([CookieTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@versioned_etag(matchings_version)
 def matchings(request):
     """get all the matchings associated with user"""
     try:
-        user_matchings = []
-        current_user = request.user
-        fav_concerts = FavoriteConcert.objects.filter(user_id=current_user.id)
-        user_concerts = Concert.objects.filter(
-            id__in=fav_concerts.values_list("concert_id")
+        limit, after = page_params(request.query_params)
+        found, next_cursor = ranked_candidates(
+            request.user,
+            limit,
+            after,
+            precomputed=request_precomputed_at(request) is not None,
         )
-        all_other_users = User.objects.exclude(id=request.user.id)
-        for other_user in all_other_users:
-            other_fav_concerts = FavoriteConcert.objects.filter(user_id=other_user.id)
-            other_concerts = Concert.objects.filter(
-                id__in=other_fav_concerts.values_list("concert_id")
-            )
-            # get list of shared concerts
-            shared_concerts = user_concerts & other_concerts
-            if shared_concerts.exists():
-                preexsting_match = Matching.objects.filter(
-                    user=current_user, target=other_user
-                ).exclude(decision="UNKNOWN")
-                target_profile_photo = (
-                    UserProfile.objects.filter(user=other_user).first().profile_photo
-                )
-                target_name = (
-                    UserProfile.objects.filter(user=other_user).first().first_name
-                    + " "
-                    + UserProfile.objects.filter(user=other_user).first().last_name
-                )
-                target_faculty = (
-                    UserProfile.objects.filter(user=other_user).first().faculty
-                )
-                target_academic_term = (
-                    UserProfile.objects.filter(user=other_user).first().term
-                )
-                if not preexsting_match:
-                    matching, _created = Matching.objects.get_or_create(
-                        user=current_user, target=other_user, decision="UNKNOWN"
-                    )
-                    matching.matched_concerts.set(
-                        shared_concerts
-                    )  # link shared concerts
-                    user_matchings.append(
-                        {
-                            "id": matching.id,
-                            "username": matching.target.username,
-                            "profile_photo": target_profile_photo,
-                            "target_name": target_name,
-                            "target_faculty": target_faculty,
-                            "target_academic_term": target_academic_term,
-                            "concerts": list(
-                                shared_concerts.values_list("concert_id", flat=True)
-                            ),
-                        }
-                    )
-        return Response({"matchings": user_matchings}, status=200)
+        matching_ids = create_matchings(request.user, found)
+        user_matchings = [
+            {
+                "id": matching_ids[candidate["user_id"]],
+                "username": candidate["username"],
+                "profile_photo": candidate["profile_photo"],
+                "target_name": candidate["first_name"] + " " + candidate["last_name"],
+                "target_faculty": candidate["faculty"],
+                "target_academic_term": candidate["term"],
+                "concerts": candidate["concerts"],
+            }
+            for candidate in found
+        ]
+        return Response({"matchings": user_matchings, "next": next_cursor}, status=200)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=400)
     except Exception as e:
         return Response({"error": "Error fetching matchings"}, status=500)
 
@@ -300,15 +395,25 @@ def review_matching(request):
         matching_id = content.get("matchingId")
         if not matching_id:
             raise Exception()
-        matching = Matching.objects.get(
-            id=matching_id, user=request.user, decision="UNKNOWN"
-        )
         decision = content.get("decision")
-        if decision in dict(MATCHING_DECISIONS) and decision != "UNKNOWN":
+        if decision not in dict(MATCHING_DECISIONS) or decision == "UNKNOWN":
+            raise Exception()
+        target_id = Matching.objects.values_list("target_id", flat=True).get(
+            id=matching_id, user=request.user
+        )
+        with transaction.atomic():
+            # lock both directions in id order, so that two users saying yes
+            # to each other at once see each other's decision
+            pair = Matching.objects.select_for_update().filter(
+                Q(user=request.user, target_id=target_id)
+                | Q(user_id=target_id, target=request.user)
+            )
+            locked = {row.id: row for row in pair.order_by("id")}
+            matching = locked[int(matching_id)]
+            if matching.decision != "UNKNOWN":
+                raise Exception()
             matching.decision = decision
             matching.save()
-        else:
-            raise Exception()
 
         return Response({"message": "Matching processed successfully"}, status=200)
     except Exception:
@@ -318,26 +423,50 @@ def review_matching(request):
 @api_view(["GET"])
 @authentication_classes([CookieTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@versioned_etag(matches_version)
 def matches(request):
     """get all the matches for user"""
     try:
-        user_matches = Matching.objects.filter(
-            user=request.user, decision="YES"
-        ).values_list("target_id", flat=True)
-        other_matches = Matching.objects.filter(
-            user_id__in=user_matches, target=request.user, decision="YES"
+        mutual_matches = (
+            MutualMatch.objects.filter(user=request.user)
+            .select_related("other__profile", "matching")
+            .prefetch_related(
+                Prefetch(
+                    "matching__matched_concerts",
+                    queryset=Concert.objects.only("id", "concert_id"),
+                ),
+                "other__profile__favorite_artists",
+                "other__profile__favorite_genres",
+            )
+            .order_by("-matched_at", "other_id")
         )
+        since = request.query_params.get("since")
+        if since:
+            try:
+                # None when malformed, ValueError when well formed but invalid
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None:
+                return Response({"error": "Invalid since"}, status=400)
+            mutual_matches = mutual_matches.filter(matched_at__gt=since)
 
         other_matches_json = []
-        for match in other_matches:
-            concerts = match.matched_concerts.values_list("concert_id", flat=True)
-            target_user = match.user
-            target_profile = UserProfile.objects.filter(user=target_user).first()
+        for match in mutual_matches:
+            concerts = [
+                concert.concert_id for concert in match.matching.matched_concerts.all()
+            ]
+            target_user = match.other
+            target_profile = getattr(target_user, "profile", None)
 
             top_artists, top_genres = [], []
             if target_profile:
-                top_artists = list(target_profile.favorite_artists.all().values_list("name", flat=True))
-                top_genres = list(target_profile.favorite_genres.all().values_list("name", flat=True))
+                top_artists = [
+                    artist.name for artist in target_profile.favorite_artists.all()
+                ]
+                top_genres = [
+                    genre.name for genre in target_profile.favorite_genres.all()
+                ]
 
             other_matches_json.append(
                 {
@@ -356,7 +485,7 @@ def matches(request):
                     "target_academic_term": (
                         target_profile.term if target_profile else None
                     ),
-                    "concerts": list(concerts),
+                    "concerts": concerts,
                     "top_artists": top_artists,
                     "top_genres": top_genres,
                     "user_socials": (
@@ -364,6 +493,7 @@ def matches(request):
                         if target_profile and hasattr(target_profile, "user_socials")
                         else None
                     ),
+                    "matched_at": match.matched_at,
                 }
             )
 
@@ -0,0 +1,23 @@
+"""
+This module contains the views exposing operational metrics
+"""
+
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from .. import metrics
+from ..authentication import CookieTokenAuthentication
+
+
+@api_view(["GET"])
+@authentication_classes([CookieTokenAuthentication])
+@permission_classes([IsAdminUser])
+def upstream_metrics(request):
+    """Ticketmaster call, latency, retry and cache counters across workers,
+    with the running daily quota tally"""
+    return Response(metrics.snapshot(), status=200)
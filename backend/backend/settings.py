@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import json
 import os  # Add this at the top if not already present
 import sys
 from datetime import timedelta
@@ -51,12 +52,15 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # content-hash ETags and 304s for GET responses that don't set their own
+    "django.middleware.http.ConditionalGetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django_otp.middleware.OTPMiddleware",  # Add after AuthenticationMiddleware
     "django.contrib.messages.middleware.MessageMiddleware",
+    "api.metrics.ViewLabelMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -77,6 +81,7 @@ SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = "Lax"
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ["ETag", "X-Concerts-Stale"]
 
 ROOT_URLCONF = "backend.urls"
 
@@ -124,6 +129,89 @@ else:
         }
     }
 
+# The database cache is shared by all workers, which lets identical upstream
+# searches coalesce across processes. Run `python manage.py createcachetable`.
+if TESTING:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
+# Seconds a cached Ticketmaster event payload is served before it is refetched.
+TICKETMASTER_EVENT_CACHE_TTL = int(os.environ.get("TICKETMASTER_EVENT_CACHE_TTL", 900))
+# Seconds an event id Ticketmaster returned nothing for is not asked for again.
+TICKETMASTER_MISSING_EVENT_TTL = int(
+    os.environ.get("TICKETMASTER_MISSING_EVENT_TTL", 300)
+)
+# Upstream calls per second allowed by the Ticketmaster quota, shared by all threads.
+TICKETMASTER_RATE_LIMIT = float(os.environ.get("TICKETMASTER_RATE_LIMIT", 5))
+# Worker threads used to fan out event lookups.
+TICKETMASTER_MAX_WORKERS = int(os.environ.get("TICKETMASTER_MAX_WORKERS", 8))
+# Event ids looked up per multi-id request, at most one page: Ticketmaster caps
+# page size at 200 and ids past it would be taken as missing.
+TICKETMASTER_BATCH_SIZE = min(int(os.environ.get("TICKETMASTER_BATCH_SIZE", 20)), 200)
+# Per-request timeout, keep-alive pool size and retries for the shared session.
+TICKETMASTER_TIMEOUT = float(os.environ.get("TICKETMASTER_TIMEOUT", 10))
+TICKETMASTER_POOL_SIZE = int(os.environ.get("TICKETMASTER_POOL_SIZE", 16))
+TICKETMASTER_RETRIES = int(os.environ.get("TICKETMASTER_RETRIES", 2))
+# Ticketmaster calls allowed per day, reported by the metrics endpoint.
+TICKETMASTER_DAILY_QUOTA = int(os.environ.get("TICKETMASTER_DAILY_QUOTA", 5000))
+# Seconds between writes of each worker's metrics to the shared cache.
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 10))
+# Upstream connections each event loop may hold open for async views.
+TICKETMASTER_ASYNC_POOL_SIZE = int(os.environ.get("TICKETMASTER_ASYNC_POOL_SIZE", 200))
+# Consecutive failures that open the circuit, and seconds before it is retried.
+TICKETMASTER_BREAKER_THRESHOLD = int(
+    os.environ.get("TICKETMASTER_BREAKER_THRESHOLD", 5)
+)
+TICKETMASTER_BREAKER_RESET = float(os.environ.get("TICKETMASTER_BREAKER_RESET", 30))
+# Seconds a request waits on an identical in-flight search before calling itself.
+TICKETMASTER_COALESCE_WAIT = float(os.environ.get("TICKETMASTER_COALESCE_WAIT", 15))
+# Fetch the next page of a concert listing in the background and keep it warm.
+CONCERT_PREFETCH_NEXT_PAGE = not TESTING
+# Cached listings are fresh for FRESH_TTL seconds, served while revalidating in
+# the background until STALE_TTL, and kept as a fallback for upstream errors
+# until MAX_AGE.
+CONCERT_LISTING_FRESH_TTL = int(os.environ.get("CONCERT_LISTING_FRESH_TTL", 120))
+CONCERT_LISTING_STALE_TTL = int(os.environ.get("CONCERT_LISTING_STALE_TTL", 900))
+CONCERT_LISTING_MAX_AGE = int(os.environ.get("CONCERT_LISTING_MAX_AGE", 86400))
+# Answer keyword and location listings from the fetch_concerts mirror once it
+# has synced.
+CONCERT_LOCAL_SEARCH = os.environ.get("CONCERT_LOCAL_SEARCH", "True") == "True"
+# Seconds after its last sync a mirrored scope stops being served locally; rows
+# fetch_concerts has not seen since then are not served either.
+CONCERT_MIRROR_MAX_AGE = int(os.environ.get("CONCERT_MIRROR_MAX_AGE", 2 * 86400))
+# Named search areas (radius in km), mirrored by fetch_concerts. Override with
+# a JSON object in the CONCERT_LOCATIONS environment variable.
+CONCERT_LOCATIONS = json.loads(os.environ.get("CONCERT_LOCATIONS", "null")) or {
+    "KW": {"latitude": 43.449791, "longitude": -80.489090, "radius": 20},
+    "TO": {"latitude": 43.653225, "longitude": -79.383186, "radius": 20},
+}
+# Weights of the concert, artist and genre similarity in the score matchings
+# are ranked by. Override with a JSON object in MATCHING_WEIGHTS.
+MATCHING_WEIGHTS = json.loads(os.environ.get("MATCHING_WEIGHTS", "null")) or {
+    "concerts": 0.6,
+    "artists": 0.25,
+    "genres": 0.15,
+}
+# Similarity measure behind those scores, "jaccard" or "cosine".
+MATCHING_SIMILARITY = os.environ.get("MATCHING_SIMILARITY", "jaccard")
+# Seconds the candidates written by recompute_matchings are served for, as long
+# as the user changes no favorite; matchings are computed live after that. It
+# bounds how long favorite changes of their candidates go unseen.
+MATCHING_CANDIDATES_MAX_AGE = int(
+    os.environ.get("MATCHING_CANDIDATES_MAX_AGE", 36 * 3600)
+)
+# Best scored candidates recompute_matchings keeps for every user.
+MATCHING_CANDIDATES_PER_USER = int(os.environ.get("MATCHING_CANDIDATES_PER_USER", 200))
 # when testing, the default values are used.
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
@@ -22,4 +22,5 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/auth/", include("api.urls.auth_urls")),
     path("api/concerts/", include("api.urls.concert_urls")),
+    path("api/metrics/", include("api.urls.metrics_urls")),
 ]